@@ -73,6 +73,47 @@ int16_t esc_offset[4] = {0, -60, -0, -60};  // Each ESC correction value (FR, BL
 
 
 char buf[40];  byte idx = 0;
+
+// I2C read registers: the master selects one with a single-byte write (< 0x20),
+// then reads the block with Wire.onRequest
+#define REG_TELEMETRY 0x01       // pwm[4], roll, pitch, gyro x/y/z as int16, then micros() as uint32
+#define REG_PARAMS   0x10        // 0x10 + page : tunable parameter pages
+#define PARAM_PAGES  3
+#define PARAM_COUNT  20
+#define PARAMS_PER_PAGE 7
+#define REG_ACK      0x02        // command ack, selected by every command frame (see onFrame)
+#define REG_IMU      0x03        // raw IMU samples for the Pi's sensor fusion (see onRequest)
+volatile uint8_t tx_reg = 0;
+
+// Raw IMU ring, sampled from loop() at IMU_PERIOD_US and drained by the Pi in batches.
+// Units: accel in mg, gyro in 0.1 deg/s; t = micros() low 16 bits (the Pi unwraps it)
+#define IMU_PERIOD_US 4000       // 250 Hz
+#define IMU_RING     16
+#define IMU_BATCH    2           // [count][dropped] + 2 x 14 bytes fit the 32-byte Wire buffer
+struct ImuSample { uint16_t t; int16_t v[6]; };
+ImuSample imu_ring[IMU_RING];
+volatile uint8_t imu_head = 0, imu_tail = 0, imu_dropped = 0;
+unsigned long imu_next = 0;
+
+// Command frames: [kind][command id][offset][payload], one per write (Wire buffer: 32 bytes).
+// The Pi reads the ack block in the same transaction (repeated start), so a lost or
+// rejected command is known right away. Longer commands arrive in several chunks.
+#define FRAME_MORE   0x02        // chunk, more follow
+#define FRAME_FINAL  0x03        // last (or only) chunk
+enum : uint8_t { ACK_QUEUED = 1, ACK_KILLED, ACK_CHUNK, ACK_DUPLICATE,
+                 ACK_QUEUE_FULL, ACK_TOO_LONG, ACK_BAD_FRAME };
+uint8_t ack_id = 0, ack_status = 0;
+uint8_t frame_id = 0;            // command being assembled in buf
+uint8_t done_id = 0;             // last command queued or applied: its retried final frame is not run twice
+bool frame_overflow = false;
+
+// Commands received over I2C are applied from loop(), so a blocking ramp never
+// runs inside the Wire callback. ESTOP/EMERGENCY bypass the queue (see onReceive).
+#define CMD_QUEUE_LEN 4
+char cmd_queue[CMD_QUEUE_LEN][40];
+volatile byte cmd_head = 0, cmd_tail = 0;
+volatile bool estop_latched = false;   // set by a kill, aborts ramps until loop() settles it
+volatile uint8_t kill_count = 0;       // bumped by every kill, so loop() sees one that raced a command
 bool landing = false;            // STOP 1 becomes true
 uint16_t pwm[4] = {ESC_MIN, ESC_MIN, ESC_MIN, ESC_MIN}; // Always keep current values
 
@@ -137,6 +178,35 @@ void readIMU() {
   yaw_rate = gz;    // For compatibility
 }
 
+/* ---------- Raw IMU sampling for the Pi ---------- */
+void sampleIMU() {
+  unsigned long now = micros();
+  if ((long)(now - imu_next) < 0) return;
+  imu_next += IMU_PERIOD_US;
+  // after a blocking ramp, restart the schedule instead of sampling a burst
+  if ((long)(now - imu_next) > 0) imu_next = now + IMU_PERIOD_US;
+
+  ImuSample s;
+  s.t = (uint16_t)now;
+  s.v[0] = (int16_t)constrain(imu.readFloatAccelX() * 1000.0, -32767, 32767);
+  s.v[1] = (int16_t)constrain(imu.readFloatAccelY() * 1000.0, -32767, 32767);
+  s.v[2] = (int16_t)constrain(imu.readFloatAccelZ() * 1000.0, -32767, 32767);
+  s.v[3] = (int16_t)constrain(imu.readFloatGyroX() * 10.0, -32767, 32767);
+  s.v[4] = (int16_t)constrain(imu.readFloatGyroY() * 10.0, -32767, 32767);
+  s.v[5] = (int16_t)constrain(imu.readFloatGyroZ() * 10.0, -32767, 32767);
+
+  noInterrupts();
+  uint8_t next = (imu_head + 1) % IMU_RING;
+  if (next == imu_tail) {
+    // the Pi is not reading: overwrite the oldest sample
+    imu_tail = (imu_tail + 1) % IMU_RING;
+    if (imu_dropped < 255) imu_dropped++;
+  }
+  imu_ring[imu_head] = s;
+  imu_head = next;
+  interrupts();
+}
+
 /* ---------- PID calculation (correct implementation) ---------- */
 float calculatePID(PIDController* pid, float input, float gyro_rate, float dt) {
   float error = pid->setpoint - input;
@@ -252,6 +322,11 @@ void writeNow() {
  bool shouldPrint = pid_enabled && (millis() - lastWriteDebug > 1000);
  if (shouldPrint) lastWriteDebug = millis();
  
+ // A kill overrides whatever the current command computed
+ if (estop_latched) {
+   for (byte i = 0; i < 4; i++) pwm[i] = ESC_MIN - esc_offset[i];
+ }
+
  for (byte i = 0; i < 4; i++) {
    uint16_t pw = constrain(pwm[i] + esc_offset[i], ESC_MIN, ESC_MAX);
    esc[i].writeMicroseconds(pw);
@@ -280,6 +355,7 @@ void stopAll() {
 void rampTo(uint16_t tgt) {
  bool done = false;
  while (!done) {
+   if (estop_latched) return;   // killed while ramping
    done = true;
    for (byte i = 0; i < 4; i++) {
      if (pwm[i] < tgt) {
@@ -298,12 +374,13 @@ void rampTo(uint16_t tgt) {
 
 /* ---------- Apply command ---------- */
 void applyCmd(const char *cmd) {
-
+ if (estop_latched) return;   // killed after loop() took this command off the queue
 
  /* RUN ---------------------------------------------------------------- */
  if (!strcmp(cmd, "RUN")) {
    base_throttle = HOVER_THR;   // Set base thrust
    rampTo(HOVER_THR);          // current value to 1450 µs  smoothly
+   if (estop_latched) return;
    landing = false;
    pid_enabled = true;         // Begin PID control
    last_pid_time = millis();
@@ -321,6 +398,7 @@ void applyCmd(const char *cmd) {
    yaw_pid.setpoint = 0.0;
    if (!landing) {             // 1st time: maintain with descent thrust
      rampTo(LAND_THR);
+     if (estop_latched) return;
      landing = true;
    } else {                    // 2nd time: complete stop
      stopAll();
@@ -649,15 +727,214 @@ else if (!strcmp(cmd,"TEST0")) {
 }
 
 
+/* ---------- Parameter snapshot (read back by the Pi) ---------- */
+// Order must match PARAM_FIELDS in drone_ble_server.py
+void fillParams(float *p) {
+ p[0] = roll_pid.kp;  p[1] = roll_pid.ki;  p[2] = roll_pid.kd;
+ p[3] = pitch_pid.kp; p[4] = pitch_pid.ki; p[5] = pitch_pid.kd;
+ p[6] = yaw_pid.kp;   p[7] = yaw_pid.ki;   p[8] = yaw_pid.kd;
+ p[9] = angle_deadband;
+ p[10] = pid_scale_factor;
+ p[11] = min_correction;
+ p[12] = max_correction;
+ p[13] = min_motor_output;
+ p[14] = base_throttle;
+ for (byte i = 0; i < 4; i++) p[15 + i] = esc_offset[i];
+ p[19] = use_gyro_for_derivative ? 1.0 : 0.0;
+}
+
+
+/* ---------- Telemetry snapshot (streamed by the Pi) ---------- */
+// Order and units must match TELEMETRY_FIELDS in telemetry_codec.py:
+// PWM in us, angles in 0.1 deg, gyro rates in 0.1 deg/s
+void fillTelemetry(int16_t *t) {
+ for (byte i = 0; i < 4; i++) t[i] = pwm[i];
+ t[4] = (int16_t)constrain(roll_angle * 10.0, -1800, 1800);
+ t[5] = (int16_t)constrain(pitch_angle * 10.0, -1800, 1800);
+ t[6] = (int16_t)constrain(roll_gyro * 10.0, -8191, 8191);
+ t[7] = (int16_t)constrain(pitch_gyro * 10.0, -8191, 8191);
+ t[8] = (int16_t)constrain(yaw_gyro * 10.0, -8191, 8191);
+}
+
+
+/* ---------- I2C request ---------- */
+void onRequest() {
+ if (tx_reg == REG_TELEMETRY) {
+   // micros() is taken here so the Pi can bracket it with its own clock
+   uint32_t now = micros();
+   int16_t telemetry[9];
+   uint8_t out[sizeof(telemetry) + sizeof(now)];
+   fillTelemetry(telemetry);
+   memcpy(out, telemetry, sizeof(telemetry));
+   memcpy(out + sizeof(telemetry), &now, sizeof(now));
+   Wire.write(out, sizeof(out));
+   return;
+ }
+ if (tx_reg >= REG_PARAMS && tx_reg < REG_PARAMS + PARAM_PAGES) {
+   // Page layout: [page, count, count x float32 little endian]
+   float params[PARAM_COUNT];
+   fillParams(params);
+   byte page = tx_reg - REG_PARAMS;
+   byte first = page * PARAMS_PER_PAGE;
+   byte count = min(PARAMS_PER_PAGE, PARAM_COUNT - first);
+   uint8_t out[2 + PARAMS_PER_PAGE * sizeof(float)];
+   out[0] = page;
+   out[1] = count;
+   memcpy(out + 2, &params[first], count * sizeof(float));
+   Wire.write(out, 2 + count * sizeof(float));
+   return;
+ }
+ if (tx_reg == REG_IMU) {
+   // [count, samples dropped since the last read, count x ImuSample]
+   uint8_t out[2 + IMU_BATCH * sizeof(ImuSample)];
+   uint8_t count = 0;
+   while (count < IMU_BATCH && imu_tail != imu_head) {
+     memcpy(out + 2 + count * sizeof(ImuSample), &imu_ring[imu_tail], sizeof(ImuSample));
+     imu_tail = (imu_tail + 1) % IMU_RING;
+     count++;
+   }
+   out[0] = count;
+   out[1] = imu_dropped;
+   imu_dropped = 0;
+   Wire.write(out, 2 + count * sizeof(ImuSample));
+   return;
+ }
+ if (tx_reg == REG_ACK) {
+   // [command id, status, queued commands, flags: estop latched | pid on | landing, last taken id]
+   // A frame's ack read stops after 4 bytes; the Pi reads all 5 to resume its ids after a restart
+   uint8_t out[5];
+   out[0] = ack_id;
+   out[1] = ack_status;
+   out[2] = (cmd_head - cmd_tail + CMD_QUEUE_LEN) % CMD_QUEUE_LEN;
+   out[3] = (estop_latched ? 0x01 : 0) | (pid_enabled ? 0x02 : 0) | (landing ? 0x04 : 0);
+   out[4] = done_id;
+   Wire.write(out, sizeof(out));
+   return;
+ }
+ Wire.write((uint8_t)0);
+}
+
+
+/* ---------- Emergency stop (called from the Wire callback) ---------- */
+void killNow() {
+ estop_latched = true;
+ kill_count++;
+ pid_enabled = false;
+ cmd_head = cmd_tail;          // drop commands queued before the kill
+ stopAll();
+}
+
+
 /* ---------- I2C receive ---------- */
-void onReceive(int) {
+void onReceive(int n) {
+ // Single control byte: register select for the next read
+ if (n == 1) {
+   uint8_t c = Wire.read();
+   if (c < 32) {
+     tx_reg = c;
+     return;
+   }
+   if (c <= 126) {
+     buf[0] = c; buf[1] = '\0';
+     queueCmd(buf);
+   }
+   return;
+ }
+ uint8_t first = Wire.read();
+ if (first == FRAME_MORE || first == FRAME_FINAL) {
+   onFrame(first, n - 1);
+   return;
+ }
+ // Unframed write (register byte + text)
  idx = 0;
+ if (first >= 32 && first <= 126) buf[idx++] = first;
  while (Wire.available() && idx < sizeof(buf) - 1) {
    char c = Wire.read();
    if (c >= 32 && c <= 126) buf[idx++] = c;
  }
  buf[idx] = '\0';
- applyCmd(buf);
+
+ // Kill goes straight to the ESCs, ahead of any queued or running command
+ if (!strcmp(buf, "ESTOP") || !strcmp(buf, "EMERGENCY")) {
+   killNow();
+   return;
+ }
+ queueCmd(buf);
+}
+
+
+void onFrame(uint8_t kind, int n) {
+ tx_reg = REG_ACK;
+ if (n < 2) {
+   ack_id = 0; ack_status = ACK_BAD_FRAME;
+   return;
+ }
+ uint8_t id = Wire.read();
+ uint8_t offset = Wire.read();
+ n -= 2;
+ ack_id = id;
+ if (kind == FRAME_FINAL && offset != 0 && id == done_id) {
+   // the ack of this command was lost and the Pi retried its last chunk
+   while (Wire.available()) Wire.read();
+   ack_status = ACK_DUPLICATE;
+   return;
+ }
+ if (offset == 0) {
+   frame_id = id; idx = 0; frame_overflow = false;
+ } else if (id != frame_id || offset != idx) {
+   // a repeated chunk is already stored; anything else lost its start
+   bool repeated = id == frame_id && offset + n == idx;
+   while (Wire.available()) Wire.read();
+   ack_status = repeated ? ACK_CHUNK : ACK_BAD_FRAME;
+   return;
+ }
+ while (Wire.available()) {
+   char c = Wire.read();
+   if (idx < sizeof(buf) - 1) buf[idx++] = c;
+   else frame_overflow = true;
+ }
+ if (kind == FRAME_MORE) {
+   ack_status = frame_overflow ? ACK_TOO_LONG : ACK_CHUNK;
+   return;
+ }
+ if (frame_overflow) {
+   ack_status = ACK_TOO_LONG;
+   return;
+ }
+ // offsets count raw bytes, so non-printables are dropped only once the command is whole
+ byte len = 0;
+ for (byte i = 0; i < idx; i++) {
+   if (buf[i] >= 32 && buf[i] <= 126) buf[len++] = buf[i];
+ }
+ buf[len] = '\0';
+ idx = 0;
+ // A kill is idempotent: it runs even when its id looks like a retry
+ if (!strcmp(buf, "ESTOP") || !strcmp(buf, "EMERGENCY")) {
+   killNow();
+   done_id = id;
+   ack_status = ACK_KILLED;
+   return;
+ }
+ if (id == done_id) {
+   // retry of a single-frame command
+   ack_status = ACK_DUPLICATE;
+   return;
+ }
+ if (queueCmd(buf)) {
+   done_id = id;
+   ack_status = ACK_QUEUED;
+ } else {
+   ack_status = ACK_QUEUE_FULL;
+ }
+}
+
+
+bool queueCmd(const char *cmd) {
+ byte next = (cmd_head + 1) % CMD_QUEUE_LEN;
+ if (next == cmd_tail) return false;  // queue full: drop
+ strcpy(cmd_queue[cmd_head], cmd);
+ cmd_head = next;
+ return true;
 }
 
 
@@ -682,11 +959,36 @@ void setup() {
  delay(2000);                 // ESC arming
  Wire.begin(SLAVE_ADDR);
  Wire.onReceive(onReceive);
+ Wire.onRequest(onRequest);
 }
 
 
 /* ---------- LOOP ---------- */
 void loop() {
+  // Settle a kill: motors stay stopped until the next command
+  if (estop_latched) {
+    estop_latched = false;
+    landing = false;
+    Serial.println("EMERGENCY STOP!");
+  }
+
+  // Apply queued I2C commands
+  if (cmd_tail != cmd_head) {
+    char cmd[40];
+    noInterrupts();
+    strcpy(cmd, cmd_queue[cmd_tail]);
+    cmd_tail = (cmd_tail + 1) % CMD_QUEUE_LEN;
+    uint8_t kills = kill_count;
+    interrupts();
+    applyCmd(cmd);
+    // A kill while the command ran: it may have re-enabled PID or written the motors after killNow()
+    if (kill_count != kills) {
+      pid_enabled = false;
+      stopAll();
+    }
+  }
+
+  sampleIMU();         // raw samples for the Pi's sensor fusion
   applyPIDControl();  // PID control continuous execution
   delay(1);           // short delay
 }
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Controller latency benchmark (PC half of input-to-air)
+
+Runs a fixed workload against each transport and records, per message:
+  submit   : input (a direct DroneController call or a Tk button press) -> char_write called
+  complete : char_write called -> returned (gatttool accepted it, datagram sent, ...)
+  ack      : char_write called -> the bridge's ACK notification handled (tagged PID sets)
+  handler  : time spent in notification_handler, per status and per telemetry packet
+
+Drivers:
+  direct : the workload calls DroneController on one thread, as flight_script.py does
+  tk     : DroneControllerGUI runs and the workload invokes its buttons on the Tk
+           thread (needs a display), so the GUI's own dispatch is part of 'submit'
+
+Workload per round: a burst of direction commands at 50 Hz, one PID set (cycling
+roll/pitch/yaw, tagged and acked), and an emergency stop every ESTOP_EVERY rounds.
+Run it with the props off: on a real bridge the stops reach the motors.
+
+Results are log2 histograms (bucket = lower edge in us) with percentiles, in JSON
+for comparing controller changes (--compare an earlier file).
+
+    python3 bench_controller.py --transport sim --rounds 40 --json before.json
+    python3 bench_controller.py --transport sim --transport udp --port 9750 --compare before.json
+"""
+
+import argparse
+import collections
+import json
+import logging
+import threading
+import time
+
+from clock_sync import now_us
+from drone_controller_pygatt import (COMMAND_UUID, KILL_UUID, DroneControllerGUI, add_connection_args,
+                                     controller_from_args, tk)
+from telemetry_codec import is_telemetry
+
+DIRECTION_BURST = ("FWD", "FWD", "LEFT", "FWD", "RIGHT", "BACK", "UP", "DOWN")
+BURST_INTERVAL = 0.02       # seconds between the burst's commands
+ROUND_GAP = 0.1             # pause after each round's PID set
+ESTOP_EVERY = 10            # rounds
+PID_SETS = (("ROLL", (3.0, 0.0, 0.3)), ("PITCH", (3.0, 0.0, 1.2)), ("YAW", (0.0, 0.0, 0.0)))
+DRAIN = 0.5                 # seconds to wait for the last acks
+
+# Tk driver: the buttons the workload presses
+DIRECTION_BUTTONS = {"FWD": "Forward", "BACK": "Backward", "UP": "Up", "DOWN": "Down",
+                     "LEFT": "Left", "RIGHT": "Right"}
+PID_ROWS = {"ROLL": "Roll:", "PITCH": "Pitch:", "YAW": "Yaw:"}
+
+
+def workload(rounds):
+    """[(offset seconds, kind, command or (axis, gains))], the same for every run"""
+    steps = []
+    t = 0.0
+    for n in range(rounds):
+        for command in DIRECTION_BURST:
+            steps.append((t, "direction", command))
+            t += BURST_INTERVAL
+        steps.append((t, "pid", PID_SETS[n % len(PID_SETS)]))
+        t += ROUND_GAP
+        if (n + 1) % ESTOP_EVERY == 0:
+            steps.append((t, "estop", "ESTOP"))
+            t += ROUND_GAP
+    return steps
+
+
+def pid_command(axis, gains):
+    return f"PID_{axis} {gains[0]} {gains[1]} {gains[2]}"
+
+
+def histogram(values):
+    """Percentiles plus [lower edge us, count] log2 buckets (the first also holds < 1 us)"""
+    if not values:
+        return {}
+    buckets = collections.Counter(max(0, int(v).bit_length() - 1) for v in values)
+    values = sorted(values)
+    n = len(values)
+    return {"n": n, "mean": sum(values) / n, "p50": values[n // 2], "p90": values[int(n * 0.9)],
+            "p99": values[min(n - 1, int(n * 0.99))], "max": values[-1],
+            "buckets_us": [[1 << i, buckets[i]] for i in sorted(buckets)]}
+
+
+class Probe:
+    """
+    Timestamps around the controller: inputs registered by the driver are matched to
+    the char_write that carries them (by command text, in order); tagged writes are
+    matched to their ACK; the notification handler is timed per call.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.inputs = collections.defaultdict(collections.deque)   # command -> [(kind, input us)]
+        self.tags = {}                                              # tag -> (kind, char_write us)
+        self.submit = collections.defaultdict(list)
+        self.complete = collections.defaultdict(list)
+        self.ack = collections.defaultdict(list)
+        self.handler = collections.defaultdict(list)
+        self.unmatched_writes = 0   # heartbeats, clock sync, parameter reads
+
+    def input(self, kind, command):
+        with self.lock:
+            self.inputs[command].append((kind, now_us()))
+
+    def wrap_handler(self, controller):
+        """Before connect_to_device(): the device subscribes controller.notification_handler"""
+        handler = controller.notification_handler
+
+        def timed(handle, data):
+            started = time.perf_counter_ns()
+            handler(handle, data)
+            elapsed = (time.perf_counter_ns() - started) / 1000.0
+            if is_telemetry(data):
+                self.handler["telemetry"].append(elapsed)
+                return
+            self.handler["status"].append(elapsed)
+            if data.startswith(b"ACK:"):
+                with self.lock:
+                    sent = self.tags.pop(bytes(data).split(b":")[1].decode(), None)
+                if sent:
+                    self.ack[sent[0]].append(now_us() - sent[1])
+
+        controller.notification_handler = timed
+
+    def wrap_device(self, device):
+        """After connect_to_device(): time every write"""
+        char_write = device.char_write
+
+        def timed(uuid, value, wait_for_response=False):
+            started = now_us()
+            try:
+                return char_write(uuid, value, wait_for_response)
+            finally:
+                self._written(uuid, bytes(value), started, now_us())
+
+        device.char_write = timed
+
+    def _written(self, uuid, value, started, finished):
+        tag = None
+        if uuid == KILL_UUID:
+            command = "ESTOP"
+        elif uuid == COMMAND_UUID:
+            command = value.decode("utf-8", "replace")
+            if command.startswith("#"):
+                tag, _, command = command[1:].partition(" ")
+        else:
+            return
+        with self.lock:
+            pending = self.inputs.get(command)
+            if not pending:
+                self.unmatched_writes += 1
+                return
+            kind, input_us = pending.popleft()
+            if tag is not None:
+                self.tags[tag] = (kind, started)
+        self.submit[kind].append(started - input_us)
+        self.complete[kind].append(finished - started)
+
+    def results(self):
+        return {
+            "submit_us": {kind: histogram(v) for kind, v in self.submit.items()},
+            "complete_us": {kind: histogram(v) for kind, v in self.complete.items()},
+            "ack_us": {kind: histogram(v) for kind, v in self.ack.items()},
+            "handler_us": {kind: histogram(v) for kind, v in self.handler.items()},
+            "unacked": len(self.tags),
+            "unmatched_inputs": sum(len(q) for q in self.inputs.values()),
+            "unmatched_writes": self.unmatched_writes,
+        }
+
+
+def sleep_until(due):
+    delay = due - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+
+
+def run_direct(controller, probe, steps):
+    started = time.monotonic()
+    for offset, kind, command in steps:
+        sleep_until(started + offset)
+        if kind == "direction":
+            probe.input(kind, command)
+            controller.send_command(command)
+        elif kind == "pid":
+            command = pid_command(*command)
+            probe.input(kind, command)
+            controller.send_tracked(command)
+        else:
+            probe.input(kind, command)
+            controller.send_emergency_stop()
+    time.sleep(DRAIN)
+
+
+def find_button(widget, text, row_label=None):
+    """ttk.Button with `text`, in the frame that also holds a label `row_label` if given"""
+    children = widget.winfo_children()
+    if row_label is None or any(c.winfo_class() == "TLabel" and c.cget("text") == row_label
+                                for c in children):
+        for child in children:
+            if child.winfo_class() == "TButton" and child.cget("text") == text:
+                return child
+    for child in children:
+        found = find_button(child, text, row_label)
+        if found is not None:
+            return found
+    return None
+
+
+def run_tk(controller, probe, steps):
+    """Press the GUI's buttons from Tk timers; the GUI does the rest as for a user"""
+    app = DroneControllerGUI(controller)
+    app.show_connection_state()
+    root = app.root
+    buttons = {command: find_button(root, text) for command, text in DIRECTION_BUTTONS.items()}
+    buttons["ESTOP"] = find_button(root, "Emergency Stop")
+    for axis, label in PID_ROWS.items():
+        buttons[axis] = find_button(root, "Set", label)
+    missing = [name for name, button in buttons.items() if button is None]
+    if missing:
+        raise SystemExit(f"FAIL: GUI buttons not found: {missing}")
+
+    def press(kind, command):
+        if kind == "pid":
+            axis, gains = command
+            prefix = axis.lower()
+            for gain, value in zip(("kp", "ki", "kd"), gains):
+                getattr(app, f"{prefix}_{gain}").set(value)
+            # the entries hold what the GUI will format, e.g. 3.0
+            probe.input(kind, pid_command(axis, [getattr(app, f"{prefix}_{g}").get() for g in ("kp", "ki", "kd")]))
+            buttons[axis].invoke()
+        else:
+            probe.input(kind, command)
+            buttons[command].invoke()
+
+    for offset, kind, command in steps:
+        root.after(int(offset * 1000), press, kind, command)
+    root.after(int((steps[-1][0] + DRAIN) * 1000), root.quit)
+    root.mainloop()
+    root.destroy()
+
+
+def run(args, transport, driver, steps):
+    run_args = argparse.Namespace(**vars(args))
+    run_args.transport = transport
+    controller = controller_from_args(run_args)
+    if controller is None:
+        return None
+    if controller.simulation:
+        controller.simulation = controller.simulation._replace(seed=1)
+    probe = Probe()
+    probe.wrap_handler(controller)
+    if not controller.connect_to_device():
+        print(f"{transport}: could not connect, skipped")
+        return None
+    probe.wrap_device(controller.device)
+    started = time.monotonic()
+    try:
+        (run_tk if driver == "tk" else run_direct)(controller, probe, steps)
+    finally:
+        controller.disconnect()
+    result = {"transport": transport, "driver": driver, "seconds": time.monotonic() - started}
+    result.update(probe.results())
+    return result
+
+
+def row(name, h):
+    return (f"    {name:<18} n {h['n']:5d}  p50 {h['p50'] / 1000:8.3f} ms  p90 {h['p90'] / 1000:8.3f} ms  "
+            f"p99 {h['p99'] / 1000:8.3f} ms  max {h['max'] / 1000:8.3f} ms")
+
+
+def print_result(r, baseline=None):
+    print(f"{r['transport']} / {r['driver']}: {r['seconds']:.1f} s, {r['unacked']} PID sets unacked, "
+          f"{r['unmatched_inputs']} inputs never written")
+    for metric in ("submit_us", "complete_us", "ack_us", "handler_us"):
+        for kind, h in sorted(r[metric].items()):
+            if not h:
+                continue
+            line = row(f"{metric[:-3]} {kind}", h)
+            old = (baseline or {}).get(metric, {}).get(kind)
+            if old:
+                line += f"  (p50 {h['p50'] - old['p50']:+.0f} us, p99 {h['p99'] - old['p99']:+.0f} us)"
+            print(line)
+
+
+def main():
+    # --transport may be repeated here, so it replaces the single-choice option
+    parser = argparse.ArgumentParser(description="PC controller latency benchmark", conflict_handler="resolve")
+    add_connection_args(parser)
+    parser.add_argument("--transport", action="append", choices=("ble", "udp", "ws", "sim"),
+                        help="may be repeated (default: sim)")
+    parser.add_argument("--driver", action="append", choices=("direct", "tk"),
+                        help="may be repeated (default: direct, plus tk when a display is available)")
+    parser.add_argument("--rounds", type=int, default=30, help="workload rounds (burst + PID set)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="earlier --json file; prints p50/p99 differences")
+    args = parser.parse_args()
+
+    # per-command INFO logging would be part of every measurement
+    logging.getLogger("drone_controller_pygatt").setLevel(logging.WARNING)
+    logging.getLogger("fleet").setLevel(logging.WARNING)
+
+    drivers = args.driver
+    if drivers is None:
+        drivers = ["direct"]
+        if tk is not None:
+            try:
+                tk.Tk().destroy()
+                drivers.append("tk")
+            except tk.TclError as e:
+                print(f"No display ({e}); tk driver skipped")
+
+    steps = workload(args.rounds)
+    counts = collections.Counter(kind for _, kind, _ in steps)
+    print(f"workload: {len(steps)} inputs over {steps[-1][0]:.1f} s ({dict(counts)})")
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(r["transport"], r["driver"]): r for r in json.load(f)["runs"]}
+
+    runs = []
+    for transport in args.transport or ["sim"]:
+        for driver in drivers:
+            result = run(args, transport, driver, steps)
+            if result:
+                runs.append(result)
+                print_result(result, baseline.get((transport, driver)))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"workload": {"rounds": args.rounds, "inputs": dict(counts)}, "runs": runs}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
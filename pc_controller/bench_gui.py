@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Controller and GUI load benchmark on the simulated bridge
+
+Connects DroneController to sim_device.SimulatedDevice and, for each telemetry
+rate, runs for a fixed time:
+  sender : a thread sending commands as fast as the controller accepts them
+           (or at --send-rate); calls per second and time per send_command()
+  probe  : a tagged command every 20 ms, time until its ACK comes back
+  tk     : with a display, the full DroneControllerGUI runs alongside. A worker
+           thread posts root.after(0, ...) every 5 ms, the path every background
+           result takes into the GUI, and a 10 ms Tk timer measures how late it fires
+
+    python3 bench_gui.py --telemetry-hz 200 --telemetry-hz 800 --loss 0.02 --json gui.json
+"""
+
+import argparse
+import json
+import logging
+import threading
+import time
+
+from clock_sync import now_us
+from drone_controller_pygatt import DroneController, DroneControllerGUI, tk
+from sim_device import SimConfig
+
+PROBE_INTERVAL = 0.02
+TK_POST_INTERVAL = 0.005
+TK_TIMER_MS = 10
+
+
+def summarize(values):
+    if not values:
+        return {}
+    values = sorted(values)
+    n = len(values)
+    return {"n": n, "mean": sum(values) / n, "p50": values[n // 2],
+            "p99": values[min(n - 1, int(n * 0.99))], "max": values[-1]}
+
+
+def sender(controller, stop, send_rate, calls):
+    interval = 1.0 / send_rate if send_rate else 0.0
+    next_send = time.monotonic()
+    while not stop.is_set():
+        if interval:
+            next_send += interval
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        started = now_us()
+        controller.send_command("FWD")
+        calls.append(now_us() - started)
+
+
+def prober(controller, stop, rtts, lost):
+    n = 0
+    while not stop.wait(PROBE_INTERVAL):
+        n += 1
+        waiter = controller.expect((f"ACK:p{n}:",))
+        sent = now_us()
+        if not controller.send_raw(f"#p{n} STATUS".encode()):
+            lost.append(n)
+            continue
+        reply = controller.wait_reply(waiter, timeout=0.5)
+        if reply is None:
+            lost.append(n)
+        else:
+            rtts.append(reply[1] - sent)
+
+
+def run_gui(controller, seconds, results):
+    """Run the GUI for `seconds` on this thread while probing Tk latency"""
+    app = DroneControllerGUI(controller)
+    app.show_connection_state()
+    root = app.root
+    posts, timer_late = [], []
+    stop = threading.Event()
+
+    def posted(sent):
+        posts.append(now_us() - sent)
+
+    def poster():
+        while not stop.wait(TK_POST_INTERVAL):
+            root.after(0, posted, now_us())
+
+    def timer(expected):
+        timer_late.append(now_us() - expected)
+        root.after(TK_TIMER_MS, timer, now_us() + TK_TIMER_MS * 1000)
+
+    threading.Thread(target=poster, daemon=True).start()
+    root.after(TK_TIMER_MS, timer, now_us() + TK_TIMER_MS * 1000)
+    root.after(int(seconds * 1000), root.quit)
+    root.mainloop()
+    stop.set()
+    root.destroy()
+    results["tk_post_us"] = summarize(posts)
+    results["tk_timer_late_us"] = summarize(timer_late)
+
+
+def run(config, args, gui):
+    controller = DroneController("sim", simulation=config)
+    if not controller.connect_to_device():
+        raise SystemExit("FAIL: could not connect to the simulated device")
+    stop = threading.Event()
+    calls, rtts, lost = [], [], []
+    threads = [threading.Thread(target=sender, args=(controller, stop, args.send_rate, calls), daemon=True),
+               threading.Thread(target=prober, args=(controller, stop, rtts, lost), daemon=True)]
+    for thread in threads:
+        thread.start()
+    started = time.monotonic()
+    results = {"telemetry_hz": config.telemetry_hz}
+    if gui:
+        run_gui(controller, args.seconds, results)
+    else:
+        time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    device = controller.device
+    controller.disconnect()
+
+    decoder = controller.telemetry_decoder
+    results.update({
+        "sends_per_s": len(calls) / elapsed,
+        "send_call_us": summarize(calls),
+        "ack_rtt_us": summarize(rtts),
+        "probes_lost": len(lost),
+        "notifications_per_s": device.stats["notifications"] / elapsed,
+        "telemetry_samples": decoder.samples,
+        "telemetry_packets_lost": decoder.lost_packets,
+        "device": dict(device.stats),
+    })
+    return results
+
+
+def print_results(r):
+    print(f"telemetry {r['telemetry_hz']:g} Hz: {r['notifications_per_s']:.0f} notifications/s, "
+          f"{r['telemetry_samples']} samples decoded, {r['telemetry_packets_lost']} packets lost")
+    s = r["send_call_us"]
+    print(f"  sender  {r['sends_per_s']:8.0f} sends/s  send_command mean {s['mean']:.0f} us, "
+          f"p99 {s['p99']:.0f} us")
+    s = r["ack_rtt_us"]
+    if s:
+        print(f"  probe   ack RTT p50 {s['p50'] / 1000:.2f} ms, p99 {s['p99'] / 1000:.2f} ms, "
+              f"{r['probes_lost']} lost")
+    for key, label in (("tk_post_us", "tk post "), ("tk_timer_late_us", "tk timer")):
+        s = r.get(key)
+        if s:
+            print(f"  {label} p50 {s['p50'] / 1000:.2f} ms, p99 {s['p99'] / 1000:.2f} ms, "
+                  f"max {s['max'] / 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DroneController/GUI load on the simulated bridge")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--telemetry-hz", type=float, action="append",
+                        help="may be repeated (default: 200 500 1000)")
+    parser.add_argument("--latency-ms", type=float, default=8.0)
+    parser.add_argument("--jitter-ms", type=float, default=4.0)
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--submit-us", type=float, default=200.0, help="time one char_write blocks")
+    parser.add_argument("--send-rate", type=float, default=0.0, help="sender commands/s (0 = flat out)")
+    parser.add_argument("--no-gui", action="store_true", help="skip the Tk measurements")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    # per-command INFO logging would dominate the sender numbers
+    logging.getLogger("drone_controller_pygatt").setLevel(logging.WARNING)
+    logging.getLogger("fleet").setLevel(logging.WARNING)
+    gui = not args.no_gui and tk is not None
+    if gui:
+        try:
+            tk.Tk().destroy()
+        except tk.TclError as e:
+            print(f"No display ({e}); Tk measurements skipped")
+            gui = False
+
+    results = []
+    for rate in args.telemetry_hz or [200.0, 500.0, 1000.0]:
+        config = SimConfig(latency=args.latency_ms / 1000.0, jitter=args.jitter_ms / 1000.0,
+                           submit_cost=args.submit_us / 1e6, loss=args.loss, notify_loss=args.loss,
+                           telemetry_hz=rate, seed=1)
+        results.append(run(config, args, gui))
+        print_results(results[-1])
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Telemetry decoding benchmark (PC side)
+
+Feeds encoded telemetry packets through DroneController.notification_handler,
+the same path the pygatt/network notification threads use, and reports the
+decode cost per sample and per notification. Packets are produced with the
+bridge's codec from a synthetic trace, so no bridge or adapter is needed.
+
+    python3 bench_telemetry.py --samples 50000 --payload 244
+"""
+
+import argparse
+import collections
+import logging
+import math
+import random
+import time
+
+from drone_controller_pygatt import DroneController
+from telemetry_codec import TelemetryEncoder, clamp_sample
+
+
+def packets_for(count, payload, period):
+    rng = random.Random(1)
+    encoder = TelemetryEncoder(max_payload=payload)
+    packets = []
+    for i in range(count):
+        t = i * period
+        roll = 40 * math.sin(2 * math.pi * 0.7 * t) + rng.gauss(0, 4)
+        pitch = 30 * math.sin(2 * math.pi * 0.5 * t + 1) + rng.gauss(0, 4)
+        pwm = [1250 - 0.5 * roll, 1250 + 0.5 * roll, 1250 - 0.5 * roll, 1250 + 0.5 * roll]
+        sample = clamp_sample(pwm + [roll, pitch] + [rng.gauss(0, 15) for _ in range(3)])
+        packets.extend(encoder.add(sample, t))
+    tail = encoder.flush()
+    if tail:
+        packets.append(tail)
+    return packets
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Telemetry decode cost in the controller")
+    parser.add_argument("--samples", type=int, default=50000)
+    parser.add_argument("--period-ms", type=float, default=20.0)
+    parser.add_argument("--payload", type=int, action="append",
+                        help="notification payload, may be repeated (default: 20 244)")
+    args = parser.parse_args()
+
+    logging.getLogger("drone_controller_pygatt").setLevel(logging.WARNING)
+    for payload in args.payload or [20, 244]:
+        packets = [bytearray(p) for p in packets_for(args.samples, payload, args.period_ms / 1000.0)]
+        controller = DroneController()
+        controller.telemetry = collections.deque(maxlen=args.samples)
+
+        started = time.perf_counter()
+        for packet in packets:
+            controller.notification_handler(None, packet)
+        elapsed = time.perf_counter() - started
+
+        decoded = len(controller.telemetry)
+        if decoded != args.samples:
+            raise SystemExit(f"FAIL: decoded {decoded} of {args.samples} samples")
+        print(f"payload {payload:3d}: {len(packets)} notifications, "
+              f"{elapsed / decoded * 1e6:5.2f} us/sample, {elapsed / len(packets) * 1e6:6.2f} us/notification")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+#!/usr/bin/env python3
+"""
+Clock offset and drift estimation: the bridge's rasberry_pi/clock_sync.py, loaded
+from there so both ends of a timestamp exchange run the same code
+"""
+
+import os
+
+_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "rasberry_pi", "clock_sync.py")
+with open(_SOURCE) as _file:
+    exec(compile(_file.read(), _SOURCE, "exec"))
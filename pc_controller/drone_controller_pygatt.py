@@ -4,13 +4,30 @@ Drone Controller - pygatt version
 Uses gatttool as backend
 """
 
+import argparse
+import collections
+import itertools
 import logging
 import queue
+import time
+import zlib
 import threading
-import tkinter as tk
-from tkinter import messagebox, ttk
 
-import pygatt
+try:
+    import tkinter as tk
+    from tkinter import ttk
+except ImportError:
+    tk = None  # headless use (flight_script.py) does not need the GUI
+
+try:
+    import pygatt
+except ImportError:
+    pygatt = None
+
+from clock_sync import ClockEstimator, exchange_sample, now_us
+from fleet import FleetManager, scan
+from network_devices import DEFAULT_UDP_PORT, DEFAULT_WS_PORT, UdpDevice, WebSocketDevice
+from telemetry_codec import KEYFRAME, KIND_MASK, TELEMETRY_FIELDS, TelemetryDecoder, is_telemetry
 
 # Log settings
 logging.basicConfig(level=logging.INFO)
@@ -20,34 +37,207 @@ logger = logging.getLogger(__name__)
 DEVICE_ADDRESS = "2C:CF:67:F5:0B:E0"
 COMMAND_UUID = "6e400002-b5a3-f393-e0a9-e50e24dcca9e"
 STATUS_UUID = "6e400003-b5a3-f393-e0a9-e50e24dcca9e"
+PARAMS_UUID = "6e400004-b5a3-f393-e0a9-e50e24dcca9e"
+KILL_UUID = "6e400005-b5a3-f393-e0a9-e50e24dcca9e"  # any write = emergency stop
+MISSION_UUID = "6e400006-b5a3-f393-e0a9-e50e24dcca9e"  # onboard mission upload
+TELEMETRY_UUID = "6e400007-b5a3-f393-e0a9-e50e24dcca9e"  # binary telemetry, apart from the statuses
+
+# Network transports: kill and parameter reads become in-band commands
+NETWORK_WRITE_OVERRIDES = {KILL_UUID: b"ESTOP"}
+NETWORK_WRITE_PREFIXES = {MISSION_UUID: b"MDATA "}
+NETWORK_READ_REQUESTS = {PARAMS_UUID: (b"PARAMS", b"PARAMS:")}
+TRANSPORTS = ("ble", "udp", "ws", "sim")
+
+# Link-loss failsafe on the bridge: it lands the drone if heartbeats stop
+HEARTBEAT_COMMAND = "HB"
+HEARTBEAT_INTERVAL = 0.5  # seconds (bridge timeout is 1.5 s)
+CLOCK_SYNC_INTERVAL = 1.0  # seconds; a TSYNC ping also counts as a heartbeat
+
+# Backpressure: the bridge rate-limits each client per command class and answers
+# 'BP:<class>:<commands per second>:<retry ms>' when a class is over its limit
+BACKPRESSURE_PREFIX = "BP:"
+SAFETY_COMMANDS = {"STOP", "ESTOP", "EMERGENCY", "HB"}     # same classes as the bridge
+CONFIG_PREFIXES = ("SET", "PID_", "OFFSET", "D_GYRO", "D_ERROR", "STATUS")
+BACKPRESSURE_MARGIN = 1.2     # send interval = margin / advertised rate
+BACKPRESSURE_RECOVERY = 2.0   # every this many seconds without BP the rate creeps back up
+RECOVERY_FACTOR = 0.9         # interval multiplier per recovery step
+MIN_SEND_INTERVAL = 0.002     # below this pacing is switched off
+
+# Telemetry
+BLE_MTU = 247             # requested on connect; the bridge packs more samples per notification
+TELEMETRY_HISTORY = 500   # decoded samples kept for the GUI
+
+# Onboard missions
+MISSION_CHUNK = 18        # data bytes per mission write at ATT MTU 23 (20 - 2 offset bytes)
+NETWORK_MISSION_CHUNK = 1024
+REPLY_TIMEOUT = 3.0       # seconds to wait for a bridge reply
+
+# GUI: parameter fields show the state of their last update, from the tagged command's ACK/NAK
+FIELD_STYLES = {None: "TEntry", "pending": "Pending.TEntry", "applied": "Applied.TEntry",
+                "failed": "Failed.TEntry"}
+ACTIVITY_LOG_LINES = 200
+
+# Tunable parameters as mirrored by the Pi bridge (same order and names as
+# PARAM_FIELDS in drone_ble_server.py) and the firmware's power-on values
+PARAM_FIELDS = (
+    "roll_kp", "roll_ki", "roll_kd",
+    "pitch_kp", "pitch_ki", "pitch_kd",
+    "yaw_kp", "yaw_ki", "yaw_kd",
+    "deadband", "scale",
+    "min_corr", "max_corr", "min_out", "base_thr",
+    "offset0", "offset1", "offset2", "offset3",
+    "d_gyro",
+)
+PARAM_DEFAULTS = {
+    "roll_kp": 3.0, "roll_ki": 0.0, "roll_kd": 0.3,
+    "pitch_kp": 3.0, "pitch_ki": 0.0, "pitch_kd": 1.2,
+    "yaw_kp": 0.0, "yaw_ki": 0.0, "yaw_kd": 0.0,
+    "deadband": 0.5, "scale": 0.5,
+    "min_corr": 5, "max_corr": 100, "min_out": 50, "base_thr": 1250,
+    "offset0": 0, "offset1": -60, "offset2": 0, "offset3": -60,
+    "d_gyro": 1,
+}
+# Single-value parameters and the command that sets them. Limits come
+# before base_thr because the firmware clamps base_thr against them.
+PARAM_COMMANDS = (
+    ("deadband", "SET_DEADBAND"),
+    ("scale", "SET_SCALE"),
+    ("min_corr", "SET_MIN_CORR"),
+    ("max_corr", "SET_MAX_CORR"),
+    ("min_out", "SET_MIN_OUT"),
+    ("base_thr", "SET_BASE_THR"),
+)
+
+
+def command_class(command):
+    name = command.split(maxsplit=1)[0] if command else ""
+    if name in SAFETY_COMMANDS:
+        return "safety"
+    if name.startswith(CONFIG_PREFIXES):
+        return "config"
+    return "control"
+
+
+def parse_parameter_mirror(text):
+    """Parse 'v=<version>;h=<crc32>;name=value;...' into (version, digest, values)"""
+    version, digest, values = None, None, {}
+    for item in text.strip().split(";"):
+        if "=" not in item:
+            continue
+        name, raw = item.split("=", 1)
+        if name == "v":
+            version = int(raw)
+        elif name == "h":
+            digest = int(raw, 16)
+        elif name in PARAM_FIELDS:
+            values[name] = float(raw)
+    return version, digest, values
+
+
+def param_digest(values):
+    """CRC32 of a full parameter set, computed the same way as the bridge"""
+    canonical = ";".join(f"{name}={values[name]:g}" for name in PARAM_FIELDS)
+    return zlib.crc32(canonical.encode("ascii")) & 0xFFFFFFFF
+
+
+def parameter_delta_commands(current, desired):
+    """Commands that move the controller from `current` to `desired` (changed fields only)"""
+    commands = []
+    for axis in ("roll", "pitch", "yaw"):
+        names = [f"{axis}_{gain}" for gain in ("kp", "ki", "kd")]
+        if any(n in desired and desired[n] != current.get(n) for n in names):
+            gains = [desired.get(n, current.get(n)) for n in names]
+            commands.append(f"PID_{axis.upper()} {gains[0]:g} {gains[1]:g} {gains[2]:g}")
+    for name, command in PARAM_COMMANDS:
+        if name in desired and desired[name] != current.get(name):
+            commands.append(f"{command} {desired[name]:g}")
+    for i in range(4):
+        name = f"offset{i}"
+        if name in desired and desired[name] != current.get(name):
+            commands.append(f"OFFSET{i} {int(desired[name])}")
+    if "d_gyro" in desired and desired["d_gyro"] != current.get("d_gyro"):
+        commands.append("D_GYRO" if desired["d_gyro"] else "D_ERROR")
+    return commands
 
 
 class DroneController:
-    def __init__(self):
+    def __init__(self, transport="ble", address=DEVICE_ADDRESS, host="127.0.0.1", port=None, simulation=None):
+        """transport: "ble" (pygatt, `address`), "udp"/"ws" (bridge at `host`:`port`)
+        or "sim" (in-process simulated bridge configured by `simulation`, a SimConfig)"""
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Unknown transport: {transport}")
+        self.transport = transport
+        self.address = address
+        self.host = host
+        self.port = port
+        self.simulation = simulation
         self.adapter = None
         self.device = None
         self.connected = False
         self.status_queue = queue.Queue()
+        # Last parameter mirror seen on the bridge
+        self.param_version = None
+        self.param_digest = None
+        self.parameters = {}
+        self.heartbeat_stop = threading.Event()
+        self.heartbeat_thread = None
+        # Decoded telemetry: (bridge time in ms or None, {field: value}) oldest first
+        self.telemetry_decoder = TelemetryDecoder()
+        self.telemetry = collections.deque(maxlen=TELEMETRY_HISTORY)
+        self.telemetry_key = None       # (seq, bridge ms) of the next keyframe (TKEY)
+        self.telemetry_base_ms = None   # bridge ms at decoder time 0
+        # Clocks: bridge against this PC (TSYNC), Arduino micros() against the bridge
+        self.bridge_clock = ClockEstimator()
+        self.arduino_clock = ClockEstimator()
+        self.mtu = None
+        self.status_waiters = []  # [event, reply, prefixes, receive us] for request/reply statuses
+        self.waiters_lock = threading.Lock()    # handler, pool threads and the Tk thread all use them
+        # Adaptive send rate per command class, from the bridge's BP: notifications
+        self.pace_lock = threading.Lock()
+        self.send_intervals = {}
+        self.next_send = {}
+        self.paced_at = {}          # last BP or recovery step per class
+        self.backpressure_events = 0
+        self.command_ids = itertools.count(1)   # tags of send_tracked() commands
 
     def connect_to_device(self):
         """Connect to device"""
         try:
-            logger.info("Initializing BLE adapter...")
-            self.adapter = pygatt.GATTToolBackend()
-            self.adapter.start(reset_on_start=False)
+            if self.transport == "ble":
+                logger.info("Initializing BLE adapter...")
+                self.adapter = pygatt.GATTToolBackend()
+                self.adapter.start(reset_on_start=False)
 
-            logger.info(f"Connecting to device {DEVICE_ADDRESS}...")
-            self.device = self.adapter.connect(DEVICE_ADDRESS)
+                logger.info(f"Connecting to device {self.address}...")
+                self.device = self.adapter.connect(self.address)
+                try:
+                    self.mtu = self.device.exchange_mtu(BLE_MTU)
+                    logger.info(f"ATT MTU {self.mtu}")
+                except Exception as e:
+                    logger.warning(f"MTU exchange error: {e}")
+            elif self.transport == "sim":
+                # imported here: sim_device uses this module's UUIDs and parameter table
+                from sim_device import SimulatedDevice
+                self.device = SimulatedDevice(self.simulation)
+                self.mtu = self.device.mtu
+            else:
+                self.device = self.open_network_device()
             self.connected = True
+            self.telemetry_decoder = TelemetryDecoder()
+            self.telemetry_key = self.telemetry_base_ms = None
+            self.bridge_clock = ClockEstimator()
+            self.arduino_clock = ClockEstimator()
             logger.info("Connection successful!")
 
-            # Enable notifications
-            try:
-                self.device.subscribe(STATUS_UUID, callback=self.notification_handler)
-                logger.info("Notifications enabled")
-            except Exception as e:
-                logger.warning(f"Notification enable error: {e}")
+            # Enable notifications: statuses/acks and telemetry come on separate characteristics
+            for uuid in (STATUS_UUID, TELEMETRY_UUID):
+                try:
+                    self.device.subscribe(uuid, callback=self.notification_handler)
+                    logger.info(f"Notifications enabled on {uuid}")
+                except Exception as e:
+                    logger.warning(f"Notification enable error on {uuid}: {e}")
 
+            self.start_heartbeat()
             return True
 
         except Exception as e:
@@ -60,15 +250,199 @@ class DroneController:
                     pass
             return False
 
+    def open_network_device(self):
+        """Connect to the bridge's UDP or WebSocket server"""
+        options = dict(write_overrides=NETWORK_WRITE_OVERRIDES, write_prefixes=NETWORK_WRITE_PREFIXES,
+                       read_requests=NETWORK_READ_REQUESTS)
+        if self.transport == "udp":
+            port = self.port or DEFAULT_UDP_PORT
+            logger.info(f"Using UDP bridge at {self.host}:{port}...")
+            return UdpDevice(self.host, port, **options)
+        port = self.port or DEFAULT_WS_PORT
+        logger.info(f"Connecting to WebSocket bridge at {self.host}:{port}...")
+        return WebSocketDevice(self.host, port, **options)
+
     def notification_handler(self, handle, data):
-        """BLE notification handler"""
+        """BLE notification handler: binary telemetry packets or text statuses"""
+        received_us = now_us()
         try:
+            if is_telemetry(data):
+                self.handle_telemetry(data)
+                return
             status_message = data.decode("utf-8")
+            if status_message.startswith("TSYNC:"):
+                self.handle_clock_sync(status_message, received_us)
+                return
+            if status_message.startswith("TKEY:"):
+                _, seq, bridge_ms = status_message.split(":")
+                self.telemetry_key = (int(seq), int(bridge_ms))
+                return
+            if status_message.startswith(BACKPRESSURE_PREFIX):
+                self.handle_backpressure(status_message)
+                return
             logger.info(f"Status received: {status_message}")
+            with self.waiters_lock:
+                matched = [w for w in self.status_waiters if status_message.startswith(w[2])]
+                for waiter in matched:
+                    self.status_waiters.remove(waiter)
+            for waiter in matched:
+                waiter[1] = status_message
+                waiter[3] = received_us
+                waiter[0].set()
             self.status_queue.put(status_message)
         except Exception as e:
             logger.error(f"Notification processing error: {e}")
 
+    def handle_telemetry(self, data):
+        decoder = self.telemetry_decoder
+        samples = decoder.feed(data)
+        if samples and data[0] & KIND_MASK == KEYFRAME and self.telemetry_key:
+            seq, bridge_ms = self.telemetry_key
+            if seq == decoder.keyframe_seq:
+                self.telemetry_base_ms = bridge_ms - decoder.keyframe_time_ms
+        base = self.telemetry_base_ms
+        for time_ms, values in samples:
+            self.telemetry.append((None if base is None else base + time_ms,
+                                   dict(zip(TELEMETRY_FIELDS, values))))
+
+    def handle_clock_sync(self, reply, received_us):
+        """'TSYNC:<t0>:<t1>:<t2>:<arduino offset>:<arduino error>' from the bridge"""
+        t0, t1, t2, arduino_offset, arduino_error = reply.split(":")[1:]
+        self.bridge_clock.add(*exchange_sample(int(t0), int(t1), int(t2), received_us))
+        if arduino_offset:
+            self.arduino_clock.add(int(t2), int(arduino_offset), int(arduino_error))
+
+    def handle_backpressure(self, message):
+        """'BP:<class>:<rate>:<retry ms>': slow that class down to the advertised rate"""
+        _, cls, rate, retry_ms = message.split(":")
+        now = time.monotonic()
+        with self.pace_lock:
+            interval = BACKPRESSURE_MARGIN / float(rate)
+            if interval > self.send_intervals.get(cls, 0.0):
+                logger.info(f"Backpressure on {cls} commands: pacing at {1 / interval:.1f}/s")
+            self.send_intervals[cls] = max(self.send_intervals.get(cls, 0.0), interval)
+            self.next_send[cls] = max(self.next_send.get(cls, 0.0), now + int(retry_ms) / 1000.0)
+            self.paced_at[cls] = now
+            self.backpressure_events += 1
+
+    def pace(self, command):
+        """Wait for this command's slot while its class is paced; safety commands never wait"""
+        cls = command_class(command)
+        if cls == "safety" or cls not in self.send_intervals:
+            return
+        with self.pace_lock:
+            interval = self.send_intervals.get(cls)
+            if interval is None:
+                return
+            now = time.monotonic()
+            if now - self.paced_at[cls] > BACKPRESSURE_RECOVERY:
+                interval *= RECOVERY_FACTOR
+                self.paced_at[cls] = now
+                if interval < MIN_SEND_INTERVAL:
+                    del self.send_intervals[cls]
+                    logger.info(f"Backpressure on {cls} commands cleared")
+                    return
+                self.send_intervals[cls] = interval
+            due = max(now, self.next_send.get(cls, 0.0))
+            self.next_send[cls] = due + interval
+        if due > now:
+            time.sleep(due - now)
+
+    def send_clock_sync(self):
+        """Clock sync ping; the bridge answers with its receive and reply times"""
+        self.device.char_write(COMMAND_UUID, f"TSYNC {now_us()}".encode(), wait_for_response=False)
+
+    def bridge_to_local(self, bridge_us):
+        """Bridge clock -> this PC's monotonic clock (us). Returns (time, error bound) or None"""
+        if not self.bridge_clock.synced:
+            return None
+        return self.bridge_clock.to_local(bridge_us), self.bridge_clock.error_us
+
+    def arduino_to_local(self, arduino_us):
+        """Arduino micros() (unwrapped) -> this PC's monotonic clock. Returns (time, error bound) or None"""
+        if not self.arduino_clock.synced:
+            return None
+        local = self.bridge_to_local(self.arduino_clock.to_local(arduino_us))
+        if local is None:
+            return None
+        return local[0], local[1] + self.arduino_clock.error_us
+
+    def telemetry_to_local(self, bridge_ms):
+        """Telemetry sample time -> this PC's monotonic clock (ms resolution on the bridge)"""
+        local = None if bridge_ms is None else self.bridge_to_local(bridge_ms * 1000)
+        if local is None:
+            return None
+        return local[0], local[1] + 1000
+
+    def clock_report(self):
+        return f"bridge {self.bridge_clock.describe()} | arduino {self.arduino_clock.describe()}"
+
+    def request(self, command, prefixes, timeout=REPLY_TIMEOUT):
+        """Send a command and wait for the status starting with one of `prefixes`. None on timeout"""
+        waiter = self.expect(prefixes)
+        if not self.send_command(command) or not waiter[0].wait(timeout):
+            self.forget(waiter)
+            return None
+        return waiter[1]
+
+    def expect(self, prefixes):
+        """Register for the next status starting with one of `prefixes`; call before sending"""
+        waiter = [threading.Event(), None, tuple(prefixes), None]
+        with self.waiters_lock:
+            self.status_waiters.append(waiter)
+        return waiter
+
+    def forget(self, waiter):
+        """Drop an expect() waiter that is no longer waited for (no-op once it was answered)"""
+        with self.waiters_lock:
+            if waiter in self.status_waiters:
+                self.status_waiters.remove(waiter)
+
+    def wait_reply(self, waiter, timeout=REPLY_TIMEOUT):
+        """(status, local receive time in us) for an expect() waiter, None on timeout"""
+        if not waiter[0].wait(timeout):
+            self.forget(waiter)
+            return None
+        return waiter[1], waiter[3]
+
+    def upload_mission(self, steps):
+        """
+        Upload [(offset seconds, command)] to the bridge's mission executor.
+        Returns the bridge's 'MISSION:LOADED:...' reply, or None on failure
+        """
+        if not self.connected or not self.device:
+            logger.warning("Cannot upload mission - not connected")
+            return None
+
+        data = "".join(f"{round(offset * 1e6)} {command}\n" for offset, command in steps).encode("ascii")
+        if self.transport in ("ble", "sim"):
+            chunk = (self.mtu - 5) if self.mtu else MISSION_CHUNK
+        else:
+            chunk = NETWORK_MISSION_CHUNK
+        try:
+            for offset in range(0, max(len(data), 1), chunk):
+                self.device.char_write(MISSION_UUID, offset.to_bytes(2, "little") + data[offset:offset + chunk],
+                                       wait_for_response=True)
+        except Exception as e:
+            logger.error(f"Mission upload error: {e}")
+            return None
+        reply = self.request(f"MISSION LOAD {len(data)} {zlib.crc32(data):08x}",
+                             ("MISSION:LOADED", "MISSION:ERR"))
+        logger.info(f"Mission upload ({len(data)} bytes): {reply}")
+        return reply if reply and reply.startswith("MISSION:LOADED") else None
+
+    def run_mission(self, timeout):
+        """
+        Start the uploaded mission and wait up to `timeout` seconds for its end.
+        Returns the final 'MISSION:DONE:...'/'MISSION:ABORTED:...' status, the error reply, or None
+        """
+        finished = self.expect(("MISSION:DONE", "MISSION:ABORTED"))
+        reply = self.request("MISSION START", ("MISSION:STARTED", "MISSION:ERR"))
+        if reply and reply.startswith("MISSION:STARTED") and finished[0].wait(timeout):
+            return finished[1]
+        self.forget(finished)
+        return reply if reply and reply.startswith("MISSION:ERR") else None
+
     def send_run_command(self):
         """Start/Stop command transmission"""
         if not self.connected or not self.device:
@@ -99,6 +473,21 @@ class DroneController:
             logger.error(f"Transmission error: {e}")
             return False
 
+    def send_emergency_stop(self):
+        """Emergency stop over the bridge's dedicated kill characteristic"""
+        if not self.connected or not self.device:
+            logger.warning("Cannot transmit emergency stop - not connected")
+            return False
+
+        try:
+            self.device.char_write(KILL_UUID, b"\x01", wait_for_response=False)
+            logger.info("Emergency stop transmitted")
+            return True
+        except Exception as e:
+            # Older bridge without the kill characteristic
+            logger.error(f"Kill characteristic write error: {e}, falling back to ESTOP command")
+            return self.send_command("ESTOP")
+
     def send_command(self, command: str = None):
         """Command transmission"""
         if not self.connected or not self.device:
@@ -107,6 +496,7 @@ class DroneController:
 
         try:
             command = f"{command}"
+            self.pace(command)
             self.device.char_write(
                 COMMAND_UUID, command.encode(), wait_for_response=False
             )
@@ -117,6 +507,35 @@ class DroneController:
             logger.error(f"Transmission error: {e}")
             return False
     
+    def send_raw(self, data: bytes):
+        """Write already encoded command bytes (group sends encode once for every drone)"""
+        if not self.connected or not self.device:
+            return False
+        try:
+            self.device.char_write(COMMAND_UUID, data, wait_for_response=False)
+            return True
+        except Exception as e:
+            logger.error(f"Transmission error: {e}")
+            return False
+
+    def send_tracked(self, command):
+        """
+        Send `command` tagged '#c<n>'; the bridge answers 'ACK:c<n>:...' once it reached the
+        Arduino or 'NAK:c<n>:<reason>'. Returns the expect() waiter for that reply, None if the
+        write failed. Does not wait for the reply
+        """
+        if not self.connected or not self.device:
+            logger.warning("Cannot transmit command - not connected")
+            return None
+        tag = f"c{next(self.command_ids)}"
+        waiter = self.expect((f"ACK:{tag}:", f"NAK:{tag}:"))
+        self.pace(command)
+        if not self.send_raw(f"#{tag} {command}".encode()):
+            self.forget(waiter)
+            return None
+        logger.info(f"Command transmission: #{tag} {command}")
+        return waiter
+
     def send_parameter(self, param_name, value):
         """Parameter settings command transmission"""
         if not self.connected or not self.device:
@@ -125,6 +544,7 @@ class DroneController:
         
         try:
             command = f"SET:{param_name}={value}"
+            self.pace(command)
             self.device.char_write(COMMAND_UUID, command.encode(), wait_for_response=False)
             logger.info(f"Parameter transmitted: {command}")
             return True
@@ -133,20 +553,94 @@ class DroneController:
             logger.error(f"Parameter transmission error: {e}")
             return False
 
+    def start_heartbeat(self):
+        """Start sending periodic heartbeats for the bridge's failsafe watchdog"""
+        self.heartbeat_stop.clear()
+        self.heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        self.heartbeat_thread.start()
+
+    def _heartbeat_loop(self):
+        payload = HEARTBEAT_COMMAND.encode()
+        last_sync = 0.0
+        while not self.heartbeat_stop.wait(HEARTBEAT_INTERVAL):
+            if not self.connected or not self.device:
+                continue
+            try:
+                if now_us() / 1e6 - last_sync >= CLOCK_SYNC_INTERVAL:
+                    last_sync = now_us() / 1e6
+                    self.send_clock_sync()
+                else:
+                    self.device.char_write(COMMAND_UUID, payload, wait_for_response=False)
+            except Exception as e:
+                logger.debug(f"Heartbeat error: {e}")
+
+    def read_parameters(self):
+        """Read the bridge's parameter mirror in one read. Returns the values or None"""
+        if not self.connected or not self.device:
+            logger.warning("Cannot read parameters - not connected")
+            return None
+
+        try:
+            data = self.device.char_read(PARAMS_UUID)
+            version, digest, values = parse_parameter_mirror(bytes(data).decode("ascii"))
+            self.param_version = version
+            self.param_digest = digest
+            self.parameters = values
+            logger.info(f"Parameter mirror version {version} (hash {digest:08x})")
+            return values
+        except Exception as e:
+            logger.error(f"Parameter read error: {e}")
+            return None
+
+    def sync_parameters(self, desired):
+        """Send only the parameters in `desired` that differ from the bridge's mirror.
+        Returns the number of commands sent, or None if the mirror could not be read"""
+        if self.read_parameters() is None:
+            return None
+
+        merged = dict(self.parameters)
+        merged.update(desired)
+        if len(merged) == len(PARAM_FIELDS) and param_digest(merged) == self.param_digest:
+            logger.info("Parameters already in sync")
+            return 0
+
+        commands = parameter_delta_commands(self.parameters, desired)
+        for command in commands:
+            self.send_command(command)
+        logger.info(f"Parameter sync sent {len(commands)} command(s)")
+        return len(commands)
+
     def disconnect(self):
         """Disconnect"""
+        self.heartbeat_stop.set()
         if self.adapter:
             try:
                 self.adapter.stop()
             except:
                 pass
+        elif self.device:
+            try:
+                self.device.disconnect()
+            except:
+                pass
         self.connected = False
         logger.info("Disconnected")
 
 
 class DroneControllerGUI:
-    def __init__(self):
-        self.controller = DroneController()
+    def __init__(self, controller=None, fleet=None):
+        self.controller = controller or DroneController()
+        # every drone the GUI knows; self.controller is the active session's controller
+        self.fleet = fleet or FleetManager(lambda address: DroneController("ble", address))
+        self.fleet.adopt(self.controller)
+        self.drone_choices = []
+        self.drone_addresses = []
+        self.params_loaded = False
+        # Parameter updates: sent by the drone's session sender, acks matched in update_status()
+        self.param_entries = {}         # field name -> Entry
+        self.field_updates = {}         # field name -> number of its latest update
+        self.update_ids = itertools.count(1)
+        self.tracked = []               # [controller, waiter, deadline, fields, update, description]
         self.root = tk.Tk()
         self.root.title("Drone Controller (pygatt)")
         self.root.geometry("700x1200")
@@ -176,6 +670,41 @@ class DroneControllerGUI:
         self.status_label = ttk.Label(self.status_frame, text="", font=("Arial", 10))
         self.status_label.pack()
 
+        self.telemetry_label = ttk.Label(self.status_frame, text="", font=("Courier", 9))
+        self.telemetry_label.pack()
+
+        self.clock_label = ttk.Label(self.status_frame, text="", font=("Courier", 9))
+        self.clock_label.pack()
+
+        # Activity log: results of parameter updates, tests and errors (no dialogs)
+        log_frame = ttk.LabelFrame(self.root, text="Activity", padding="5")
+        log_frame.pack(fill=tk.X, padx=10, pady=5)
+        self.activity_log = tk.Text(log_frame, height=6, font=("Courier", 9), state=tk.DISABLED, wrap=tk.NONE)
+        log_scroll = ttk.Scrollbar(log_frame, command=self.activity_log.yview)
+        self.activity_log.config(yscrollcommand=log_scroll.set)
+        log_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.activity_log.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.activity_log.tag_config("applied", foreground="green")
+        self.activity_log.tag_config("failed", foreground="red")
+
+        # Drone picker: scan, connect several at once, choose the one the controls drive
+        fleet_frame = ttk.LabelFrame(self.root, text="Drones", padding="5")
+        fleet_frame.pack(fill=tk.X, padx=10, pady=5)
+
+        self.drone_var = tk.StringVar()
+        self.drone_combo = ttk.Combobox(fleet_frame, textvariable=self.drone_var, state="readonly", width=45)
+        self.drone_combo.pack(side=tk.LEFT, padx=5)
+        self.drone_combo.bind("<<ComboboxSelected>>", self.on_drone_selected)
+
+        ble = self.controller.transport == "ble"
+        self.scan_button = ttk.Button(fleet_frame, text="Scan", command=self.scan_drones, width=10,
+                                      state=tk.NORMAL if ble else tk.DISABLED)
+        self.scan_button.pack(side=tk.LEFT, padx=2)
+        self.connect_all_button = ttk.Button(fleet_frame, text="Connect All", command=self.connect_all_drones,
+                                             width=12, state=tk.NORMAL if ble else tk.DISABLED)
+        self.connect_all_button.pack(side=tk.LEFT, padx=2)
+        self.refresh_drone_list()
+
         # Connectbutton
         button_frame = ttk.Frame(self.root, padding="10")
         button_frame.pack()
@@ -264,8 +793,7 @@ class DroneControllerGUI:
             ).pack(side=tk.LEFT)
         
         ttk.Label(offset_frame, text="value:").pack(side=tk.LEFT, padx=(10,2))
-        offset_entry = ttk.Entry(offset_frame, textvariable=self.offset_value, width=6)
-        offset_entry.pack(side=tk.LEFT, padx=2)
+        self.param_entry(offset_frame, "offset", self.offset_value)
         
         ttk.Button(
             offset_frame,
@@ -371,16 +899,16 @@ class DroneControllerGUI:
         roll_frame.pack(fill=tk.X, pady=2)
         ttk.Label(roll_frame, text="Roll:", width=6).pack(side=tk.LEFT, padx=5)
         
-        self.roll_kp = tk.DoubleVar(value=2.0)
-        self.roll_ki = tk.DoubleVar(value=0.0)
-        self.roll_kd = tk.DoubleVar(value=2.0)
+        self.roll_kp = tk.DoubleVar(value=PARAM_DEFAULTS["roll_kp"])
+        self.roll_ki = tk.DoubleVar(value=PARAM_DEFAULTS["roll_ki"])
+        self.roll_kd = tk.DoubleVar(value=PARAM_DEFAULTS["roll_kd"])
         
         ttk.Label(roll_frame, text="Kp:").pack(side=tk.LEFT)
-        ttk.Entry(roll_frame, textvariable=self.roll_kp, width=6).pack(side=tk.LEFT, padx=2)
+        self.param_entry(roll_frame, "roll_kp", self.roll_kp)
         ttk.Label(roll_frame, text="Ki:").pack(side=tk.LEFT, padx=(10,0))
-        ttk.Entry(roll_frame, textvariable=self.roll_ki, width=6).pack(side=tk.LEFT, padx=2)
+        self.param_entry(roll_frame, "roll_ki", self.roll_ki)
         ttk.Label(roll_frame, text="Kd:").pack(side=tk.LEFT, padx=(10,0))
-        ttk.Entry(roll_frame, textvariable=self.roll_kd, width=6).pack(side=tk.LEFT, padx=2)
+        self.param_entry(roll_frame, "roll_kd", self.roll_kd)
         ttk.Button(roll_frame, text="Set", command=lambda: self.set_pid_params("ROLL"), width=6).pack(side=tk.LEFT, padx=5)
         
         # Pitch PID Parameters
@@ -388,16 +916,16 @@ class DroneControllerGUI:
         pitch_frame.pack(fill=tk.X, pady=2)
         ttk.Label(pitch_frame, text="Pitch:", width=6).pack(side=tk.LEFT, padx=5)
         
-        self.pitch_kp = tk.DoubleVar(value=2.0)
-        self.pitch_ki = tk.DoubleVar(value=0.0)
-        self.pitch_kd = tk.DoubleVar(value=2.0)
+        self.pitch_kp = tk.DoubleVar(value=PARAM_DEFAULTS["pitch_kp"])
+        self.pitch_ki = tk.DoubleVar(value=PARAM_DEFAULTS["pitch_ki"])
+        self.pitch_kd = tk.DoubleVar(value=PARAM_DEFAULTS["pitch_kd"])
         
         ttk.Label(pitch_frame, text="Kp:").pack(side=tk.LEFT)
-        ttk.Entry(pitch_frame, textvariable=self.pitch_kp, width=6).pack(side=tk.LEFT, padx=2)
+        self.param_entry(pitch_frame, "pitch_kp", self.pitch_kp)
         ttk.Label(pitch_frame, text="Ki:").pack(side=tk.LEFT, padx=(10,0))
-        ttk.Entry(pitch_frame, textvariable=self.pitch_ki, width=6).pack(side=tk.LEFT, padx=2)
+        self.param_entry(pitch_frame, "pitch_ki", self.pitch_ki)
         ttk.Label(pitch_frame, text="Kd:").pack(side=tk.LEFT, padx=(10,0))
-        ttk.Entry(pitch_frame, textvariable=self.pitch_kd, width=6).pack(side=tk.LEFT, padx=2)
+        self.param_entry(pitch_frame, "pitch_kd", self.pitch_kd)
         ttk.Button(pitch_frame, text="Set", command=lambda: self.set_pid_params("PITCH"), width=6).pack(side=tk.LEFT, padx=5)
         
         # Yaw PID Parameters
@@ -405,16 +933,16 @@ class DroneControllerGUI:
         yaw_frame.pack(fill=tk.X, pady=2)
         ttk.Label(yaw_frame, text="Yaw:", width=6).pack(side=tk.LEFT, padx=5)
         
-        self.yaw_kp = tk.DoubleVar(value=3.0)
-        self.yaw_ki = tk.DoubleVar(value=0.1)
-        self.yaw_kd = tk.DoubleVar(value=0.8)
+        self.yaw_kp = tk.DoubleVar(value=PARAM_DEFAULTS["yaw_kp"])
+        self.yaw_ki = tk.DoubleVar(value=PARAM_DEFAULTS["yaw_ki"])
+        self.yaw_kd = tk.DoubleVar(value=PARAM_DEFAULTS["yaw_kd"])
         
         ttk.Label(yaw_frame, text="Kp:").pack(side=tk.LEFT)
-        ttk.Entry(yaw_frame, textvariable=self.yaw_kp, width=6).pack(side=tk.LEFT, padx=2)
+        self.param_entry(yaw_frame, "yaw_kp", self.yaw_kp)
         ttk.Label(yaw_frame, text="Ki:").pack(side=tk.LEFT, padx=(10,0))
-        ttk.Entry(yaw_frame, textvariable=self.yaw_ki, width=6).pack(side=tk.LEFT, padx=2)
+        self.param_entry(yaw_frame, "yaw_ki", self.yaw_ki)
         ttk.Label(yaw_frame, text="Kd:").pack(side=tk.LEFT, padx=(10,0))
-        ttk.Entry(yaw_frame, textvariable=self.yaw_kd, width=6).pack(side=tk.LEFT, padx=2)
+        self.param_entry(yaw_frame, "yaw_kd", self.yaw_kd)
         ttk.Button(yaw_frame, text="Set", command=lambda: self.set_pid_params("YAW"), width=6).pack(side=tk.LEFT, padx=5)
         
         # Simple adjustment buttons
@@ -473,48 +1001,48 @@ class DroneControllerGUI:
         deadband_frame = ttk.Frame(other_params_frame)
         deadband_frame.pack(fill=tk.X, pady=2)
         ttk.Label(deadband_frame, text="Angle Deadband (degrees):").pack(side=tk.LEFT, padx=5)
-        self.angle_deadband = tk.DoubleVar(value=0.1)
-        ttk.Entry(deadband_frame, textvariable=self.angle_deadband, width=6).pack(side=tk.LEFT, padx=2)
+        self.angle_deadband = tk.DoubleVar(value=PARAM_DEFAULTS["deadband"])
+        self.param_entry(deadband_frame, "deadband", self.angle_deadband)
         ttk.Button(deadband_frame, text="Set", command=lambda: self.set_param("DEADBAND", self.angle_deadband.get()), width=6).pack(side=tk.LEFT, padx=5)
         
         # Min correction value settings
         min_corr_frame = ttk.Frame(other_params_frame)
         min_corr_frame.pack(fill=tk.X, pady=2)
         ttk.Label(min_corr_frame, text="Min Correction Value (µs):").pack(side=tk.LEFT, padx=5)
-        self.min_correction = tk.IntVar(value=30)
-        ttk.Entry(min_corr_frame, textvariable=self.min_correction, width=6).pack(side=tk.LEFT, padx=2)
+        self.min_correction = tk.IntVar(value=PARAM_DEFAULTS["min_corr"])
+        self.param_entry(min_corr_frame, "min_corr", self.min_correction)
         ttk.Button(min_corr_frame, text="Set", command=lambda: self.set_param("MIN_CORR", self.min_correction.get()), width=6).pack(side=tk.LEFT, padx=5)
         
         # Max correction value settings
         max_corr_frame = ttk.Frame(other_params_frame)
         max_corr_frame.pack(fill=tk.X, pady=2)
         ttk.Label(max_corr_frame, text="Max Correction Value (µs):").pack(side=tk.LEFT, padx=5)
-        self.max_correction = tk.IntVar(value=100)
-        ttk.Entry(max_corr_frame, textvariable=self.max_correction, width=6).pack(side=tk.LEFT, padx=2)
+        self.max_correction = tk.IntVar(value=PARAM_DEFAULTS["max_corr"])
+        self.param_entry(max_corr_frame, "max_corr", self.max_correction)
         ttk.Button(max_corr_frame, text="Set", command=lambda: self.set_param("MAX_CORR", self.max_correction.get()), width=6).pack(side=tk.LEFT, padx=5)
         
         # PID scale factor settings
         scale_frame = ttk.Frame(other_params_frame)
         scale_frame.pack(fill=tk.X, pady=2)
         ttk.Label(scale_frame, text="PID Scale:").pack(side=tk.LEFT, padx=5)
-        self.pid_scale = tk.DoubleVar(value=0.01)
-        ttk.Entry(scale_frame, textvariable=self.pid_scale, width=6).pack(side=tk.LEFT, padx=2)
+        self.pid_scale = tk.DoubleVar(value=PARAM_DEFAULTS["scale"])
+        self.param_entry(scale_frame, "scale", self.pid_scale)
         ttk.Button(scale_frame, text="Set", command=lambda: self.set_param("SCALE", self.pid_scale.get()), width=6).pack(side=tk.LEFT, padx=5)
         
         # Min motor output settings
         min_out_frame = ttk.Frame(other_params_frame)
         min_out_frame.pack(fill=tk.X, pady=2)
         ttk.Label(min_out_frame, text="Min Output (µs):").pack(side=tk.LEFT, padx=5)
-        self.min_motor_output = tk.IntVar(value=50)
-        ttk.Entry(min_out_frame, textvariable=self.min_motor_output, width=6).pack(side=tk.LEFT, padx=2)
+        self.min_motor_output = tk.IntVar(value=PARAM_DEFAULTS["min_out"])
+        self.param_entry(min_out_frame, "min_out", self.min_motor_output)
         ttk.Button(min_out_frame, text="Set", command=lambda: self.set_param("MIN_OUT", self.min_motor_output.get()), width=6).pack(side=tk.LEFT, padx=5)
         
         # Base Throttle Settings
         base_thr_frame = ttk.Frame(other_params_frame)
         base_thr_frame.pack(fill=tk.X, pady=2)
         ttk.Label(base_thr_frame, text="Base Throttle:").pack(side=tk.LEFT, padx=5)
-        self.base_throttle = tk.IntVar(value=1250)
-        ttk.Entry(base_thr_frame, textvariable=self.base_throttle, width=6).pack(side=tk.LEFT, padx=2)
+        self.base_throttle = tk.IntVar(value=PARAM_DEFAULTS["base_thr"])
+        self.param_entry(base_thr_frame, "base_thr", self.base_throttle)
         ttk.Button(base_thr_frame, text="Set", command=lambda: self.set_param("BASE_THR", self.base_throttle.get()), width=6).pack(side=tk.LEFT, padx=5)
         
         # D-term implementation method selection
@@ -558,18 +1086,228 @@ class DroneControllerGUI:
         style.configure(
             "Emergency.TButton", foreground="red", font=("Arial", 16, "bold")
         )
+        style.configure("Pending.TEntry", fieldbackground="#fff3b0")
+        style.configure("Applied.TEntry", fieldbackground="#d4f5d4")
+        style.configure("Failed.TEntry", fieldbackground="#f8d0d0")
+
+    def param_entry(self, parent, name, var):
+        """Entry for a tunable field; its colour shows the state of the field's last update"""
+        entry = ttk.Entry(parent, textvariable=var, width=6)
+        entry.pack(side=tk.LEFT, padx=2)
+        self.param_entries[name] = entry
+        # an edited value is neither pending nor applied
+        var.trace_add("write", lambda *_: self.mark_fields([name], None))
+        return entry
+
+    def log_activity(self, text, state=None):
+        """Append a line to the activity log (Tk thread)"""
+        log = self.activity_log
+        log.config(state=tk.NORMAL)
+        log.insert(tk.END, f"{time.strftime('%H:%M:%S')} {text}\n", state or ())
+        excess = int(log.index("end-1c").split(".")[0]) - 1 - ACTIVITY_LOG_LINES
+        if excess > 0:
+            log.delete("1.0", f"{excess + 1}.0")
+        log.config(state=tk.DISABLED)
+        log.see(tk.END)
+
+    def mark_fields(self, fields, state, update=None):
+        """Colour parameter fields; a result only applies if it is for the field's latest update"""
+        for name in fields:
+            if update is not None and self.field_updates.get(name) != update:
+                continue
+            entry = self.param_entries.get(name)
+            if entry is not None:
+                entry.config(style=FIELD_STYLES[state])
+
+    def queue_command(self, command, description=None, on_sent=None):
+        """
+        Queue a command on the active drone's session: its sender thread writes (and paces)
+        off the Tk thread, in order with everything else sent to that drone
+        """
+        session = self.fleet.active
+        if not self.controller.connected or session is None or session.controller is not self.controller:
+            self.log_activity(f"{description or command}: not connected", "failed")
+            return False
+        if not session.send(command, on_sent):
+            self.log_activity(f"{description or command}: send queue full", "failed")
+            return False
+        return True
+
+    def send_tracked(self, command, description, fields=()):
+        """Queue a tagged command; its fields show pending until the ACK/NAK arrives"""
+        controller = self.controller
+        update = next(self.update_ids)
+        fields = tuple(fields)
+
+        def sent(waiter):
+            self.root.after(0, self.on_command_sent, controller, waiter, description, fields, update)
+
+        if not self.queue_command(command, description, sent):
+            self.mark_fields(fields, "failed")
+            return
+        self.mark_fields(fields, "pending")
+        for name in fields:
+            self.field_updates[name] = update
+
+    def on_command_sent(self, controller, waiter, description, fields, update):
+        if waiter is None:
+            self.log_activity(f"{description}: write failed", "failed")
+            self.mark_fields(fields, "failed", update)
+            return
+        self.tracked.append([controller, waiter, time.monotonic() + REPLY_TIMEOUT, fields, update, description])
+
+    def check_tracked(self):
+        """Apply the ACK/NAK results that came in (called from update_status)"""
+        now = time.monotonic()
+        for item in list(self.tracked):
+            controller, waiter, deadline, fields, update, description = item
+            if waiter[0].is_set():
+                reply = waiter[1]
+                state = "applied" if reply.startswith("ACK:") else "failed"
+                result = "applied" if state == "applied" else f"rejected ({reply.split(':', 2)[2]})"
+            elif now > deadline:
+                controller.forget(waiter)
+                state, result = "failed", "no acknowledgement"
+            else:
+                continue
+            self.tracked.remove(item)
+            self.log_activity(f"{description}: {result}", state)
+            if controller is self.controller:
+                self.mark_fields(fields, state, update)
+
+    def refresh_drone_list(self):
+        """Combobox entries from the fleet; only touched when something changed"""
+        sessions = list(self.fleet.sessions.values())
+        choices = [s.describe() for s in sessions]
+        if choices != self.drone_choices:
+            self.drone_choices = choices
+            self.drone_addresses = [s.address for s in sessions]
+            self.drone_combo.config(values=choices)
+            if self.fleet.active_address in self.drone_addresses:
+                self.drone_combo.current(self.drone_addresses.index(self.fleet.active_address))
+
+    def scan_drones(self):
+        """Scan in a worker thread; found drones join the list unconnected"""
+        self.scan_button.config(state=tk.DISABLED, text="Scanning...")
+
+        def _scan():
+            try:
+                results, error = scan(), None
+            except Exception as e:
+                results, error = [], e
+            self.root.after(0, self.on_scan_result, results, error)
+
+        threading.Thread(target=_scan, daemon=True).start()
+
+    def on_scan_result(self, results, error):
+        self.scan_button.config(state=tk.NORMAL, text="Scan")
+        if error is not None:
+            self.log_activity(f"Scan failed: {error}", "failed")
+            return
+        self.fleet.add_scan_results(results)
+        self.refresh_drone_list()
+        self.status_label.config(text=f"status: {len(results)} drone(s) found")
+
+    def connect_all_drones(self):
+        """Bring up every listed drone at once (FleetManager.connect_all)"""
+        self.connect_all_button.config(state=tk.DISABLED, text="Connecting...")
+
+        def _connect():
+            results = self.fleet.connect_all()
+            self.root.after(0, self.on_connect_all_result, results)
+
+        threading.Thread(target=_connect, daemon=True).start()
+
+    def on_connect_all_result(self, results):
+        self.connect_all_button.config(state=tk.NORMAL, text="Connect All")
+        self.refresh_drone_list()
+        failed = [address for address, ok in results.items() if not ok]
+        if failed:
+            self.log_activity("Failed to connect to " + ", ".join(failed), "failed")
+        self.show_connection_state()
+
+    def on_drone_selected(self, event=None):
+        """Point the controls at another drone"""
+        index = self.drone_combo.current()
+        if index < 0:
+            return
+        session = self.fleet.select(self.drone_addresses[index])
+        self.controller = session.controller
+        self.params_loaded = False
+        self.status_label.config(text=f"status: {session.last_status or ''}")
+        self.telemetry_label.config(text="")
+        self.clock_label.config(text="")
+        self.show_connection_state()
+        if self.controller.connected:
+            controller = self.controller
+
+            def _read():
+                values = controller.read_parameters()
+                if values and controller is self.controller:
+                    self.root.after(0, self.load_gui_parameters, values)
+
+            threading.Thread(target=_read, daemon=True).start()
+
+    def show_connection_state(self):
+        if self.controller.connected:
+            self.on_connection_result(True)
+        else:
+            self.on_disconnected()
 
     def connect_device(self):
         """Connect to device"""
         self.connect_button.config(state=tk.DISABLED, text="Connecting...")
 
+        # Snapshot the fields on the Tk thread; the sync runs in the worker
+        desired = self.gui_parameters() if self.params_loaded else None
+
         # Connect in separate thread
         def _connect():
             success = self.controller.connect_to_device()
+            if success:
+                if desired is None:
+                    # First connection: show what is actually in effect
+                    values = self.controller.read_parameters()
+                    if values:
+                        self.root.after(0, self.load_gui_parameters, values)
+                else:
+                    # Reconnection: push only the fields that differ
+                    self.controller.sync_parameters(desired)
             self.root.after(0, self.on_connection_result, success)
 
         threading.Thread(target=_connect, daemon=True).start()
 
+    def param_vars(self):
+        """Parameter fields in the GUI keyed by mirror field name"""
+        return {
+            "roll_kp": self.roll_kp, "roll_ki": self.roll_ki, "roll_kd": self.roll_kd,
+            "pitch_kp": self.pitch_kp, "pitch_ki": self.pitch_ki, "pitch_kd": self.pitch_kd,
+            "yaw_kp": self.yaw_kp, "yaw_ki": self.yaw_ki, "yaw_kd": self.yaw_kd,
+            "deadband": self.angle_deadband,
+            "scale": self.pid_scale,
+            "min_corr": self.min_correction,
+            "max_corr": self.max_correction,
+            "min_out": self.min_motor_output,
+            "base_thr": self.base_throttle,
+        }
+
+    def gui_parameters(self):
+        """Current parameter field values"""
+        values = {}
+        for name, var in self.param_vars().items():
+            try:
+                values[name] = float(var.get())
+            except (tk.TclError, ValueError):
+                pass
+        return values
+
+    def load_gui_parameters(self, values):
+        """Fill parameter fields from the bridge's mirror"""
+        for name, var in self.param_vars().items():
+            if name in values:
+                var.set(int(values[name]) if isinstance(var, tk.IntVar) else values[name])
+        self.params_loaded = True
+
     def disconnect_device(self):
         """Disconnect from device"""
         self.controller.disconnect()
@@ -577,55 +1315,44 @@ class DroneControllerGUI:
 
     def start_drone(self):
         """Start drone"""
-        self.controller.send_run_command()
+        self.queue_command("RUN")
 
     def stop_drone(self):
-        """Stop drone"""
-        self.controller.send_stop_command()
+        """Stop drone: sent at once, the drone's queued commands are dropped"""
+        session = self.fleet.active
+        if session is None or session.controller is not self.controller:
+            self.controller.send_stop_command()
+            return
+        if not session.stop():
+            self.log_activity("STOP: write failed", "failed")
 
 
     def send_direction_command(self, command: str = None):
         """Direction command transmission"""
-        if not self.controller.connected:
-            messagebox.showwarning("Warning", "Device is not connected")
-            return
-
-        self.controller.send_command(command)
+        self.queue_command(command)
 
     def send_test_command(self, esc_num):
         """ESC individual test command transmission"""
-        if not self.controller.connected:
-            messagebox.showwarning("Warning", "Device is not connected")
-            return
-        
-        command = f"TEST{esc_num}"
-        self.controller.send_command(command)
-        messagebox.showinfo("Test", f"ESC{esc_num} individual test started")
+        self.send_tracked(f"TEST{esc_num}", f"ESC{esc_num} individual test")
 
     def send_offset_command(self):
         """ESC offset adjustment command transmission"""
-        if not self.controller.connected:
-            messagebox.showwarning("Warning", "Device is not connected")
-            return
-        
         esc_num = self.selected_esc.get()
-        offset_val = self.offset_value.get()
-        
+        try:
+            offset_val = self.offset_value.get()
+        except tk.TclError:
+            offset_val = None
+
         # Range check
-        if offset_val < -200 or offset_val > 200:
-            messagebox.showerror("Error", "Please input offset value in range -200 to 200")
+        if offset_val is None or offset_val < -200 or offset_val > 200:
+            self.log_activity("ESC offset must be in range -200 to 200", "failed")
+            self.mark_fields(["offset"], "failed")
             return
-        
-        command = f"OFFSET{esc_num} {offset_val}"
-        self.controller.send_command(command)
-        messagebox.showinfo("Settings Complete", f"ESC{esc_num} offset set to {offset_val}")
+
+        self.send_tracked(f"OFFSET{esc_num} {offset_val}", f"ESC{esc_num} offset {offset_val}", ["offset"])
 
     def set_pid_params(self, axis):
         """PID parameter settings"""
-        if not self.controller.connected:
-            messagebox.showwarning("Warning", "Device is not connected")
-            return
-        
         if axis == "ROLL":
             kp = self.roll_kp.get()
             ki = self.roll_ki.get()
@@ -642,36 +1369,29 @@ class DroneControllerGUI:
             return
         
         # Transmit PID parameters
-        command = f"PID_{axis} {kp} {ki} {kd}"
-        self.controller.send_command(command)
-        messagebox.showinfo("Settings Complete", f"{axis} PID parameters set\nKp={kp}, Ki={ki}, Kd={kd}")
-    
+        prefix = axis.lower()
+        self.send_tracked(f"PID_{axis} {kp} {ki} {kd}", f"{axis} PID Kp={kp} Ki={ki} Kd={kd}",
+                          [f"{prefix}_kp", f"{prefix}_ki", f"{prefix}_kd"])
+
     def set_param(self, param_name, value):
         """Other parameter settings"""
-        if not self.controller.connected:
-            messagebox.showwarning("Warning", "Device is not connected")
-            return
-        
-        command = f"SET_{param_name} {value}"
-        self.controller.send_command(command)
-        messagebox.showinfo("Settings Complete", f"{param_name} set to {value}")
-    
+        self.send_tracked(f"SET_{param_name} {value}", f"{param_name} {value}", [param_name.lower()])
+
     def send_command(self, command):
-        """Generic command transmission"""
-        if not self.controller.connected:
-            messagebox.showwarning("Warning", "Device is not connected")
-            return
-        
-        self.controller.send_command(command)
+        """Generic command transmission (mode and PID preset buttons), acked in the activity log"""
+        self.send_tracked(command, command)
 
     def emergency_stop(self):
-        """Emergency stop"""
-        if self.controller.connected:
-            self.controller.send_stop_command()
-            messagebox.showinfo("Emergency Stop", "Motors stopped")
+        """Emergency stop: every connected drone, not only the selected one"""
+        results = self.fleet.emergency_stop_all()
+        if results:
+            stopped = sum(results.values())
+            self.log_activity(f"Emergency stop: motors stopped on {stopped}/{len(results)} drone(s)",
+                              "applied" if stopped == len(results) else "failed")
 
     def on_connection_result(self, success):
         """Connection result processing"""
+        self.refresh_drone_list()
         if success:
             self.connection_label.config(text="Connected", foreground="green")
             self.connect_button.config(state=tk.DISABLED, text="Connect")
@@ -679,22 +1399,34 @@ class DroneControllerGUI:
         else:
             self.connection_label.config(text="Connection Failed", foreground="red")
             self.connect_button.config(state=tk.NORMAL, text="Connect")
-            messagebox.showerror("Error", "Failed to connect to device")
+            self.log_activity("Failed to connect to device", "failed")
 
     def on_disconnected(self):
         """Disconnection processing"""
+        self.refresh_drone_list()
         self.connection_label.config(text="Not Connected", foreground="black")
         self.connect_button.config(state=tk.NORMAL)
         self.disconnect_button.config(state=tk.DISABLED)
 
     def update_status(self):
         """Status update"""
-        try:
-            while not self.controller.status_queue.empty():
-                status = self.controller.status_queue.get_nowait()
+        # every drone's status stream is drained; only the active one is shown
+        for session in list(self.fleet.sessions.values()):
+            previous = session.last_status
+            status = session.poll_status()
+            if session.controller is self.controller and status is not previous:
                 self.status_label.config(text=f"status: {status}")
-        except queue.Empty:
-            pass
+
+        if self.controller.telemetry:
+            _, t = self.controller.telemetry[-1]
+            self.telemetry_label.config(
+                text=f"PWM {t['pwm_fr']} {t['pwm_bl']} {t['pwm_br']} {t['pwm_fl']}  "
+                     f"R {t['roll'] / 10:+.1f} P {t['pitch'] / 10:+.1f} deg  "
+                     f"gyro {t['gyro_x'] / 10:+.1f} {t['gyro_y'] / 10:+.1f} {t['gyro_z'] / 10:+.1f} deg/s")
+        if self.controller.connected:
+            self.clock_label.config(text=f"clock: {self.controller.clock_report()}")
+        if self.tracked:
+            self.check_tracked()
 
         self.root.after(100, self.update_status)
 
@@ -703,21 +1435,63 @@ class DroneControllerGUI:
         try:
             self.root.mainloop()
         finally:
-            self.controller.disconnect()
-
-
-def main():
-    """Main function"""
+            self.fleet.disconnect_all()
+
+
+def add_connection_args(parser):
+    """Connection options shared by the GUI and the headless tools"""
+    parser.add_argument("--transport", choices=TRANSPORTS, default="ble",
+                        help="ble (pygatt), the bridge's udp/ws server or a simulated bridge")
+    parser.add_argument("--address", default=DEVICE_ADDRESS, help="BLE address of the bridge")
+    parser.add_argument("--host", default="127.0.0.1", help="bridge host for udp/ws")
+    parser.add_argument("--port", type=int, default=None, help="bridge port for udp/ws")
+    sim = parser.add_argument_group("simulated bridge (--transport sim)")
+    sim.add_argument("--sim-latency-ms", type=float, default=8.0, help="one-way link latency")
+    sim.add_argument("--sim-jitter-ms", type=float, default=4.0)
+    sim.add_argument("--sim-loss", type=float, default=0.0, help="write and notification loss probability")
+    sim.add_argument("--sim-telemetry-hz", type=float, default=200.0)
+    sim.add_argument("--sim-dropout-interval", type=float, default=0.0,
+                     help="mean seconds between link dropouts (0 = never)")
+    sim.add_argument("--sim-dropout-duration", type=float, default=1.0)
+
+
+def controller_from_args(args):
+    """DroneController for the parsed connection options, or None if the backend is missing"""
     # Check if pygatt is installed
-    try:
-        import pygatt
-    except ImportError:
+    if args.transport == "ble" and pygatt is None:
         print("pygatt is not installed.")
         print("Please install with the following command:")
         print("  pip install pygatt")
+        return None
+    simulation = None
+    if args.transport == "sim":
+        from sim_device import SimConfig
+        simulation = SimConfig(latency=args.sim_latency_ms / 1000.0, jitter=args.sim_jitter_ms / 1000.0,
+                               loss=args.sim_loss, notify_loss=args.sim_loss,
+                               telemetry_hz=args.sim_telemetry_hz,
+                               dropout_interval=args.sim_dropout_interval,
+                               dropout_duration=args.sim_dropout_duration)
+    return DroneController(args.transport, args.address, args.host, args.port, simulation)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Drone Controller")
+    add_connection_args(parser)
+    return parser.parse_args()
+
+
+def main():
+    """Main function"""
+    args = parse_args()
+
+    if tk is None:
+        print("tkinter is not installed; use flight_script.py for headless control.")
         return
 
-    app = DroneControllerGUI()
+    controller = controller_from_args(args)
+    if controller is None:
+        return
+    app = DroneControllerGUI(controller)
     app.run()
 
 
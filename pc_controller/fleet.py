@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Fleet discovery and multi-drone sessions
+
+scan() finds every peripheral advertising the bridge's service. With bleak it sees
+the advertised service UUID and decodes the bridge's status block (manufacturer
+data); without it, pygatt's scan (hcitool lescan, usually needs root) only has names,
+so drones are matched by the bridge's local name.
+
+FleetManager holds one DroneSession per drone: its own DroneController (and so its
+own gatttool process and status_queue) and its own sender thread and queue, through
+which the GUI sends everything but STOP and the emergency stop (those go out at once),
+so a slow or paced link never holds up another drone's commands. Links are
+brought up in parallel, one worker per drone, so N drones connect in about the time
+of one. One session is active: the one the GUI drives.
+
+group_send() puts one command on several links as close together as possible: the
+tagged frame ('#<id> <command>') is encoded once, one sender per drone waits on a
+barrier and writes it, and every bridge acks with its receive time. Converted to
+this PC's clock (TSYNC), those give the spread between first and last arrival.
+
+    python3 fleet.py --scan-seconds 5
+    python3 fleet.py --connect 2C:CF:67:F5:0B:E0 --connect 2C:CF:67:F5:0B:E1 --group RUN --group STOP
+"""
+
+import argparse
+import asyncio
+import collections
+import logging
+import queue
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from clock_sync import now_us
+
+try:
+    from bleak import BleakScanner
+except ImportError:
+    BleakScanner = None
+
+try:
+    import pygatt
+except ImportError:
+    pygatt = None
+
+logger = logging.getLogger(__name__)
+
+DEVICE_NAME = "RaspberryPiDrone"  # the bridge's advertised local name
+SERVICE_UUID = "6e400001-b5a3-f393-e0a9-e50e24dcca9e"
+SCAN_SECONDS = 5.0
+MAX_PARALLEL_CONNECTS = 8
+SEND_QUEUE_SIZE = 64        # per drone; a full queue refuses new commands instead of lagging
+GROUP_ACK_TIMEOUT = 1.0     # seconds to wait for every drone's ack of a group command
+GROUP_HISTORY = 100
+CLOCK_SYNC_WAIT = 3.0       # fleet.py --group: TSYNC runs once a second per link
+
+# Status block in the bridge's advertising data (drone_ble_server.py StatusBroadcast)
+ADV_COMPANY_ID = 0xFFFF
+ADV_STATUS = struct.Struct('<BBBBH')   # version, sequence, state flags, error flags, base throttle
+ADV_STATES = ((0x01, 'armed'), (0x02, 'landing'), (0x04, 'pid'), (0x08, 'mission'))
+ADV_ERRORS = ((0x01, 'i2c_down'), (0x02, 'slave_down'), (0x04, 'telemetry'), (0x08, 'failsafe'))
+
+ScanResult = collections.namedtuple('ScanResult', 'address name rssi status')
+# times in us on this PC's monotonic clock; arrival_us is the bridge's receive time
+# converted with its TSYNC estimate (None until synced), reply = 'ACK:...'/'NAK:...'
+GroupAck = collections.namedtuple('GroupAck', 'sent_us arrival_us arrival_error_us reply_us reply')
+GroupResult = collections.namedtuple('GroupResult', 'command id acks send_spread_us arrival_spread_us '
+                                                    'arrival_error_us')
+
+
+def parse_status_block(data):
+    """Manufacturer data of the bridge -> {'sequence', 'state', 'errors', 'base_thr'} or None"""
+    if not data or len(data) < ADV_STATUS.size or data[0] != 1:
+        return None
+    _, sequence, state, errors, base_thr = ADV_STATUS.unpack_from(bytes(data))
+    return {'sequence': sequence,
+            'state': [name for bit, name in ADV_STATES if state & bit],
+            'errors': [name for bit, name in ADV_ERRORS if errors & bit],
+            'base_thr': base_thr}
+
+
+def scan(seconds=SCAN_SECONDS):
+    """Drones in range, strongest first when RSSI is known"""
+    results = _scan_bleak(seconds) if BleakScanner is not None else _scan_pygatt(seconds)
+    return sorted(results, key=lambda r: -(r.rssi if r.rssi is not None else -999))
+
+
+def _scan_bleak(seconds):
+    found = asyncio.run(BleakScanner.discover(timeout=seconds, return_adv=True,
+                                              service_uuids=[SERVICE_UUID]))
+    results = []
+    for device, adv in found.values():
+        if SERVICE_UUID not in (uuid.lower() for uuid in adv.service_uuids):
+            continue
+        status = parse_status_block(adv.manufacturer_data.get(ADV_COMPANY_ID))
+        results.append(ScanResult(device.address, adv.local_name or device.name, adv.rssi, status))
+    return results
+
+
+def _scan_pygatt(seconds):
+    if pygatt is None:
+        raise RuntimeError("scanning needs bleak or pygatt")
+    adapter = pygatt.GATTToolBackend()
+    adapter.start(reset_on_start=False)
+    try:
+        devices = adapter.scan(timeout=seconds)
+    finally:
+        adapter.stop()
+    # lescan output has no service UUIDs: match the bridge's advertised name
+    return [ScanResult(d['address'], d['name'], None, None) for d in devices if d.get('name') == DEVICE_NAME]
+
+
+class DroneSession:
+    """One drone: its controller, a sender thread draining its own queue, its last status"""
+
+    def __init__(self, controller, name=None):
+        self.controller = controller
+        self.address = controller.address
+        self.name = name
+        self.last_status = None
+        self.scan = None                # latest ScanResult
+        self.connect_seconds = None
+        self.sent = 0
+        self.send_failures = 0
+        self.queue = queue.Queue(maxsize=SEND_QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._sender, name=f'send-{self.address}', daemon=True)
+        self._thread.start()
+
+    @property
+    def connected(self):
+        return self.controller.connected
+
+    def send(self, command, on_sent=None):
+        """
+        Queue a command for this drone's sender. False if the queue is full. With
+        `on_sent` it goes out tagged (DroneController.send_tracked) and on_sent(waiter)
+        is called on the sender thread, waiter None if the write failed
+        """
+        try:
+            self.queue.put_nowait((command, on_sent))
+            return True
+        except queue.Full:
+            logger.warning(f"{self.address}: send queue full, {command!r} dropped")
+            return False
+
+    def stop(self):
+        """
+        STOP now, on the calling thread: the queued commands are dropped rather than sent
+        first (the bridge drops the ones still waiting there too). Tracked ones get
+        on_sent(None). Returns the send_stop_command() result
+        """
+        dropped = 0
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.queue.put(None)    # closing: leave the sender its sentinel
+                break
+            command, on_sent = item
+            dropped += 1
+            if on_sent is not None:
+                on_sent(None)
+        if dropped:
+            logger.info(f"{self.address}: STOP dropped {dropped} queued command(s)")
+        return self.controller.send_stop_command()
+
+    def _sender(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            command, on_sent = item
+            if on_sent is None:
+                ok = self.controller.send_command(command)
+            else:
+                waiter = self.controller.send_tracked(command)
+                ok = waiter is not None
+                on_sent(waiter)
+            if ok:
+                self.sent += 1
+            else:
+                self.send_failures += 1
+
+    def poll_status(self):
+        """Drain the controller's status stream, keeping the newest message"""
+        try:
+            while True:
+                self.last_status = self.controller.status_queue.get_nowait()
+        except queue.Empty:
+            pass
+        return self.last_status
+
+    def close(self):
+        self.queue.put(None)
+        self.controller.disconnect()
+
+    def describe(self):
+        state = "connected" if self.connected else "not connected"
+        name = f" {self.name}" if self.name else ""
+        rssi = f" {self.scan.rssi} dBm" if self.scan and self.scan.rssi is not None else ""
+        return f"{self.address}{name} ({state}{rssi})"
+
+
+class FleetManager:
+    """
+    Drone sessions by address; connects them in parallel and tracks the active one.
+    `factory(address)` makes an unconnected DroneController.
+    """
+
+    def __init__(self, factory, max_workers=MAX_PARALLEL_CONNECTS):
+        self.factory = factory
+        self.max_workers = max_workers
+        self.sessions = {}
+        self.active_address = None
+        self.group_id = 0
+        self.group_results = collections.deque(maxlen=GROUP_HISTORY)
+        self._lock = threading.Lock()
+
+    def add(self, address, name=None):
+        """Session for `address` (not connected yet); an existing one is returned as is"""
+        with self._lock:
+            session = self.sessions.get(address)
+            if session is None:
+                session = self.sessions[address] = DroneSession(self.factory(address), name)
+            if self.active_address is None:
+                self.active_address = address
+            return session
+
+    def adopt(self, controller, name=None):
+        """Session around an existing controller (e.g. the one given on the command line)"""
+        with self._lock:
+            session = self.sessions.get(controller.address)
+            if session is None or session.controller is not controller:
+                session = self.sessions[controller.address] = DroneSession(controller, name)
+            if self.active_address is None:
+                self.active_address = controller.address
+            return session
+
+    def add_scan_results(self, results):
+        for result in results:
+            self.add(result.address, result.name).scan = result
+
+    def select(self, address):
+        """Make `address` the active drone. Returns its session"""
+        session = self.sessions[address]
+        self.active_address = address
+        return session
+
+    @property
+    def active(self):
+        return self.sessions.get(self.active_address)
+
+    def connect_all(self, addresses=None):
+        """
+        Connect the given (default: all unconnected) sessions, all at once.
+        Returns {address: True/False}; per-drone times are in session.connect_seconds.
+        """
+        if addresses is None:
+            addresses = [a for a, s in self.sessions.items() if not s.connected]
+        sessions = [self.add(address) for address in addresses]
+        if not sessions:
+            return {}
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(len(sessions), self.max_workers),
+                                thread_name_prefix='connect') as pool:
+            results = dict(zip(addresses, pool.map(self._connect, sessions)))
+        logger.info(f"Connected {sum(results.values())}/{len(results)} drone(s) in "
+                    f"{time.perf_counter() - started:.2f} s")
+        return results
+
+    def _connect(self, session):
+        started = time.perf_counter()
+        ok = session.controller.connect_to_device()
+        session.connect_seconds = time.perf_counter() - started
+        return ok
+
+    def connected_sessions(self):
+        return [s for s in self.sessions.values() if s.connected]
+
+    def emergency_stop_all(self):
+        """Kill every connected drone at once, bypassing the send queues. Returns {address: ok}"""
+        sessions = self.connected_sessions()
+        if not sessions:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(sessions), thread_name_prefix='kill') as pool:
+            return dict(zip([s.address for s in sessions],
+                            pool.map(lambda s: s.controller.send_emergency_stop(), sessions)))
+
+    def group_send(self, command, addresses=None, timeout=GROUP_ACK_TIMEOUT):
+        """
+        Send `command` to the given (default: all connected) drones together.
+        Returns a GroupResult, also logged and kept in group_results.
+        """
+        if addresses is None:
+            sessions = self.connected_sessions()
+        else:
+            sessions = [self.sessions[address] for address in addresses]
+        if not sessions:
+            return None
+        self.group_id += 1
+        group_id = f"g{self.group_id}"
+        frame = f"#{group_id} {command}".encode()
+        waiters = [s.controller.expect((f"ACK:{group_id}:", f"NAK:{group_id}:")) for s in sessions]
+        barrier = threading.Barrier(len(sessions))
+
+        def send(session):
+            try:
+                barrier.wait(timeout)
+            except threading.BrokenBarrierError:
+                pass    # a sender thread came up late: send anyway, the spread shows it
+            sent = now_us()
+            return sent if session.controller.send_raw(frame) else None
+
+        with ThreadPoolExecutor(max_workers=len(sessions), thread_name_prefix='group') as pool:
+            sent = list(pool.map(send, sessions))
+
+        deadline = time.monotonic() + timeout
+        acks = {}
+        for session, waiter, sent_us in zip(sessions, waiters, sent):
+            reply = session.controller.wait_reply(waiter, 0 if sent_us is None else
+                                                  max(0.0, deadline - time.monotonic()))
+            arrival = None
+            if reply and reply[0].startswith("ACK:"):
+                arrival = session.controller.bridge_to_local(int(reply[0].rsplit(":", 1)[1]))
+            acks[session.address] = GroupAck(sent_us, arrival[0] if arrival else None,
+                                             arrival[1] if arrival else None,
+                                             reply[1] if reply else None, reply[0] if reply else None)
+        result = self._group_result(command, group_id, acks)
+        self.group_results.append(result)
+        logger.info(describe_group_result(result))
+        return result
+
+    @staticmethod
+    def _group_result(command, group_id, acks):
+        sent = [a.sent_us for a in acks.values() if a.sent_us is not None]
+        arrivals = [a for a in acks.values() if a.arrival_us is not None]
+        arrival_spread = error = None
+        if len(arrivals) == len(acks):
+            arrival_spread = max(a.arrival_us for a in arrivals) - min(a.arrival_us for a in arrivals)
+            error = max(a.arrival_error_us for a in arrivals)
+        return GroupResult(command, group_id, acks, max(sent) - min(sent) if sent else None,
+                           arrival_spread, error)
+
+    def disconnect_all(self):
+        for session in list(self.sessions.values()):
+            session.close()
+
+
+def describe_group_result(result):
+    acked = sum(1 for a in result.acks.values() if a.reply and a.reply.startswith("ACK:"))
+    text = f"group {result.command!r} ({result.id}): {acked}/{len(result.acks)} acked"
+    if result.send_spread_us is not None:
+        text += f", send spread {result.send_spread_us / 1000:.3f} ms"
+    if result.arrival_spread_us is not None:
+        text += f", arrival spread {result.arrival_spread_us / 1000:.3f} ms (+-{result.arrival_error_us / 1000:.3f})"
+    else:
+        text += ", arrival spread unknown (not all acked or clocks not synced yet)"
+    return text
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Find drones and bring up several links at once")
+    parser.add_argument("--scan-seconds", type=float, default=SCAN_SECONDS)
+    parser.add_argument("--connect", action="append", metavar="ADDRESS",
+                        help="connect these drones instead of the scan results, may be repeated")
+    parser.add_argument("--scan-only", action="store_true", help="list the drones in range and exit")
+    parser.add_argument("--group", action="append", metavar="COMMAND",
+                        help="after connecting, send this command to all drones together, may be repeated")
+    parser.add_argument("--group-interval", type=float, default=1.0, help="seconds between group commands")
+    return parser.parse_args()
+
+
+def main():
+    # imported here: drone_controller_pygatt itself imports this module
+    from drone_controller_pygatt import DroneController
+
+    args = parse_args()
+    fleet = FleetManager(lambda address: DroneController("ble", address))
+    if args.connect:
+        for address in args.connect:
+            fleet.add(address)
+    else:
+        results = scan(args.scan_seconds)
+        for r in results:
+            status = r.status or {}
+            print(f"{r.address}  {r.name or '?':<18} {r.rssi if r.rssi is not None else '?':>4} dBm  "
+                  f"state {','.join(status.get('state', [])) or '-'}  "
+                  f"errors {','.join(status.get('errors', [])) or '-'}  "
+                  f"base {status.get('base_thr', '?')}")
+        if not results:
+            print("No drones found")
+            return
+        if args.scan_only:
+            return
+        fleet.add_scan_results(results)
+
+    started = time.perf_counter()
+    results = fleet.connect_all()
+    total = time.perf_counter() - started
+    for address, ok in results.items():
+        session = fleet.sessions[address]
+        print(f"{address}: {'connected' if ok else 'FAILED'} in {session.connect_seconds:.2f} s")
+    slowest = max((s.connect_seconds for s in fleet.sessions.values()), default=0.0)
+    print(f"{len(results)} link(s) in {total:.2f} s (slowest single link {slowest:.2f} s)")
+    if args.group:
+        time.sleep(CLOCK_SYNC_WAIT)     # a few TSYNC exchanges for the arrival times
+        for command in args.group:
+            result = fleet.group_send(command)
+            if result:
+                print(describe_group_result(result))
+            time.sleep(args.group_interval)
+    fleet.disconnect_all()
+
+
+if __name__ == "__main__":
+    main()
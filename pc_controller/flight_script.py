@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Headless flight scripts for DroneController
+
+Runs a timed command script against an absolute monotonic schedule: every step has
+a fixed target time from the start, so a late send never pushes later steps back.
+The send-time error of every step is reported.
+
+Script format, one step per line (# starts a comment):
+
+    RUN
+    WAIT 3              # hold 3 s
+    UP x5 @0.2          # five UP commands, 200 ms apart
+    STOP @1             # next step 1 s after this one
+    STOP
+
+    CMD [xN] [@seconds] send CMD N times; @ is the time from each send to the next
+                        step (default 0, i.e. the next step goes out right after)
+    WAIT seconds        advance the schedule
+
+ESTOP/EMERGENCY are sent over the kill characteristic. With --onboard the whole
+script is uploaded to the bridge and run there against the Pi's clock, so step timing
+no longer depends on the link; STOP or Ctrl+C aborts it.
+
+    python3 flight_script.py --transport udp --host 192.168.1.20 test_flight.txt   # bridge run with --bind 0.0.0.0
+    python3 flight_script.py --onboard test_flight.txt
+"""
+
+import argparse
+import collections
+import json
+import logging
+import re
+import sys
+import time
+
+from drone_controller_pygatt import add_connection_args, controller_from_args
+
+logger = logging.getLogger(__name__)
+
+START_DELAY = 0.2       # seconds from "go" to the first step
+SPIN_TIME = 0.002       # busy-wait the last 2 ms before a step instead of sleeping
+LATE_TOLERANCE = 0.005  # steps later than this are flagged in the report
+ONBOARD_MARGIN = 5.0    # seconds past the last step to wait for the bridge's report
+
+Step = collections.namedtuple("Step", "offset command line")
+StepResult = collections.namedtuple("StepResult", "step target sent error duration ok")
+
+
+class ScriptError(ValueError):
+    pass
+
+
+def parse_script(text):
+    """Script text -> [Step], offsets in seconds from the start"""
+    steps = []
+    offset = 0.0
+    for line_no, raw in enumerate(text.splitlines(), 1):
+        words = raw.split("#", 1)[0].split()
+        if not words:
+            continue
+        if words[0].upper() == "WAIT":
+            if len(words) != 2:
+                raise ScriptError(f"line {line_no}: WAIT takes one duration in seconds")
+            offset += _seconds(words[1], line_no)
+            continue
+
+        repeat, interval = 1, 0.0
+        while len(words) > 1 and re.fullmatch(r"x\d+|@[\d.]+", words[-1]):
+            token = words.pop()
+            if token[0] == "x":
+                repeat = int(token[1:])
+            else:
+                interval = _seconds(token[1:], line_no)
+        if repeat < 1:
+            raise ScriptError(f"line {line_no}: repeat count must be at least 1")
+        command = " ".join(words)
+        for _ in range(repeat):
+            steps.append(Step(offset, command, line_no))
+            offset += interval
+    return steps
+
+
+def _seconds(text, line_no):
+    try:
+        value = float(text)
+    except ValueError:
+        raise ScriptError(f"line {line_no}: bad duration {text!r}") from None
+    if value < 0:
+        raise ScriptError(f"line {line_no}: negative duration")
+    return value
+
+
+class CommandScheduler:
+    """Sends steps at start + offset; lateness of one step does not shift the next"""
+
+    def __init__(self, controller, clock=time.monotonic, spin=SPIN_TIME):
+        self.controller = controller
+        self.clock = clock
+        self.spin = spin
+
+    def run(self, steps, start=None):
+        """Returns [StepResult]; times in seconds relative to `start`"""
+        if start is None:
+            start = self.clock() + START_DELAY
+        results = []
+        for step in steps:
+            target = start + step.offset
+            self._wait_until(target)
+            sent = self.clock()
+            ok = self._send(step.command)
+            done = self.clock()
+            results.append(StepResult(step, target - start, sent - start, sent - target, done - sent, ok))
+        return results
+
+    def _wait_until(self, target):
+        while True:
+            remaining = target - self.clock()
+            if remaining <= 0:
+                return
+            if remaining > self.spin:
+                time.sleep(remaining - self.spin)
+
+    def _send(self, command):
+        if command.upper() in ("ESTOP", "EMERGENCY"):
+            return self.controller.send_emergency_stop()
+        return self.controller.send_command(command)
+
+
+def summarize(results):
+    errors = sorted(abs(r.error) for r in results)
+    if not errors:
+        return {"steps": 0}
+    return {
+        "steps": len(results),
+        "failed": sum(1 for r in results if not r.ok),
+        "late": sum(1 for r in results if r.error > LATE_TOLERANCE),
+        "mean_error_ms": sum(errors) / len(errors) * 1000,
+        "p95_error_ms": errors[min(len(errors) - 1, int(len(errors) * 0.95))] * 1000,
+        "max_error_ms": errors[-1] * 1000,
+    }
+
+
+def print_report(results):
+    print(f"{'line':>4}  {'target':>9}  {'error':>9}  {'send':>8}  command")
+    for r in results:
+        flag = "" if r.ok else "  FAILED"
+        if r.error > LATE_TOLERANCE:
+            flag += "  LATE"
+        print(f"{r.step.line:>4}  {r.target * 1000:7.1f}ms  {r.error * 1000:+7.3f}ms  "
+              f"{r.duration * 1000:6.2f}ms  {r.step.command}{flag}")
+    summary = summarize(results)
+    if summary["steps"]:
+        print(f"{summary['steps']} steps, {summary['failed']} failed, {summary['late']} late; "
+              f"send error mean {summary['mean_error_ms']:.3f} ms, p95 {summary['p95_error_ms']:.3f} ms, "
+              f"max {summary['max_error_ms']:.3f} ms")
+    return summary
+
+
+def run_onboard(controller, steps):
+    """Run the script on the bridge. Returns the exit status"""
+    try:
+        if not controller.upload_mission([(step.offset, step.command) for step in steps]):
+            print("Mission upload failed")
+            return 1
+        timeout = (steps[-1].offset if steps else 0.0) + ONBOARD_MARGIN
+        result = controller.run_mission(timeout)
+    except KeyboardInterrupt:
+        logger.warning("Script interrupted, sending STOP")
+        controller.send_command("STOP")
+        return 130
+    finally:
+        controller.disconnect()
+    print(result or "No mission report from the bridge")
+    # MISSION:DONE:<steps>:<mean error us>:<max error us>
+    return 0 if result and result.startswith("MISSION:DONE") else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a timed command script without the GUI")
+    add_connection_args(parser)
+    parser.add_argument("script", help="script file, - for stdin")
+    parser.add_argument("--json", help="write the per-step report to this file")
+    parser.add_argument("--dry-run", action="store_true", help="print the schedule and exit")
+    parser.add_argument("--onboard", action="store_true",
+                        help="upload the script and run it on the bridge's mission executor")
+    args = parser.parse_args()
+
+    text = sys.stdin.read() if args.script == "-" else open(args.script).read()
+    try:
+        steps = parse_script(text)
+    except ScriptError as e:
+        print(f"Script error: {e}")
+        sys.exit(2)
+    if args.dry_run:
+        for step in steps:
+            print(f"{step.offset:8.3f}s  {step.command}")
+        return
+
+    controller = controller_from_args(args)
+    if controller is None or not controller.connect_to_device():
+        sys.exit(1)
+    if args.onboard:
+        sys.exit(run_onboard(controller, steps))
+    scheduler = CommandScheduler(controller)
+    try:
+        results = scheduler.run(steps)
+    except KeyboardInterrupt:
+        # leave the drone in the landing hold rather than mid-script
+        logger.warning("Script interrupted, sending STOP")
+        controller.send_command("STOP")
+        controller.disconnect()
+        sys.exit(130)
+    controller.disconnect()
+
+    summary = print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"summary": summary,
+                       "steps": [{"line": r.step.line, "command": r.step.command,
+                                  "target_s": r.target, "error_s": r.error,
+                                  "send_s": r.duration, "ok": r.ok} for r in results]},
+                      f, indent=2)
+    if summary.get("failed"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Network devices for DroneController
+
+Client side of the bridge's UDP and WebSocket servers. Each device object offers the
+subset of the pygatt device interface DroneController uses (char_write, char_read,
+subscribe, disconnect), so the controller works the same over BLE and the network.
+"""
+
+import base64
+import logging
+import os
+import socket
+import struct
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_UDP_PORT = 9750
+DEFAULT_WS_PORT = 9751
+READ_TIMEOUT = 2.0
+
+
+class SocketDevice:
+    """
+    Common part of the network devices.
+    write_overrides: {uuid: payload} sent instead of the written value (e.g. kill -> b"ESTOP")
+    write_prefixes:  {uuid: prefix} sent in front of the written value (e.g. mission chunks)
+    read_requests:   {uuid: (request, reply_prefix)} used to emulate characteristic reads
+    """
+
+    def __init__(self, write_overrides=None, write_prefixes=None, read_requests=None):
+        self.write_overrides = write_overrides or {}
+        self.write_prefixes = write_prefixes or {}
+        self.read_requests = read_requests or {}
+        self.callbacks = []
+        self.pending_reads = {}
+        self.closed = threading.Event()
+
+    def char_write(self, uuid, value, wait_for_response=False):
+        if uuid in self.write_prefixes:
+            payload = self.write_prefixes[uuid] + bytes(value)
+        else:
+            payload = self.write_overrides.get(uuid, value)
+        self._send(bytes(payload))
+
+    def char_read(self, uuid, timeout=READ_TIMEOUT):
+        if uuid not in self.read_requests:
+            raise ValueError(f"Characteristic {uuid} cannot be read over this transport")
+        request, prefix = self.read_requests[uuid]
+        waiter = [threading.Event(), None]
+        self.pending_reads[prefix] = waiter
+        self._send(request)
+        if not waiter[0].wait(timeout):
+            self.pending_reads.pop(prefix, None)
+            raise TimeoutError(f"No reply to {request!r}")
+        return bytearray(waiter[1][len(prefix):])
+
+    def subscribe(self, uuid, callback=None, indication=False):
+        # one stream for every characteristic: a callback subscribed twice is called once
+        if callback and callback not in self.callbacks:
+            self.callbacks.append(callback)
+
+    def disconnect(self):
+        self.closed.set()
+
+    def _dispatch(self, data: bytes):
+        for prefix, waiter in list(self.pending_reads.items()):
+            if data.startswith(prefix):
+                del self.pending_reads[prefix]
+                waiter[1] = data
+                waiter[0].set()
+                return
+        for callback in self.callbacks:
+            callback(None, bytearray(data))
+
+    def _send(self, data: bytes):
+        raise NotImplementedError
+
+
+class UdpDevice(SocketDevice):
+    """One datagram per command/notification"""
+
+    def __init__(self, host, port=DEFAULT_UDP_PORT, **kwargs):
+        super().__init__(**kwargs)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.connect((host, port))
+        self.sock.settimeout(0.5)
+        self.thread = threading.Thread(target=self._receive_loop, daemon=True)
+        self.thread.start()
+
+    def _send(self, data: bytes):
+        self.sock.send(data)
+
+    def _receive_loop(self):
+        while not self.closed.is_set():
+            try:
+                data = self.sock.recv(4096)
+            except socket.timeout:
+                continue
+            except OSError as e:
+                # ICMP port unreachable while the bridge is not up yet
+                logger.debug(f"UDP receive error: {e}")
+                continue
+            self._dispatch(data)
+
+    def disconnect(self):
+        super().disconnect()
+        self.sock.close()
+
+
+class WebSocketDevice(SocketDevice):
+    """Minimal RFC 6455 client: masked binary frames out, one message per notification in"""
+
+    def __init__(self, host, port=DEFAULT_WS_PORT, **kwargs):
+        super().__init__(**kwargs)
+        self.sock = socket.create_connection((host, port), timeout=5.0)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.send_lock = threading.Lock()
+        self._handshake(host, port)
+        self.sock.settimeout(None)
+        self.thread = threading.Thread(target=self._receive_loop, daemon=True)
+        self.thread.start()
+
+    def _handshake(self, host, port):
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        request = (f"GET / HTTP/1.1\r\nHost: {host}:{port}\r\n"
+                   "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                   f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n")
+        self.sock.sendall(request.encode("ascii"))
+        response = b""
+        while b"\r\n\r\n" not in response:
+            chunk = self.sock.recv(1024)
+            if not chunk:
+                raise ConnectionError("WebSocket handshake: connection closed")
+            response += chunk
+        header, self.buffer = response.split(b"\r\n\r\n", 1)
+        if b" 101 " not in header.split(b"\r\n", 1)[0]:
+            raise ConnectionError(f"WebSocket handshake failed: {header[:40]!r}")
+
+    def _send(self, data: bytes):
+        self._send_frame(0x2, data)
+
+    def _send_frame(self, opcode, data):
+        mask = os.urandom(4)
+        length = len(data)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, 0x80 | length)
+        elif length < 65536:
+            header = struct.pack("!BBH", 0x80 | opcode, 0x80 | 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 0x80 | 127, length)
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+        with self.send_lock:
+            self.sock.sendall(header + mask + masked)
+
+    def _recv_exact(self, n):
+        while len(self.buffer) < n:
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                raise ConnectionError("connection closed")
+            self.buffer += chunk
+        data, self.buffer = self.buffer[:n], self.buffer[n:]
+        return data
+
+    def _receive_loop(self):
+        try:
+            while not self.closed.is_set():
+                b0, b1 = self._recv_exact(2)
+                opcode, length = b0 & 0x0F, b1 & 0x7F
+                if length == 126:
+                    length = struct.unpack("!H", self._recv_exact(2))[0]
+                elif length == 127:
+                    length = struct.unpack("!Q", self._recv_exact(8))[0]
+                payload = self._recv_exact(length)
+                if opcode == 0x8:
+                    break
+                if opcode == 0x9:
+                    self._send_frame(0xA, payload)
+                elif opcode in (0x1, 0x2):
+                    self._dispatch(payload)
+        except (OSError, ConnectionError) as e:
+            if not self.closed.is_set():
+                logger.warning(f"WebSocket receive error: {e}")
+        self.closed.set()
+
+    def disconnect(self):
+        if not self.closed.is_set():
+            try:
+                self._send_frame(0x8, struct.pack("!H", 1000))
+            except OSError:
+                pass
+        super().disconnect()
+        self.sock.close()
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Simulated bridge peripheral for DroneController
+
+In-process stand-in for the Pi bridge behind the device interface DroneController
+uses (char_write, char_read, subscribe, disconnect), like network_devices.py. The
+link has configurable latency, jitter, loss and dropouts, and a telemetry generator
+sends notifications at hundreds of Hz through the bridge's codec, so the controller
+and the GUI can be load tested without a drone, adapter or bridge.
+
+All link events run on one scheduler thread, which also calls the notification
+callbacks, like pygatt's receive thread. Each direction stays in order, as on a
+BLE link, however large the jitter.
+
+    python3 drone_controller_pygatt.py --transport sim --sim-telemetry-hz 400 --sim-loss 0.02
+"""
+
+import collections
+import heapq
+import itertools
+import logging
+import math
+import random
+import threading
+import time
+import zlib
+
+from clock_sync import now_us
+from drone_controller_pygatt import (COMMAND_UUID, KILL_UUID, MISSION_UUID, PARAM_DEFAULTS,
+                                     PARAM_FIELDS, PARAMS_UUID, STATUS_UUID, TELEMETRY_UUID, param_digest)
+from telemetry_codec import TelemetryEncoder, clamp_sample
+
+logger = logging.getLogger(__name__)
+
+WRITE_TIMEOUT = 1.0     # seconds a write with response waits before failing, like gatttool
+
+
+class SimConfig(collections.namedtuple("SimConfig", (
+        "latency", "jitter", "submit_cost", "loss", "notify_loss", "telemetry_hz", "notify_batch",
+        "mtu", "dropout_interval", "dropout_duration", "clock_offset_us", "seed"))):
+    """
+    latency, jitter:    one-way link delay in seconds, plus uniform 0..jitter
+    submit_cost:        seconds a char_write blocks the caller (gatttool round trip)
+    loss, notify_loss:  drop probability of a write / a notification
+    telemetry_hz:       telemetry samples per second (0 = off), packed at `mtu`
+    notify_batch:       seconds samples may wait to share a notification (0 = one each)
+    dropout_interval:   mean seconds between link dropouts (0 = never)
+    dropout_duration:   seconds the link stays down
+    clock_offset_us:    bridge clock minus this PC's clock, for the clock sync
+    """
+
+
+SimConfig.__new__.__defaults__ = (0.008, 0.004, 0.0002, 0.0, 0.0, 200.0, 0.0,
+                                  247, 0.0, 1.0, 250_000, None)
+
+
+class SimulatedDevice:
+    def __init__(self, config=None):
+        self.config = config or SimConfig()
+        self.rng = random.Random(self.config.seed)
+        self.mtu = self.config.mtu
+        self.callbacks = collections.defaultdict(list)     # uuid -> notification callbacks
+        self.events = []            # heap of (due, seq, function, args)
+        self.event_seq = itertools.count()
+        self.condition = threading.Condition()
+        self.closed = threading.Event()
+        self.link_up = True
+        self.last_due = {"up": 0.0, "down": 0.0}
+        self.stats = collections.Counter()
+        # bridge side
+        self.parameters = dict(PARAM_DEFAULTS)
+        self.param_version = 0
+        self.mission = bytearray()
+        self.mission_steps = 0
+        self.encoder = TelemetryEncoder(max_payload=self.mtu - 3, max_latency=self.config.notify_batch)
+        self.next_sample = None
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        if self.config.telemetry_hz:
+            self.next_sample = time.monotonic()
+            self._schedule(0.0, self._telemetry)
+        if self.config.dropout_interval:
+            self._schedule(self.rng.expovariate(1.0 / self.config.dropout_interval), self._drop)
+
+    # --- Device interface ---
+    def char_write(self, uuid, value, wait_for_response=False):
+        if self.closed.is_set() or not self.link_up:
+            self.stats["write_errors"] += 1
+            raise ConnectionError("simulated link down")
+        if self.config.submit_cost:
+            time.sleep(self.config.submit_cost)
+        self.stats["writes"] += 1
+        done = threading.Event() if wait_for_response else None
+        if self.rng.random() < self.config.loss:
+            self.stats["writes_lost"] += 1
+        else:
+            self._transmit("up", self._receive, uuid, bytes(value), done)
+        if done and not done.wait(WRITE_TIMEOUT):
+            raise TimeoutError("no write response")
+
+    def char_read(self, uuid, timeout=WRITE_TIMEOUT):
+        if uuid != PARAMS_UUID:
+            raise ValueError(f"Characteristic {uuid} cannot be read on the simulated device")
+        if self.closed.is_set() or not self.link_up:
+            raise ConnectionError("simulated link down")
+        reply = [threading.Event(), None]
+        self._transmit("up", self._read, reply)
+        if not reply[0].wait(timeout):
+            raise TimeoutError("no read response")
+        return bytearray(reply[1])
+
+    def subscribe(self, uuid, callback=None, indication=False):
+        if callback:
+            self.callbacks[uuid].append(callback)
+            if uuid == TELEMETRY_UUID:
+                self.encoder.request_keyframe()
+
+    def disconnect(self):
+        self.closed.set()
+        with self.condition:
+            self.condition.notify()
+
+    # --- Link ---
+    def _schedule(self, delay, function, *args):
+        self._schedule_at(time.monotonic() + delay, function, *args)
+
+    def _schedule_at(self, due, function, *args):
+        with self.condition:
+            heapq.heappush(self.events, (due, next(self.event_seq), function, args))
+            self.condition.notify()
+
+    def _transmit(self, direction, function, *args):
+        """Deliver after the link delay, never before an earlier packet in the same direction"""
+        with self.condition:
+            due = max(time.monotonic() + self.config.latency + self.rng.uniform(0, self.config.jitter),
+                      self.last_due[direction])
+            self.last_due[direction] = due
+            self._schedule_at(due, function, *args)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.closed.is_set():
+                    wait = self.events[0][0] - time.monotonic() if self.events else None
+                    if wait is not None and wait <= 0:
+                        break
+                    self.condition.wait(wait)
+                if self.closed.is_set():
+                    return
+                _, _, function, args = heapq.heappop(self.events)
+            try:
+                function(*args)
+            except Exception as e:
+                logger.error(f"Simulated device error in {function.__name__}: {e}")
+
+    def _drop(self):
+        self.link_up = False
+        self.stats["dropouts"] += 1
+        logger.info(f"Simulated link down for {self.config.dropout_duration:g} s")
+        self._schedule(self.config.dropout_duration, self._restore)
+
+    def _restore(self):
+        self.link_up = True
+        self.encoder.request_keyframe()
+        self._schedule(self.rng.expovariate(1.0 / self.config.dropout_interval), self._drop)
+
+    def _notify(self, data, uuid=STATUS_UUID):
+        if not self.callbacks[uuid]:
+            return
+        if not self.link_up or self.rng.random() < self.config.notify_loss:
+            self.stats["notifications_lost"] += 1
+            return
+        self._transmit("down", self._deliver, data, uuid)
+
+    def _deliver(self, data, uuid):
+        if not self.link_up:
+            self.stats["notifications_lost"] += 1
+            return
+        self.stats["notifications"] += 1
+        for callback in self.callbacks[uuid]:
+            callback(None, bytearray(data))
+
+    # --- Bridge ---
+    def bridge_us(self):
+        return now_us() + self.config.clock_offset_us
+
+    def _read(self, reply):
+        reply[1] = self._mirror()
+        self._transmit("down", reply[0].set)
+
+    def _receive(self, uuid, data, done):
+        if done:
+            self._transmit("down", done.set)
+        if uuid == KILL_UUID:
+            self.stats["estops"] += 1
+        elif uuid == MISSION_UUID:
+            offset = int.from_bytes(data[:2], "little")
+            del self.mission[offset:]
+            self.mission += data[2:]
+        elif uuid == COMMAND_UUID:
+            self._command(data.decode("utf-8", "replace"), self.bridge_us())
+
+    def _command(self, text, received_us):
+        self.stats["commands"] += 1
+        command_id = None
+        if text.startswith("#"):
+            command_id, _, text = text[1:].partition(" ")
+        if text.startswith("TSYNC "):
+            self._notify(f"TSYNC:{text[6:]}:{received_us}:{self.bridge_us()}::".encode())
+            return
+        if text == "HB":
+            return
+        if text == "PARAMS":
+            self._notify(b"PARAMS:" + self._mirror())
+            return
+        if text.startswith("MISSION"):
+            self._notify(self._mission(text.split()[1:]).encode())
+            return
+        self._apply_parameter(text)
+        self._notify(f"ACK:{command_id}:{received_us}".encode() if command_id is not None
+                     else f"CMD_RX:{text[:15]}".encode())
+
+    def _mission(self, args):
+        if args[:1] == ["LOAD"] and len(args) == 3:
+            data = bytes(self.mission[:int(args[1])])
+            if len(data) != int(args[1]) or zlib.crc32(data) != int(args[2], 16):
+                return "MISSION:ERR:Checksum"
+            lines = data.decode("ascii").splitlines()
+            if not lines:
+                return "MISSION:ERR:Empty"
+            self.mission_steps = len(lines)
+            return f"MISSION:LOADED:{len(lines)}:{int(lines[-1].split()[0]) // 1000}"
+        if args[:1] == ["START"]:
+            if not self.mission_steps:
+                return "MISSION:ERR:Empty"
+            last_us = int(bytes(self.mission).decode("ascii").splitlines()[-1].split()[0])
+            self._schedule(last_us / 1e6, self._notify, f"MISSION:DONE:{self.mission_steps}:0:0".encode())
+            return f"MISSION:STARTED:{self.mission_steps}"
+        return "MISSION:ERR:Usage"
+
+    def _apply_parameter(self, text):
+        """Mirror the parameter commands DroneController sends (parameter_delta_commands)"""
+        parts = text.split()
+        name = parts[0]
+        try:
+            if name.startswith("PID_") and len(parts) == 4:
+                axis = name[4:].lower()
+                for gain, value in zip(("kp", "ki", "kd"), parts[1:]):
+                    self.parameters[f"{axis}_{gain}"] = float(value)
+            elif name.startswith("SET_") and len(parts) == 2 and name[4:].lower() in self.parameters:
+                self.parameters[name[4:].lower()] = float(parts[1])
+            elif name.startswith("OFFSET") and len(parts) == 2:
+                self.parameters[name.lower()] = int(parts[1])
+            elif name in ("D_GYRO", "D_ERROR"):
+                self.parameters["d_gyro"] = int(name == "D_GYRO")
+            else:
+                return
+        except (KeyError, ValueError):
+            return
+        self.param_version += 1
+
+    def _mirror(self):
+        fields = ";".join(f"{name}={self.parameters[name]:g}" for name in PARAM_FIELDS)
+        return f"v={self.param_version};h={param_digest(self.parameters):08x};{fields}".encode("ascii")
+
+    def _telemetry(self):
+        period = 1.0 / self.config.telemetry_hz
+        if self.callbacks[TELEMETRY_UUID] and self.link_up:
+            t = self.bridge_us() / 1e6
+            roll = 40 * math.sin(2 * math.pi * 0.7 * t) + self.rng.gauss(0, 4)
+            pitch = 30 * math.sin(2 * math.pi * 0.5 * t + 1) + self.rng.gauss(0, 4)
+            pwm = [1250 - 0.5 * roll, 1250 + 0.5 * roll, 1250 - 0.5 * roll, 1250 + 0.5 * roll]
+            sample = clamp_sample(pwm + [roll, pitch] + [self.rng.gauss(0, 15) for _ in range(3)])
+            packets = self.encoder.add(sample, t)
+            if self.encoder.last_keyframe == t:
+                self._notify(f"TKEY:{self.encoder.keyframe_seq}:{self.encoder.previous_ms}".encode(),
+                             TELEMETRY_UUID)
+            for packet in packets:
+                self._notify(packet, TELEMETRY_UUID)
+        # absolute schedule; after a stall the missed samples are skipped, not bunched
+        self.next_sample = max(self.next_sample + period, time.monotonic())
+        self._schedule_at(self.next_sample, self._telemetry)
@@ -0,0 +1,11 @@
+#!/usr/bin/env python3
+"""
+Telemetry stream encoding: the bridge's rasberry_pi/telemetry_codec.py, loaded from
+there so the decoder here cannot drift from the encoder on the Pi
+"""
+
+import os
+
+_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "rasberry_pi", "telemetry_codec.py")
+with open(_SOURCE) as _file:
+    exec(compile(_file.read(), _SOURCE, "exec"))
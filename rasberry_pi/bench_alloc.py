@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Command hot path allocation benchmark
+
+Feeds a mix of flight commands (plain text and Base64, as the clients send them)
+through process_command() with a null I2C bus and a notifying status characteristic,
+running the queued idle callbacks after each command like the main loop would.
+Reports per command: memory blocks left allocated, peak temporary bytes while it
+is handled, GC-tracked objects left behind, gen-0 collections and time.
+--uncached clears the payload/command/status caches before every command, which
+shows what the path costs when nothing is reused.
+
+    python3 bench_alloc.py --commands 20000
+"""
+
+import argparse
+import base64
+import gc
+import logging
+import sys
+import time
+import tracemalloc
+import types
+
+import drone_ble_server as server
+from i2c_session import I2CSession, mock_ack
+
+COMMANDS = ("RUN", "UP", "UP", "DOWN", "FWD", "BACK", "LEFT", "RIGHT", "STOP", "SET_SCALE 0.05")
+
+
+class NullBus:
+    def write_read(self, addr, data, length):
+        return mock_ack(data)
+
+    def read_i2c_block_data(self, addr, reg, length):
+        return [0] * length
+
+
+class StatusSink:
+    """Notifying status characteristic whose signal goes nowhere"""
+    notifying = True
+
+    def PropertiesChanged(self, interface, changed, invalidated):
+        pass
+
+
+class NullSession:
+    id = 'bench'
+
+    def send(self, data):
+        pass
+
+
+class IdleQueue:
+    """GLib.idle_add stand-in; run() empties it like one main loop iteration"""
+
+    def __init__(self):
+        self.pending = []
+
+    def idle_add(self, function, *args):
+        self.pending.append((function, args))
+        return 1
+
+    def run(self):
+        while self.pending:
+            function, args = self.pending.pop()
+            function(*args)
+
+
+def payloads():
+    # the iPhone app sends Base64, the PC controller and network clients plain text
+    return [c.encode() for c in COMMANDS] + [base64.b64encode(c.encode()) for c in COMMANDS]
+
+
+def clear_caches():
+    server._decoded_payloads.clear()
+    server._prepared_commands.clear()
+    server._status_values.clear()
+
+
+def run(payload_list, count, idle, clear):
+    session = NullSession()
+    for i in range(count):
+        if clear:
+            clear_caches()
+        server.process_command(payload_list[i % len(payload_list)], session)
+        idle.run()
+
+
+def measure(count, clear):
+    idle = IdleQueue()
+    server.GLib = types.SimpleNamespace(idle_add=idle.idle_add, SOURCE_REMOVE=False)
+    payload_list = payloads()
+    run(payload_list, 1000, idle, clear)       # warm the caches and the mirror
+
+    gc.collect()
+    gc.disable()
+    blocks = sys.getallocatedblocks()
+    tracked = gc.get_count()[0]
+    started = time.perf_counter()
+    run(payload_list, count, idle, clear)
+    elapsed = time.perf_counter() - started
+    tracked = gc.get_count()[0] - tracked
+    blocks = sys.getallocatedblocks() - blocks
+    gc.enable()
+
+    collections = [0]
+
+    def on_gc(phase, info):
+        if phase == 'start' and info['generation'] == 0:
+            collections[0] += 1
+
+    gc.callbacks.append(on_gc)
+    run(payload_list, count, idle, clear)
+    gc.callbacks.remove(on_gc)
+
+    tracemalloc.start()
+    peak = 0
+    for i in range(min(count, 2000)):
+        if clear:
+            clear_caches()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        run([payload_list[i % len(payload_list)]], 1, idle, False)
+        peak += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return {
+        'blocks': blocks / count,
+        'tracked': tracked / count,
+        'peak_bytes': peak / min(count, 2000),
+        'gen0_per_10k': collections[0] * 10000 / count,
+        'us': elapsed / count * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Allocations per command on the bridge's command path")
+    parser.add_argument("--commands", type=int, default=20000)
+    parser.add_argument("--uncached", action="store_true", help="also run with the caches cleared per command")
+    parser.add_argument("--max-blocks", type=float, default=0.1,
+                        help="fail if more memory blocks than this stay allocated per command")
+    args = parser.parse_args()
+
+    logging.getLogger(server.__name__).setLevel(logging.WARNING)
+    server.bus = I2CSession(NullBus)
+    server.status_characteristic_obj = StatusSink()
+    server.METRICS_PORT = 0
+    # the forwarding path itself: with the per-client rate limits most commands would be coalesced
+    server.ADMISSION_LIMITS.clear()
+
+    modes = [('cached', False)] + ([('uncached', True)] if args.uncached else [])
+    results = {}
+    for name, clear in modes:
+        r = results[name] = measure(args.commands, clear)
+        print(f"{name:<9} {r['blocks']:6.3f} blocks left/command  {r['peak_bytes']:7.0f} B peak temporary  "
+              f"{r['tracked']:6.3f} GC objects/command  {r['gen0_per_10k']:5.1f} gen-0 GCs/10k  "
+              f"{r['us']:6.2f} us/command")
+    if results['cached']['blocks'] > args.max_blocks:
+        print(f"FAIL: {results['cached']['blocks']:.3f} blocks per command stay allocated "
+              f"(limit {args.max_blocks})")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Emergency stop latency benchmark
+
+Saturates the bridge's I2C path with normal commands from several threads and
+measures the time from a kill request to the kill transaction completing on the bus,
+for the fast path (emergency_stop_all) and for the normal command path.
+The bus is simulated with a fixed time per transaction, so this runs anywhere the
+bridge's Python dependencies are installed:
+
+    python3 bench_estop.py --senders 4 --bus-time-ms 0.5 --trials 500
+"""
+
+import argparse
+import logging
+import random
+import statistics
+import sys
+import threading
+import time
+
+import drone_ble_server as server
+from i2c_session import FRAME_HEADER, I2CSession, mock_ack
+
+
+class TimedBus:
+    """Mock I2C bus that is busy for a fixed time per transaction"""
+
+    def __init__(self, bus_time):
+        self.bus_time = bus_time
+        self.kill_done_at = None
+        self.transactions = 0
+
+    def write_read(self, addr, data, length):
+        # sleep releases the GIL like the real ioctl does
+        time.sleep(self.bus_time)
+        self.transactions += 1
+        if data[FRAME_HEADER:] == server.KILL_PAYLOAD:
+            self.kill_done_at = time.perf_counter()
+        return mock_ack(data)
+
+    def read_i2c_block_data(self, addr, reg, length):
+        time.sleep(self.bus_time)
+        return [0] * length
+
+    def close(self):
+        pass
+
+
+def flood(stop_event):
+    commands = ("UP", "DOWN", "FWD", "BACK", "SET_SCALE 0.05")
+    i = 0
+    while not stop_event.is_set():
+        server.write_command_to_arduino(commands[i % len(commands)])
+        i += 1
+
+
+def measure(kill, bus, trials, timeout):
+    """Latencies in ms, plus the number of trials that did not finish within `timeout`
+    (measurement stops at the first one, the kill is still stuck behind the flood)"""
+    latencies = []
+    for _ in range(trials):
+        time.sleep(random.uniform(0.001, 0.005))
+        bus.kill_done_at = None
+        started = []
+
+        def run():
+            started.append(time.perf_counter())
+            kill()
+
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+        worker.join(timeout)
+        if worker.is_alive():
+            return latencies, 1
+        latencies.append((bus.kill_done_at - started[0]) * 1000.0)
+    return latencies, 0
+
+
+def summary(name, latencies, starved):
+    if starved:
+        print(f"{name:<14} starved: no completion within the timeout after {len(latencies)} trial(s)")
+        return float("inf")
+    ordered = sorted(latencies)
+    p99 = ordered[int(len(ordered) * 0.99) - 1]
+    print(f"{name:<14} mean {statistics.mean(ordered):6.3f} ms   p99 {p99:6.3f} ms   "
+          f"max {ordered[-1]:6.3f} ms")
+    return ordered[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emergency stop latency under saturated command load")
+    parser.add_argument("--senders", type=int, default=4, help="flooding threads")
+    parser.add_argument("--bus-time-ms", type=float, default=0.5, help="simulated time per I2C transaction")
+    parser.add_argument("--trials", type=int, default=500)
+    parser.add_argument("--timeout-ms", type=float, default=200.0, help="per-trial timeout")
+    parser.add_argument("--bound-ms", type=float, default=None,
+                        help="fail if the fast path max exceeds this "
+                             "(default: 2 transactions + GIL switch interval + 1 ms)")
+    args = parser.parse_args()
+
+    logging.getLogger(server.__name__).setLevel(logging.ERROR)
+    bus_time = args.bus_time_ms / 1000.0
+    # the kill waits for at most the transaction on the bus, then needs the GIL
+    default_bound = 2 * args.bus_time_ms + sys.getswitchinterval() * 1000.0 + 1.0
+    bound_ms = args.bound_ms if args.bound_ms is not None else default_bound
+    bus = TimedBus(bus_time)
+    server.bus = I2CSession(lambda: bus)
+
+    stop_event = threading.Event()
+    senders = [threading.Thread(target=flood, args=(stop_event,), daemon=True)
+               for _ in range(args.senders)]
+    for sender in senders:
+        sender.start()
+    time.sleep(0.2)
+
+    timeout = args.timeout_ms / 1000.0
+    try:
+        fast, fast_starved = measure(server.emergency_stop_all, bus, args.trials, timeout)
+        normal, normal_starved = measure(lambda: server.write_command_to_arduino("ESTOP"),
+                                         bus, args.trials, timeout)
+    finally:
+        stop_event.set()
+        for sender in senders:
+            sender.join()
+
+    print(f"{args.senders} senders, {args.bus_time_ms} ms per transaction, "
+          f"{bus.transactions} transactions total")
+    worst = summary("fast path", fast, fast_starved)
+    summary("command path", normal, normal_starved)
+    if worst > bound_ms:
+        print(f"FAIL: fast path worst case {worst:.3f} ms exceeds bound {bound_ms:.3f} ms")
+        raise SystemExit(1)
+    print(f"OK: fast path worst case within {bound_ms:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Sensor fusion benchmark
+
+Feeds synthetic REG_IMU blocks (imu_fusion.MockImu: a roll/pitch oscillation with
+accelerometer noise and gyro bias) through FusionEngine with each estimator, and
+reports the cost per sample, the sample rate one core could sustain and the
+roll/pitch error against the true attitude. 'accel' is the firmware's current
+atan2 of the accelerometer alone, for comparison.
+
+    python3 bench_fusion.py --seconds 60 --rate 250
+"""
+
+import argparse
+import math
+import time
+
+from imu_fusion import ACCEL_LSB_G, ESTIMATORS, IMU_BATCH, IMU_SAMPLE, FusionEngine, MockImu, accel_angles
+
+
+def blocks_for(seconds, rate):
+    imu = MockImu(rate_hz=rate)
+    blocks, truths = [], []
+    for _ in range(int(seconds * rate) // IMU_BATCH):
+        blocks.append(imu.block())
+        truths.append(imu.truth)
+    return blocks, truths
+
+
+def rms(errors):
+    return math.sqrt(sum(e * e for e in errors) / len(errors))
+
+
+def accel_only(blocks):
+    """Newest sample's accelerometer angles per block, as the firmware reports today"""
+    angles = []
+    offset = 2 + (IMU_BATCH - 1) * IMU_SAMPLE.size
+    for block in blocks:
+        _, ax, ay, az, *_ = IMU_SAMPLE.unpack_from(block, offset)
+        angles.append(accel_angles(ax * ACCEL_LSB_G, ay * ACCEL_LSB_G, az * ACCEL_LSB_G))
+    return angles
+
+
+def run(engine, blocks):
+    angles = []
+    started = time.perf_counter()
+    for block in blocks:
+        engine.feed(block)
+        angles.append((engine.roll, engine.pitch))
+    return angles, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IMU fusion cost and accuracy")
+    parser.add_argument("--seconds", type=float, default=60.0, help="length of the synthetic trace")
+    parser.add_argument("--rate", type=float, default=250.0, help="IMU samples per second")
+    args = parser.parse_args()
+
+    blocks, truths = blocks_for(args.seconds, args.rate)
+    samples = len(blocks) * IMU_BATCH
+    skip = int(2.0 * args.rate / IMU_BATCH)     # let the estimators converge
+    print(f"{samples} samples at {args.rate:g} Hz ({IMU_BATCH} per block)")
+
+    results = [("accel", accel_only(blocks), None)]
+    for name in ESTIMATORS:
+        angles, elapsed = run(FusionEngine(name), blocks)
+        results.append((name, angles, elapsed))
+
+    for name, angles, elapsed in results:
+        roll = rms([a[0] - t[0] for a, t in zip(angles[skip:], truths[skip:])])
+        pitch = rms([a[1] - t[1] for a, t in zip(angles[skip:], truths[skip:])])
+        cost = ""
+        if elapsed is not None:
+            per_sample = elapsed / samples * 1e6
+            cost = (f"  {per_sample:5.1f} us/sample, {1e6 / per_sample:7.0f} samples/s per core, "
+                    f"{per_sample * args.rate / 1e4:4.1f}% of a core at {args.rate:g} Hz")
+        print(f"{name:<14} RMS error roll {roll:5.2f} deg, pitch {pitch:5.2f} deg{cost}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+I2C session benchmark on simulated noisy wiring
+
+Runs back-to-back command writes against a simulated bus where each transaction
+fails with a NACK (EREMOTEIO) at a given probability, once straight on the bus
+and once through I2CSession, and reports delivered commands and their rate.
+A second scenario unplugs the slave for a while: the session's circuit breaker
+should keep bus time spent on the dead slave low and pick it up again by itself.
+
+    python3 bench_i2c.py --error-rate 0.01 --error-rate 0.1 --seconds 2
+"""
+
+import argparse
+import errno
+import random
+import time
+
+from i2c_session import ACK_SIZE, I2CSession, command_frames, mock_ack
+
+ADDRESS = 0x08
+COMMAND = b"FWD"
+
+
+class NoisyBus:
+    """Busy for `bus_time` per transaction; fails at `error_rate`, always while `dead`"""
+
+    def __init__(self, bus_time, error_rate, seed=1):
+        self.bus_time = bus_time
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.dead = False
+        self.transactions = 0
+
+    def _transfer(self):
+        self.transactions += 1
+        end = time.perf_counter() + self.bus_time
+        while time.perf_counter() < end:
+            pass
+        if self.dead or self.rng.random() < self.error_rate:
+            raise OSError(errno.EREMOTEIO, "Remote I/O error")
+
+    def write_read(self, addr, data, length):
+        self._transfer()
+        return mock_ack(data)
+
+    def read_i2c_block_data(self, addr, reg, length):
+        self._transfer()
+        return [0] * length
+
+    def close(self):
+        pass
+
+
+def throughput(send, seconds):
+    delivered = failed = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        try:
+            send()
+            delivered += 1
+        except OSError:
+            failed += 1
+    return delivered, failed
+
+
+def outage(bus_time, outage_s):
+    """Slave dead for `outage_s` after 0.5 s. Returns (bus transactions during the outage,
+    seconds from the slave's return to the first delivered command, session counters)"""
+    bus = NoisyBus(bus_time, 0.0)
+    session = I2CSession(lambda: bus, probe_address=ADDRESS)
+    # long enough after the return for the longest breaker cooldown
+    seconds = 0.5 + outage_s + session.max_cooldown_s + 0.5
+    start = time.perf_counter()
+    down_at, up_at = start + 0.5, start + 0.5 + outage_s
+    during = back = None
+    while time.perf_counter() < start + seconds:
+        now = time.perf_counter()
+        if down_at <= now < up_at and not bus.dead:
+            bus.dead = True
+            during = bus.transactions
+        elif now >= up_at and bus.dead:
+            bus.dead = False
+            during = bus.transactions - during
+        try:
+            session.send_command(ADDRESS, COMMAND)
+            if back is None and now >= up_at:
+                back = time.perf_counter() - up_at
+        except OSError:
+            time.sleep(bus_time)    # a caller would go on with other work
+        session.maintain()
+    return during, back, session.counters()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delivered I2C commands with and without I2CSession")
+    parser.add_argument("--bus-time-ms", type=float, default=0.3, help="simulated time per transaction")
+    parser.add_argument("--seconds", type=float, default=1.0, help="per measurement")
+    parser.add_argument("--error-rate", type=float, action="append",
+                        help="NACK probability per transaction, may be repeated (default: 0 0.01 0.05 0.2)")
+    parser.add_argument("--outage-s", type=float, default=2.0)
+    args = parser.parse_args()
+
+    bus_time = args.bus_time_ms / 1000.0
+    for rate in args.error_rate or [0.0, 0.01, 0.05, 0.2]:
+        raw = NoisyBus(bus_time, rate)
+        frame = command_frames(1, COMMAND)[0]
+        raw_ok, raw_failed = throughput(lambda: raw.write_read(ADDRESS, frame, ACK_SIZE), args.seconds)
+        bus = NoisyBus(bus_time, rate)
+        session = I2CSession(lambda: bus, probe_address=ADDRESS)
+        ok, failed = throughput(lambda: session.send_command(ADDRESS, COMMAND), args.seconds)
+        print(f"error rate {rate:5.3f}: raw {raw_ok / args.seconds:7.0f} cmd/s, "
+              f"{raw_failed / max(raw_ok + raw_failed, 1) * 100:5.2f}% lost   "
+              f"session {ok / args.seconds:7.0f} cmd/s, {failed / max(ok + failed, 1) * 100:5.2f}% lost "
+              f"({session.recovered} recovered by retry, {session.trips} breaker trips)")
+
+    during, back, counters = outage(bus_time, args.outage_s)
+    full_rate = args.outage_s / bus_time
+    print(f"slave outage {args.outage_s:g} s: {during} bus transactions spent on the dead slave "
+          f"(vs ~{full_rate:.0f} without a breaker), "
+          + (f"back {back * 1000:.0f} ms after it returned" if back is not None else "NOT recovered")
+          + f", {counters['trips']} trip(s), {counters['fast_failures']} refused")
+    if back is None:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
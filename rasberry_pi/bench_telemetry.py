@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Telemetry encoding benchmark
+
+Encodes a synthetic hover trace (PID-corrected PWM, small attitude oscillation,
+gyro noise) with the keyframe/delta codec and with one text status per sample,
+and reports samples per notification, bytes per sample and encode/decode cost
+on this machine. Every packet is decoded back and compared with the input.
+
+    python3 bench_telemetry.py --samples 20000 --payload 20 --payload 244
+"""
+
+import argparse
+import math
+import random
+import time
+
+from telemetry_codec import TelemetryDecoder, TelemetryEncoder, clamp_sample
+
+TEXT_PREFIX = "TLM:"
+
+
+def hover_trace(count, period):
+    """Samples as they come out of the telemetry register at `period` seconds"""
+    rng = random.Random(1)
+    base = 1250
+    for i in range(count):
+        t = i * period
+        roll = 40 * math.sin(2 * math.pi * 0.7 * t) + rng.gauss(0, 4)
+        pitch = 30 * math.sin(2 * math.pi * 0.5 * t + 1) + rng.gauss(0, 4)
+        correction = 0.5 * roll
+        pwm = [base - correction, base + correction, base - correction, base + correction]
+        pwm = [p + 0.5 * pitch * s for p, s in zip(pwm, (1, -1, -1, 1))]
+        gyro = [rng.gauss(0, 15) for _ in range(3)]
+        yield clamp_sample(pwm + [roll, pitch] + gyro)
+
+
+def text_notifications(sample, payload):
+    """Notifications needed for one sample sent as a text status"""
+    text = TEXT_PREFIX + ",".join(str(v) for v in sample)
+    return -(-len(text.encode()) // payload), len(text)
+
+
+def run(samples, payload, period, latency):
+    encoder = TelemetryEncoder(max_payload=payload, max_latency=latency)
+    decoder = TelemetryDecoder()
+    packets = []
+    now = 0.0
+    started = time.perf_counter()
+    for sample in samples:
+        packets.extend(encoder.add(sample, now))
+        now += period
+    tail = encoder.flush()
+    if tail:
+        packets.append(tail)
+    encode_s = time.perf_counter() - started
+
+    decoded = []
+    started = time.perf_counter()
+    for packet in packets:
+        decoded.extend(decoder.feed(packet))
+    decode_s = time.perf_counter() - started
+    if [values for _, values in decoded] != samples:
+        raise SystemExit(f"FAIL: round trip mismatch at payload {payload}")
+    if max(len(p) for p in packets) > payload:
+        raise SystemExit(f"FAIL: packet larger than payload {payload}")
+
+    text_packets = text_bytes = 0
+    for sample in samples:
+        n, size = text_notifications(sample, payload)
+        text_packets += n
+        text_bytes += size
+
+    count = len(samples)
+    total = sum(len(p) for p in packets)
+    print(f"payload {payload:3d}: {count / len(packets):5.2f} samples/notification "
+          f"(text {count / text_packets:4.2f}, x{text_packets / len(packets):4.1f})  "
+          f"{total / count:5.2f} B/sample (text {text_bytes / count:5.2f})  "
+          f"encode {encode_s / count * 1e6:5.1f} us  decode {decode_s / count * 1e6:5.1f} us per sample")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Telemetry codec size and speed")
+    parser.add_argument("--samples", type=int, default=20000)
+    parser.add_argument("--period-ms", type=float, default=20.0, help="telemetry poll period")
+    parser.add_argument("--latency-ms", type=float, default=100.0,
+                        help="longest a sample waits for its notification")
+    parser.add_argument("--payload", type=int, action="append",
+                        help="notification payload (ATT MTU - 3), may be repeated (default: 20 64 244)")
+    args = parser.parse_args()
+
+    period = args.period_ms / 1000.0
+    samples = list(hover_trace(args.samples, period))
+    for payload in args.payload or [20, 64, 244]:
+        run(samples, payload, period, args.latency_ms / 1000.0)
+
+
+if __name__ == "__main__":
+    main()
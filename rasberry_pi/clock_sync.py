@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Clock offset and drift estimation
+
+The PC side loads this file (pc_controller/clock_sync.py), so both ends of an
+exchange share one estimator.
+
+Every timestamp exchange gives one sample: remote clock minus local clock at a
+local time, with an error bound. ClockEstimator keeps the lowest-error sample per
+bucket (one per second by default), fits offset and drift over the best recent
+buckets (the NTP clock filter idea) and reports a bound on the fitted offset.
+All times are integer microseconds.
+"""
+
+import collections
+import time
+
+
+def now_us():
+    return time.monotonic_ns() // 1000
+
+
+def exchange_sample(t0, t1, t2, t3):
+    """
+    NTP exchange: t0 local send, t1 remote receive, t2 remote reply, t3 local receive.
+    Returns (local_us, offset_us, error_us)
+    """
+    delay = max((t3 - t0) - (t2 - t1), 0)
+    return (t0 + t3) // 2, ((t1 - t0) + (t2 - t3)) // 2, delay // 2 + 1
+
+
+def bracket_sample(before, after, remote):
+    """Remote clock read once between two local reads. Returns (local_us, offset_us, error_us)"""
+    middle = (before + after) // 2
+    return middle, remote - middle, (after - before) // 2 + 1
+
+
+class ClockEstimator:
+    """remote = local + offset(local), offset(local) = offset_us + drift * (local - reference_us)"""
+
+    def __init__(self, window=64, bucket_us=1_000_000, best_fraction=0.5, min_span_us=5_000_000):
+        self.buckets = collections.deque(maxlen=window)   # (local_us, offset_us, error_us)
+        self.bucket_us = bucket_us
+        self.best_fraction = best_fraction
+        self.min_span_us = min_span_us
+        self.samples = 0
+        self.reference_us = None
+        self.offset_us = None
+        self.drift = 0.0            # remote us per local us - 1
+        self.error_us = None
+
+    @property
+    def synced(self):
+        return self.offset_us is not None
+
+    def add(self, local_us, offset_us, error_us):
+        self.samples += 1
+        sample = (local_us, offset_us, error_us)
+        if self.buckets and local_us - self.buckets[-1][0] < self.bucket_us:
+            if error_us < self.buckets[-1][2]:
+                self.buckets[-1] = sample
+        else:
+            self.buckets.append(sample)
+        self._fit()
+
+    def _fit(self):
+        ranked = sorted(self.buckets, key=lambda s: s[2])
+        best = ranked[:max(2, int(len(ranked) * self.best_fraction))]
+        reference, offset, _ = best[0]
+        span = max(s[0] for s in best) - min(s[0] for s in best)
+        drift = 0.0
+        if len(best) >= 3 and span >= self.min_span_us:
+            mean_t = sum(s[0] for s in best) / len(best)
+            mean_o = sum(s[1] for s in best) / len(best)
+            var = sum((s[0] - mean_t) ** 2 for s in best)
+            drift = sum((s[0] - mean_t) * (s[1] - mean_o) for s in best) / var
+            offset = mean_o + drift * (reference - mean_t)
+        # every kept sample bounds the true offset; the fit must stay within all of them
+        self.error_us = max(e + abs(o - (offset + drift * (t - reference))) for t, o, e in best)
+        self.reference_us, self.offset_us, self.drift = reference, offset, drift
+
+    def offset(self, local_us):
+        return self.offset_us + self.drift * (local_us - self.reference_us)
+
+    def to_remote(self, local_us):
+        return local_us + self.offset(local_us)
+
+    def to_local(self, remote_us):
+        return remote_us - self.offset(remote_us - self.offset_us)
+
+    def describe(self):
+        if not self.synced:
+            return "not synced"
+        return (f"offset {self.offset_us / 1000:+.3f} ms +/- {self.error_us / 1000:.3f} ms, "
+                f"drift {self.drift * 1e6:+.1f} ppm")
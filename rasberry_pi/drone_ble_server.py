@@ -2,10 +2,21 @@
 
 import platform
 import sys
+import os
+import signal
 import logging
 import time
+import argparse
 import base64
 import binascii
+import gc
+import re
+import struct
+import threading
+import weakref
+import zlib
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
 
 # Platform detection
 IS_RASPBERRY_PI = platform.machine().startswith('arm') or 'raspberry' in platform.node().lower()
@@ -52,6 +63,13 @@ if not DBUS_AVAILABLE or not GLIB_AVAILABLE:
     print("  pip3 install PyGObject dbus-python")
     sys.exit(1)
 
+from clock_sync import ClockEstimator, bracket_sample, now_us
+from i2c_session import COMMAND_MAX, I2CSession, failure_reason, mock_ack
+from imu_fusion import ESTIMATORS, IMU_BATCH, IMU_BLOCK_SIZE, FusionEngine, MockImu
+from shm_bridge import SplitBus
+from telemetry_codec import TELEMETRY_FIELDS, TelemetryEncoder
+from transports import UdpTransport, WebSocketTransport
+
 # --- Logging Setup ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -73,43 +91,1627 @@ LE_ADVERTISEMENT_IFACE = 'org.bluez.LEAdvertisement1'
 DRONE_SERVICE_UUID = "6E400001-B5A3-F393-E0A9-E50E24DCCA9E"
 COMMAND_CHARACTERISTIC_UUID = "6E400002-B5A3-F393-E0A9-E50E24DCCA9E"
 STATUS_CHARACTERISTIC_UUID = "6E400003-B5A3-F393-E0A9-E50E24DCCA9E"
+PARAMS_CHARACTERISTIC_UUID = "6E400004-B5A3-F393-E0A9-E50E24DCCA9E"
+KILL_CHARACTERISTIC_UUID = "6E400005-B5A3-F393-E0A9-E50E24DCCA9E"
+MISSION_CHARACTERISTIC_UUID = "6E400006-B5A3-F393-E0A9-E50E24DCCA9E"
+TELEMETRY_CHARACTERISTIC_UUID = "6E400007-B5A3-F393-E0A9-E50E24DCCA9E"
 
 # --- Arduino I2C Settings ---
 # Raspberry Pi 4/5 usually uses I2C bus 1.
 # Arduino I2C slave address
 I2C_BUS = 1 
 ARDUINO_I2C_ADDRESS = 0x08 # Example: address set with Arduino Wire.begin(0x08);
+# Every slave that must receive the emergency stop
+KNOWN_SLAVE_ADDRESSES = (ARDUINO_I2C_ADDRESS,)
+KILL_PAYLOAD = b'ESTOP'
+I2C_MAINTAIN_MS = 500       # reopen a lost bus / probe slaves behind an open breaker
 
 # Mock I2C class (for PC environment)
 class MockI2C:
     def __init__(self, bus=1):
         self.bus = bus
+        self.imu = MockImu()
         logger.info(f"Mock I2C bus {bus} initialized")
     
-    def write_i2c_block_data(self, addr, reg, data):
-        """Simulate I2C write"""
-        try:
-            command_str = ''.join([chr(b) for b in data if 32 <= b <= 126])
-            logger.info(f"Mock I2C write to 0x{addr:02X}: '{command_str}'")
-        except Exception as e:
-            logger.info(f"Mock I2C write to 0x{addr:02X}: {data} (raw bytes)")
-        return True
+    def write_read(self, addr, data, length):
+        """Simulate a command frame + ack read (i2c_rdwr)"""
+        command_str = ''.join([chr(b) for b in data[3:] if 32 <= b <= 126])
+        logger.info(f"Mock I2C frame to 0x{addr:02X}: '{command_str}'")
+        return mock_ack(data)
     
     def read_i2c_block_data(self, addr, reg, length):
         """Simulate I2C read"""
+        if reg == REG_IMU:
+            return list(self.imu.read(time.monotonic()))
         dummy_data = [0x00] * length
-        logger.info(f"Mock I2C read from 0x{addr:02X}: {dummy_data}")
+        logger.debug(f"Mock I2C read from 0x{addr:02X} reg 0x{reg:02X}: {dummy_data}")
         return dummy_data
     
     def close(self):
         """Close bus"""
         logger.info("Mock I2C bus closed")
 
+# --- Parameter mirror ---
+# Register map of the Arduino's Wire.onRequest handler (see drone_controller.ino)
+REG_PARAMS = 0x10           # 0x10 + page
+PARAM_PAGES = 3
+PARAMS_PER_PAGE = 7
+
+# Tunable parameters in the order the firmware reports them, with the
+# firmware's power-on values
+PARAM_FIELDS = (
+    'roll_kp', 'roll_ki', 'roll_kd',
+    'pitch_kp', 'pitch_ki', 'pitch_kd',
+    'yaw_kp', 'yaw_ki', 'yaw_kd',
+    'deadband', 'scale',
+    'min_corr', 'max_corr', 'min_out', 'base_thr',
+    'offset0', 'offset1', 'offset2', 'offset3',
+    'd_gyro',
+)
+PARAM_DEFAULTS = {
+    'roll_kp': 3.0, 'roll_ki': 0.0, 'roll_kd': 0.3,
+    'pitch_kp': 3.0, 'pitch_ki': 0.0, 'pitch_kd': 1.2,
+    'yaw_kp': 0.0, 'yaw_ki': 0.0, 'yaw_kd': 0.0,
+    'deadband': 0.5, 'scale': 0.5,
+    'min_corr': 5, 'max_corr': 100, 'min_out': 50, 'base_thr': 1250,
+    'offset0': 0, 'offset1': -60, 'offset2': 0, 'offset3': -60,
+    'd_gyro': 1,
+}
+INT_PARAMS = {'min_corr', 'max_corr', 'min_out', 'base_thr',
+              'offset0', 'offset1', 'offset2', 'offset3', 'd_gyro'}
+
+# PID presets applied by the firmware (kp, ki, kd per axis, scale)
+PID_PRESETS = {
+    'PID_GENTLE': ((3.0, 0.0, 0.5), (3.0, 0.0, 0.5), (2.0, 0.0, 0.3), 0.5),
+    'PID_NORMAL': ((6.0, 0.0, 0.8), (6.0, 0.0, 0.8), (4.0, 0.0, 0.5), 1.0),
+    'PID_AGGRESSIVE': ((10.0, 0.1, 1.2), (10.0, 0.1, 1.2), (6.0, 0.05, 0.8), 1.5),
+}
+
+# SET_* commands: mirror field, sscanf conversion, the firmware's constrain() range
+# (base_thr's range follows min_out and max_corr)
+SETTING_COMMANDS = {
+    'SET_DEADBAND': ('deadband', 'f', 0.0, 45.0),
+    'SET_MIN_CORR': ('min_corr', 'd', 0, 100),
+    'SET_MAX_CORR': ('max_corr', 'd', 5, 200),
+    'SET_SCALE': ('scale', 'f', 0.001, 0.1),
+    'SET_MIN_OUT': ('min_out', 'd', 10, 200),
+    'SET_BASE_THR': ('base_thr', 'd', None, None),
+}
+
+ESC_MIN = 1000
+ESC_MAX = 2000
+HOVER_THR = 1250
+DELTA_Z = 10
+
+def _constrain(value, low, high):
+    return max(low, min(high, value))
+
+# sscanf conversions: leading whitespace skipped, the longest number prefix taken
+_SCAN_PATTERNS = {'d': r'\s*([+-]?\d+)', 'f': r'\s*([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)'}
+
+def scan_command(command_str, prefix, conversions):
+    """
+    sscanf(command_str, "<prefix> %d %f ...") as the firmware runs it: `conversions` is
+    one 'd' or 'f' per value. Returns the values, or None unless all of them matched
+    (text after the last one is ignored, as sscanf does)
+    """
+    match = re.match(re.escape(prefix) + ''.join(_SCAN_PATTERNS[c] for c in conversions), command_str)
+    if not match:
+        return None
+    return [int(raw) if c == 'd' else float(raw) for c, raw in zip(conversions, match.groups())]
+
+class ParameterMirror:
+    """
+    Versioned copy of the parameters in effect on the Arduino.
+    Loaded from the controller at startup and updated by every command
+    that was accepted on the I2C bus, applying the same limits as the firmware.
+    """
+    def __init__(self):
+        self.values = dict(PARAM_DEFAULTS)
+        self.version = 0
+        self.source = 'defaults'
+        self.pid_enabled = False  # needed to follow UP/DOWN on base throttle
+        self._encoded = None
+
+    def load_from_controller(self, i2c_bus):
+        """Read all parameter pages from the Arduino. Returns True on success."""
+        loaded = {}
+        try:
+            for page in range(PARAM_PAGES):
+                first = page * PARAMS_PER_PAGE
+                count = min(PARAMS_PER_PAGE, len(PARAM_FIELDS) - first)
+                with i2c_lock:
+                    metrics.i2c_transactions += 1
+                    try:
+                        data = i2c_bus.read_i2c_block_data(ARDUINO_I2C_ADDRESS, REG_PARAMS + page,
+                                                           2 + 4 * count)
+                    except Exception:
+                        metrics.i2c_read_errors += 1
+                        raise
+                if data[0] != page or data[1] != count:
+                    logger.warning(f"Unexpected parameter page header: {data[:2]} (page {page})")
+                    return False
+                floats = struct.unpack(f'<{count}f', bytes(data[2:2 + 4 * count]))
+                for name, value in zip(PARAM_FIELDS[first:first + count], floats):
+                    loaded[name] = int(round(value)) if name in INT_PARAMS else round(value, 4)
+        except Exception as e:
+            logger.warning(f"Could not load parameters from Arduino: {e}")
+            return False
+        self._update(loaded)
+        self.source = 'controller'
+        logger.info(f"Loaded parameters from Arduino (version {self.version})")
+        return True
+
+    def apply_command(self, command_str, parts=None):
+        """Update the mirror from a command accepted by the Arduino. Returns True if anything changed."""
+        if parts is None:
+            parts = command_str.split()
+        if not parts:
+            return False
+        name = parts[0]
+        v = self.values
+        changes = {}
+        if name == 'RUN':
+            self.pid_enabled = True
+            changes['base_thr'] = HOVER_THR
+        elif name in ('STOP', 'EMERGENCY', 'ESTOP', 'PID_OFF') or name.startswith('TEST'):
+            self.pid_enabled = False
+        elif name == 'PID_ON':
+            self.pid_enabled = True
+        elif name in ('UP', 'DOWN') and self.pid_enabled:
+            step = DELTA_Z if name == 'UP' else -DELTA_Z
+            changes['base_thr'] = _constrain(v['base_thr'] + step, ESC_MIN + v['min_out'],
+                                             ESC_MAX - v['max_corr'])
+        elif command_str.startswith(('PID_ROLL', 'PID_PITCH', 'PID_YAW')):
+            # prefix match and sscanf, as the firmware dispatches them
+            prefix = next(p for p in ('PID_ROLL', 'PID_PITCH', 'PID_YAW') if command_str.startswith(p))
+            gains = scan_command(command_str, prefix, 'fff')
+            if gains:
+                for suffix, gain in zip(('kp', 'ki', 'kd'), gains):
+                    changes[f'{prefix[4:].lower()}_{suffix}'] = gain
+        elif name in PID_PRESETS:
+            roll, pitch, yaw, scale = PID_PRESETS[name]
+            for axis, gains in (('roll', roll), ('pitch', pitch), ('yaw', yaw)):
+                for suffix, gain in zip(('kp', 'ki', 'kd'), gains):
+                    changes[f'{axis}_{suffix}'] = gain
+            changes['scale'] = scale
+        elif command_str.startswith('SET_'):
+            for prefix, (key, conversion, low, high) in SETTING_COMMANDS.items():
+                if command_str.startswith(prefix):
+                    value = scan_command(command_str, prefix, conversion)
+                    if value:
+                        if key == 'base_thr':
+                            low, high = ESC_MIN + v['min_out'], ESC_MAX - v['max_corr']
+                        changes[key] = _constrain(value[0], low, high)
+                    break
+        elif command_str.startswith('OFFSET'):
+            values = scan_command(command_str, 'OFFSET', 'dd')
+            if values and 0 <= values[0] <= 3:
+                changes[f'offset{values[0]}'] = _constrain(values[1], -200, 200)
+        elif name == 'D_GYRO':
+            changes['d_gyro'] = 1
+        elif name == 'D_ERROR':
+            changes['d_gyro'] = 0
+        return self._update(changes)
+
+    def _update(self, changes):
+        if not changes:
+            return False
+        changed = {k: val for k, val in changes.items() if self.values.get(k) != val}
+        if not changed:
+            return False
+        self.values.update(changed)
+        self.version += 1
+        self._encoded = None
+        return True
+
+    def digest(self):
+        """CRC32 over the canonical field list, independent of the version counter."""
+        canonical = ';'.join(f"{name}={self.values[name]:g}" for name in PARAM_FIELDS)
+        return zlib.crc32(canonical.encode('ascii')) & 0xFFFFFFFF
+
+    def encode(self):
+        """Whole mirror as 'v=<version>;h=<crc32 hex>;name=value;...' for a single read."""
+        if self._encoded is None:
+            fields = ';'.join(f"{name}={self.values[name]:g}" for name in PARAM_FIELDS)
+            self._encoded = f"v={self.version};h={self.digest():08x};{fields}".encode('ascii')
+        return self._encoded
+
+class I2CBusLock:
+    """
+    Serializes I2C transactions between threads. Urgent acquirers (emergency stop)
+    are served before every waiting normal transaction, so they wait for at most
+    the one transaction already on the bus.
+    """
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._busy = False
+        self._urgent_waiting = 0
+        self._waiting = 0
+
+    def acquire(self, urgent=False):
+        with self._cond:
+            if urgent:
+                self._urgent_waiting += 1
+                while self._busy:
+                    self._wait()
+                self._urgent_waiting -= 1
+            else:
+                while self._busy or self._urgent_waiting:
+                    self._wait()
+            self._busy = True
+
+    def _wait(self):
+        self._waiting += 1
+        self._cond.wait()
+        self._waiting -= 1
+
+    def release(self):
+        with self._cond:
+            self._busy = False
+            # notify_all() allocates; the uncontended case has nobody to wake
+            if self._waiting:
+                self._cond.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+# --- Health metrics ---
+METRICS_HOST = '127.0.0.1'  # local only
+METRICS_PORT = 9105         # 0 disables the endpoint
+
+# command types reported as labels (anything else is counted as OTHER)
+METRIC_COMMAND_TYPES = {
+    'RUN', 'STOP', 'ESTOP', 'EMERGENCY', 'HB', 'FWD', 'BACK', 'LEFT', 'RIGHT', 'UP', 'DOWN',
+    'PALALEL', 'PID_ON', 'PID_OFF', 'PID_ROLL', 'PID_PITCH', 'PID_YAW', 'PID_GENTLE',
+    'PID_NORMAL', 'PID_AGGRESSIVE', 'D_GYRO', 'D_ERROR', 'STATUS', 'SET_DEADBAND',
+    'SET_MIN_CORR', 'SET_MAX_CORR', 'SET_SCALE', 'SET_MIN_OUT', 'SET_BASE_THR', 'TSYNC',
+    'MISSION', 'MDATA',
+}
+
+def command_type(command_str):
+    name = command_str.split(maxsplit=1)[0] if command_str else ''
+    if name in METRIC_COMMAND_TYPES:
+        return name
+    if name.startswith('TEST'):
+        return 'TEST'
+    if name.startswith('OFFSET'):
+        return 'OFFSET'
+    if name.isdigit():
+        return 'PWM'
+    return 'OTHER'
+
+class BridgeMetrics:
+    """
+    Counters and gauges for the bridge, served in OpenMetrics text format.
+    Writers only do plain attribute/dict increments (no locks); the HTTP thread reads
+    snapshots, so a scrape never blocks the command path.
+    """
+    def __init__(self):
+        self.commands_received = 0
+        self.commands_decoded = defaultdict(int)   # by command type
+        self.commands_failed = defaultdict(int)    # by reason
+        self.base64_fallbacks = 0
+        self.commands_coalesced = 0
+        self.backpressure_sent = 0
+        self.i2c_transactions = 0
+        self.i2c_write_errors = 0
+        self.i2c_read_errors = 0
+        self.i2c_bus_seconds = 0.0
+        self.notifications_sent = 0
+        self.notifications_merged = 0
+        self.notifications_dropped = 0
+        self.telemetry_samples = 0
+        self.telemetry_packets = 0
+        self.telemetry_bytes = 0
+        self.telemetry_skipped = 0
+        self.imu_samples = 0
+        self.imu_dropped = 0
+        self.loop_lag_seconds = 0.0      # updated by LoopMonitor
+        self.loop_lag_max_seconds = 0.0
+        self.loop_stalls = 0
+
+    def render(self):
+        """OpenMetrics text exposition"""
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# TYPE drone_bridge_{name} {kind}")
+            lines.append(f"# HELP drone_bridge_{name} {help_text}")
+            suffix = '_total' if kind == 'counter' else ''
+            for labels, value in samples:
+                lines.append(f"drone_bridge_{name}{suffix}{labels} {value}")
+
+        def by(label, counts):
+            return [(f'{{{label}="{key}"}}', value) for key, value in sorted(dict(counts).items())]
+
+        family('commands_received', 'counter', 'Writes to the command characteristic.',
+               [('', self.commands_received)])
+        family('commands_decoded', 'counter', 'Decoded commands by type.',
+               by('type', self.commands_decoded))
+        family('commands_failed', 'counter', 'Commands that were not forwarded, by reason.',
+               by('reason', self.commands_failed))
+        family('base64_fallbacks', 'counter', 'Commands that were not valid Base64.',
+               [('', self.base64_fallbacks)])
+        family('commands_coalesced', 'counter', 'Waiting control commands replaced by a newer one or superseded by a stop.',
+               [('', self.commands_coalesced)])
+        family('backpressure_notifications', 'counter', 'BP: notifications sent to clients over their limits.',
+               [('', self.backpressure_sent)])
+        family('i2c_transactions', 'counter', 'I2C transactions attempted.',
+               [('', self.i2c_transactions)])
+        family('i2c_errors', 'counter', 'Failed I2C transactions.',
+               [('{op="write"}', self.i2c_write_errors), ('{op="read"}', self.i2c_read_errors)])
+        family('i2c_bus_seconds', 'counter', 'Time spent in I2C transactions.',
+               [('', f"{self.i2c_bus_seconds:.6f}")])
+        session = None
+        if isinstance(bus, I2CSession):
+            session = bus.counters()
+        elif isinstance(bus, SplitBus):
+            session = bus.session_counters()
+        if session:
+            family('i2c_session_errors', 'counter', 'Failed I2C attempts (including retried ones), by class.',
+                   by('class', session['errors']))
+            family('i2c_retries', 'counter', 'I2C transactions retried.', [('', session['retried'])])
+            family('i2c_recovered', 'counter', 'I2C transactions that succeeded on a retry.',
+                   [('', session['recovered'])])
+            family('i2c_bus_reopens', 'counter', 'Times the I2C bus was reopened.', [('', session['reopens'])])
+            family('i2c_breaker_trips', 'counter', 'Times a slave circuit breaker opened.',
+                   [('', session['trips'])])
+            family('i2c_breaker_fast_failures', 'counter', 'Transactions refused by an open breaker.',
+                   [('', session['fast_failures'])])
+            family('i2c_breakers_open', 'gauge', 'Slaves whose circuit breaker is open.',
+                   [('', session['breakers_open'])])
+        family('notifications', 'counter', 'Status notifications by outcome.',
+               [('{outcome="sent"}', self.notifications_sent),
+                ('{outcome="merged"}', self.notifications_merged),
+                ('{outcome="dropped"}', self.notifications_dropped)])
+        family('advertisement_refreshes', 'counter', 'Status block refreshes in the advertising data.',
+               [('{outcome="sent"}', status_broadcast.refreshes),
+                ('{outcome="failed"}', status_broadcast.refresh_errors)])
+        family('telemetry_samples', 'counter', 'Telemetry samples read from the Arduino.',
+               [('', self.telemetry_samples)])
+        family('telemetry_packets', 'counter', 'Telemetry notifications sent.',
+               [('', self.telemetry_packets)])
+        family('telemetry_bytes', 'counter', 'Telemetry payload bytes sent.',
+               [('', self.telemetry_bytes)])
+        family('telemetry_skipped', 'counter', 'Telemetry packets not notified over BLE (rate limit or events queued).',
+               [('', self.telemetry_skipped)])
+        family('imu_samples', 'counter', 'Raw IMU samples fed to the sensor fusion.',
+               [('', self.imu_samples)])
+        family('imu_dropped', 'counter', 'Raw IMU samples the Arduino overwrote before they were read.',
+               [('', self.imu_dropped)])
+        if fusion_reader.latency_us is not None:
+            family('fusion_latency_seconds', 'gauge', 'IMU sample to fused attitude, smoothed.',
+                   [('', f"{fusion_reader.latency_us / 1e6:.6f}")])
+        clock = telemetry_streamer.arduino_clock
+        if clock.synced:
+            family('arduino_clock_offset_seconds', 'gauge', 'Arduino micros() minus bridge clock.',
+                   [('', f"{clock.offset(now_us()) / 1e6:.6f}")])
+            family('arduino_clock_error_seconds', 'gauge', 'Bound on the Arduino clock offset.',
+                   [('', f"{clock.error_us / 1e6:.6f}")])
+            family('arduino_clock_drift_ppm', 'gauge', 'Arduino clock drift against the bridge.',
+                   [('', f"{clock.drift * 1e6:.2f}")])
+        family('emergency_stops', 'counter', 'Emergency stops sent.', [('', kill_count)])
+        if isinstance(bus, SplitBus):
+            control = bus.counters()
+            family('control_commands_dropped', 'counter', 'Commands the control process dropped after a kill.',
+                   [('', control['commands_dropped'])])
+            family('control_queue_max_seconds', 'gauge', 'Longest wait of a command in the control ring.',
+                   [('', f"{control['queue_max_us'] / 1e6:.6f}")])
+            family('control_kill_max_seconds', 'gauge', 'Longest kill write in the control process.',
+                   [('', f"{control['kill_max_us'] / 1e6:.6f}")])
+        family('subscribers', 'gauge', 'BLE subscriptions by characteristic.',
+               [('{characteristic="status"}', int(bool(status_characteristic_obj and status_characteristic_obj.notifying))),
+                ('{characteristic="telemetry"}',
+                 int(bool(telemetry_characteristic_obj and telemetry_characteristic_obj.notifying)))])
+        family('status_events_queued', 'gauge', 'Status notifications waiting for D-Bus to take them.',
+               [('', len(event_queue.pending))])
+        family('ble_devices_connected', 'gauge', 'BLE devices connected according to BlueZ.',
+               [('', len(connection_tracker.connected))])
+        family('ble_disconnects', 'counter', 'BLE device disconnects seen from BlueZ.',
+               [('', connection_tracker.disconnects)])
+        family('loop_lag_seconds', 'gauge', 'Lateness of the last GLib loop probe.',
+               [('', f"{self.loop_lag_seconds:.6f}")])
+        family('loop_lag_max_seconds', 'gauge', 'Worst GLib loop probe lateness since start.',
+               [('', f"{self.loop_lag_max_seconds:.6f}")])
+        family('loop_stalls', 'counter', 'GLib loop stalls over the threshold.',
+               [('', self.loop_stalls)])
+        family('resident_memory_bytes', 'gauge', 'Process resident set size.',
+               [('', process_rss_bytes())])
+        lines.append('# EOF')
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+def process_rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = metrics.render()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/openmetrics-text; version=1.0.0; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # keep scrapes out of the journal
+
+def start_metrics_server():
+    """Serve /metrics from a daemon thread"""
+    if not METRICS_PORT:
+        return None
+    try:
+        server = HTTPServer((METRICS_HOST, METRICS_PORT), MetricsRequestHandler)
+    except OSError as e:
+        logger.warning(f"Metrics endpoint not started: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info(f"Metrics available at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return server
+
+metrics = BridgeMetrics()
+
+# --- Main loop lag monitor and sampling profiler ---
+LOOP_MONITOR_PERIOD_MS = 50     # probe timer on the GLib loop
+LOOP_STALL_THRESHOLD_MS = 100   # lateness that counts as a stall
+PROFILER_HZ = 200
+PROFILE_DIR = '/tmp'
+
+def format_stack(frame, limit=None):
+    """Outermost-first list of 'file:function:line' for a frame"""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    stack.reverse()
+    return stack[-limit:] if limit else stack
+
+class LoopMonitor:
+    """
+    Measures drift of a periodic timer on the GLib loop. A watcher thread notices
+    when the timer is overdue and samples the main thread's stack, so the log names
+    the callback that blocked the loop (D-Bus handler, I2C call, subprocess...).
+    """
+    def __init__(self):
+        self.main_ident = threading.get_ident()
+        self.period = LOOP_MONITOR_PERIOD_MS / 1000.0
+        self.threshold = LOOP_STALL_THRESHOLD_MS / 1000.0
+        self.expected = None
+        self.stall_stack = None
+
+    def start(self):
+        self.main_ident = threading.get_ident()
+        self.expected = time.monotonic() + self.period
+        GLib.timeout_add(LOOP_MONITOR_PERIOD_MS, self._tick)
+        threading.Thread(target=self._watch, name='loop-monitor', daemon=True).start()
+
+    def _tick(self):
+        now = time.monotonic()
+        lag = max(0.0, now - self.expected)
+        metrics.loop_lag_seconds = lag
+        metrics.loop_lag_max_seconds = max(metrics.loop_lag_max_seconds, lag)
+        if lag > self.threshold:
+            metrics.loop_stalls += 1
+            culprit = ' <- '.join(reversed(self.stall_stack)) if self.stall_stack else 'unknown'
+            logger.warning(f"Main loop stalled {lag * 1000:.0f} ms in: {culprit}")
+        self.stall_stack = None
+        self.expected = now + self.period
+        return True
+
+    def _watch(self):
+        while True:
+            time.sleep(self.threshold / 2)
+            expected = self.expected
+            if self.stall_stack is None and time.monotonic() - expected > self.threshold:
+                frame = sys._current_frames().get(self.main_ident)
+                if frame is not None and self.expected == expected:
+                    # innermost frames of whatever is running instead of the loop
+                    self.stall_stack = format_stack(frame, limit=6)
+
+class SamplingProfiler:
+    """
+    Samples the main thread's stack from a background thread and writes collapsed
+    stacks ('a;b;c count') for flamegraph.pl / speedscope. Toggled at runtime with
+    SIGUSR2 (sudo kill -USR2 <pid>); the output path is logged when it stops.
+    """
+    def __init__(self):
+        self.main_ident = threading.get_ident()
+        self.counts = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self.running:
+            return
+        self.counts = defaultdict(int)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, name='profiler', daemon=True)
+        self._thread.start()
+        logger.info(f"Sampling profiler started ({PROFILER_HZ} Hz)")
+
+    def stop(self):
+        """Stop sampling and write the profile. Returns the output path ('' if not running)."""
+        if not self.running:
+            return ''
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        path = os.path.join(PROFILE_DIR, f"drone-bridge-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.counts.items()):
+                f.write(f"{stack} {count}\n")
+        logger.info(f"Sampling profiler stopped: {sum(self.counts.values())} samples written to {path}")
+        return path
+
+    def toggle(self):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+        return GLib.SOURCE_CONTINUE # keep the signal handler installed
+
+    def _sample(self):
+        interval = 1.0 / PROFILER_HZ
+        while not self._stop.wait(interval):
+            frame = sys._current_frames().get(self.main_ident)
+            if frame is not None:
+                # drop line numbers so samples of one function aggregate
+                stack = ';'.join(entry.rsplit(':', 1)[0] for entry in format_stack(frame))
+                self.counts[stack] += 1
+
+loop_monitor = LoopMonitor()
+profiler = SamplingProfiler()
+
 # I2C bus object
 bus = None # Declared globally
+i2c_lock = I2CBusLock()
+
+# Parameter mirror (updated from CommandCharacteristic.WriteValue)
+param_mirror = ParameterMirror()
 
-# Global characteristic reference for notifications
+# --- Link-loss failsafe ---
+HEARTBEAT_COMMAND = 'HB'        # sent by clients, never forwarded to the Arduino
+LINK_TIMEOUT_S = 1.5            # armed and no command/heartbeat for this long = link lost
+WATCHDOG_PERIOD_MS = 100
+FAILSAFE_DESCENT_STEPS = 15     # DOWN steps (DELTA_Z each) after the landing hold
+FAILSAFE_STEP_MS = 200
+BLUEZ_DEVICE_IFACE = 'org.bluez.Device1'
+
+# commands after which the firmware clears its 'landing' flag
+LANDING_RESET_COMMANDS = {'RUN', 'FWD', 'BACK', 'LEFT', 'RIGHT', 'UP', 'DOWN',
+                          'PALALEL', 'PID_ON', 'PID_OFF'}
+
+class FlightState:
+    """
+    Motor state implied by the commands forwarded to the Arduino
+    (mirrors the firmware's 'landing' flag and whether motors may be spinning).
+    """
+    def __init__(self):
+        self.armed = False
+        self.landing = False
+
+    def apply_command(self, command_str, parts=None):
+        if parts is None:
+            parts = command_str.split()
+        if not parts:
+            return
+        name = parts[0]
+        if name == 'STOP':
+            # 1st STOP ramps to LAND_THR (even from standstill), 2nd stops the motors
+            self.armed = not self.landing
+            self.landing = not self.landing
+        elif name in ('EMERGENCY', 'ESTOP'):
+            self.armed = False
+            self.landing = False
+        elif name == 'RUN':
+            self.armed = True
+            self.landing = False
+        elif name.startswith('TEST'):
+            self.armed = True
+        elif name in LANDING_RESET_COMMANDS:
+            self.landing = False
+        elif len(parts) == 4 and all(p.isdigit() for p in parts):
+            self.armed = any(int(p) > ESC_MIN for p in parts)
+            self.landing = False
+
+flight_state = FlightState()
+
+class FailsafeWatchdog:
+    """
+    Issues a controlled descent followed by a full stop when the client link is lost
+    while the motors are armed. Link loss is either the last BlueZ device disconnecting
+    (reported by ConnectionTracker) or, for clients that send heartbeats, no
+    command/heartbeat within LINK_TIMEOUT_S.
+    Per-command cost is a single timestamp store; the timeout is checked on a GLib timer.
+    """
+    def __init__(self):
+        self.last_command = time.monotonic()
+        self.last_heartbeat = None  # None until the client proves it sends heartbeats
+        self.controller_session = None  # id of the session that sent the last command
+        self.active = False
+        self.reason = None
+        self.lost_at = None
+        self.steps_left = 0
+        self._timer = None
+        self.last_latency_ms = None
+        self.max_latency_ms = 0.0
+        # worst case from link loss to the first failsafe write (timeout path)
+        self.bound_ms = LINK_TIMEOUT_S * 1000.0 + WATCHDOG_PERIOD_MS
+
+    def command_received(self, session):
+        self.last_command = time.monotonic()
+        self.controller_session = session.id
+        if self.active:
+            # the operator is back in control
+            self.cancel("operator command received")
+
+    def heartbeat(self):
+        self.last_heartbeat = time.monotonic()
+
+    def check(self):
+        """GLib timer callback"""
+        if not self.active and flight_state.armed and self.last_heartbeat is not None:
+            last_seen = max(self.last_command, self.last_heartbeat)
+            if time.monotonic() - last_seen > LINK_TIMEOUT_S:
+                self.trigger('timeout', last_seen)
+        return True # keep the timer running
+
+    def on_ble_connected(self):
+        """A BlueZ device connected (ConnectionTracker)"""
+        # a new client has to send a heartbeat before the timeout applies to it
+        self.last_heartbeat = None
+
+    def on_ble_disconnected(self):
+        """The last BlueZ device disconnected (ConnectionTracker)"""
+        if self.controller_session in (None, ble_session.id):
+            self.link_lost('disconnect')
+
+    def on_session_closed(self, session):
+        """A network transport client went away"""
+        if session.id == self.controller_session:
+            self.link_lost(f"{session.transport.name}_closed")
+
+    def link_lost(self, reason):
+        if flight_state.armed and not self.active:
+            self.trigger(reason, time.monotonic())
+
+    def trigger(self, reason, lost_at):
+        mission_executor.abort('failsafe')
+        self.active = True
+        self.reason = reason
+        self.lost_at = lost_at
+        # hold descent thrust first (unless already landing), then step down
+        first = 'DOWN' if flight_state.landing else 'STOP'
+        written = self._write(first)
+        if written is not None:
+            latency_ms = (written - lost_at) * 1000.0
+            self.last_latency_ms = latency_ms
+            self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+            log = logger.error if latency_ms > self.bound_ms else logger.warning
+            log(f"FAILSAFE ({reason}): first I2C write {latency_ms:.1f} ms after link loss "
+                f"(bound {self.bound_ms:.0f} ms, max {self.max_latency_ms:.1f} ms)")
+        self.steps_left = FAILSAFE_DESCENT_STEPS
+        self._timer = GLib.timeout_add(FAILSAFE_STEP_MS, self._descent_step)
+        GLib.idle_add(send_status_notification, f"FAILSAFE:{reason}")
+
+    def _descent_step(self):
+        if not self.active:
+            return False
+        if self.steps_left > 0:
+            self.steps_left -= 1
+            self._write('DOWN')
+            return True
+        # EMERGENCY rather than STOP: a STOP toggles the firmware's landing state
+        self._write('EMERGENCY')
+        logger.warning("FAILSAFE: descent complete, motors stopped")
+        GLib.idle_add(send_status_notification, "FAILSAFE:Stopped")
+        self.active = False
+        self._timer = None
+        return False
+
+    def cancel(self, why):
+        if self._timer is not None:
+            GLib.source_remove(self._timer)
+            self._timer = None
+        self.active = False
+        logger.warning(f"FAILSAFE cancelled: {why}")
+
+    def _write(self, command_str):
+        """Returns the monotonic time the write completed, None on failure"""
+        if not bus:
+            logger.error("FAILSAFE: I2C bus not initialized")
+            return None
+        try:
+            write_command_to_arduino(command_str)
+            return time.monotonic()
+        except Exception as e:
+            logger.error(f"FAILSAFE: I2C write error: {e}")
+            return None
+
+failsafe_watchdog = FailsafeWatchdog()
+
+# --- Emergency stop fast path ---
+kill_count = 0
+
+def emergency_stop_all():
+    """
+    Send the kill to every known slave ahead of any other I2C work.
+    No decoding, logging or queueing before the writes; bookkeeping happens afterwards.
+    Returns the number of slaves that acknowledged the write.
+    """
+    global kill_count
+    written = 0
+    i2c_lock.acquire(urgent=True)
+    try:
+        if isinstance(bus, SplitBus):
+            # the control process writes it ahead of its queued commands
+            written = bus.kill()
+        else:
+            for address in KNOWN_SLAVE_ADDRESSES:
+                try:
+                    # forced: through an open breaker, no backoff between retries
+                    bus.send_command(address, KILL_PAYLOAD, force=True)
+                    written += 1
+                except Exception:
+                    pass
+    finally:
+        # set while the bus is still held, so no queued mission step can follow the kill
+        mission_executor.abort_event.set()
+        i2c_lock.release()
+    metrics.i2c_transactions += len(KNOWN_SLAVE_ADDRESSES)
+    metrics.i2c_write_errors += len(KNOWN_SLAVE_ADDRESSES) - written
+    kill_count += 1
+    flight_state.apply_command('ESTOP')
+    param_mirror.apply_command('ESTOP')
+    if failsafe_watchdog.active:
+        failsafe_watchdog.cancel("emergency stop")
+    GLib.idle_add(_report_kill, written)
+    return written
+
+def _report_kill(written):
+    if written == len(KNOWN_SLAVE_ADDRESSES):
+        logger.warning(f"EMERGENCY STOP sent to {written} slave(s) (#{kill_count})")
+        send_status_notification("ESTOP:OK")
+    else:
+        logger.error(f"EMERGENCY STOP reached {written}/{len(KNOWN_SLAVE_ADDRESSES)} slave(s)")
+        send_status_notification("ERR:ESTOP_I2C")
+    return GLib.SOURCE_REMOVE
+
+# --- Admission control ---
+# Per-session token buckets for each command class, so one client cannot keep the I2C
+# bus busy and starve telemetry and the other clients. Safety commands never wait.
+# Over the limit, control commands wait in a short per-client FIFO and go out in order
+# as tokens free up; configuration commands, and control commands that find the FIFO
+# full, are rejected. Only commands that set absolute state (a PWM tuple, PALALEL) are
+# coalesced with an identical one waiting last in the FIFO: relative steps (UP, FWD,
+# ...) and mode changes (RUN, PID_ON, TEST*) each change the firmware state. Either way
+# the client is told to slow down with 'BP:<class>:<commands per second>:<retry ms>',
+# at most every BACKPRESSURE_INTERVAL_S.
+ADMISSION_LIMITS = {            # class: (commands per second, burst)
+    'control': (50.0, 10),
+    'config': (10.0, 5),
+}
+CONTROL_QUEUE_LEN = 8
+COALESCED_COMMAND_TYPES = {'PWM', 'PALALEL'}
+SAFETY_COMMANDS = {'STOP', 'ESTOP', 'EMERGENCY', 'HB'}
+CONFIG_PREFIXES = ('SET', 'PID_', 'OFFSET', 'D_GYRO', 'D_ERROR', 'STATUS')
+BACKPRESSURE_INTERVAL_S = 0.25
+
+def command_class(parts):
+    name = parts[0] if parts else ''
+    if name in SAFETY_COMMANDS:
+        return 'safety'
+    if name.startswith(CONFIG_PREFIXES):
+        return 'config'
+    return 'control'
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'stamp')
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+
+    def take(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def wait(self):
+        """Seconds until the next token (after a failed take)"""
+        return (1.0 - self.tokens) / self.rate
+
+class SessionAdmission:
+    """Buckets of one client, its waiting control commands and backpressure timing"""
+    __slots__ = ('buckets', 'pending', 'flush_scheduled', 'backpressure_sent')
+
+    def __init__(self):
+        self.buckets = {cls: TokenBucket(rate, burst) for cls, (rate, burst) in ADMISSION_LIMITS.items()}
+        self.pending = deque()      # (command, command id, receive us), oldest first
+        self.flush_scheduled = False
+        self.backpressure_sent = {}
+
+class CommandAdmission:
+    def __init__(self):
+        self.sessions = weakref.WeakKeyDictionary()     # a closed session takes its buckets along
+
+    def admit(self, command, command_id, session, received_us):
+        """True if the command may go to the Arduino now; otherwise it is queued or answered here"""
+        cls = command.admission
+        if cls == 'safety' or cls not in ADMISSION_LIMITS:
+            state = self.sessions.get(session) if cls == 'safety' else None
+            if state is not None:
+                # STOP/ESTOP supersede control commands still waiting for a token
+                while state.pending:
+                    self._drop(state.pending.popleft(), session, 'Superseded')
+            return True
+        state = self.sessions.get(session)
+        if state is None:
+            state = self.sessions[session] = SessionAdmission()
+        bucket = state.buckets[cls]
+        now = time.monotonic()
+        # a control command behind waiting ones must not overtake them
+        if (cls != 'control' or not state.pending) and bucket.take(now):
+            return True
+        self._backpressure(state, session, cls, bucket, now)
+        if cls == 'control':
+            pending = state.pending
+            if (pending and command.type in COALESCED_COMMAND_TYPES
+                    and pending[-1][0].type == command.type):
+                self._drop(pending.pop(), session, 'Coalesced')
+            if len(pending) < CONTROL_QUEUE_LEN:
+                pending.append((command, command_id, received_us))
+                if not state.flush_scheduled:
+                    state.flush_scheduled = True
+                    GLib.timeout_add(max(1, int(bucket.wait() * 1000 + 0.5)), self._flush, session, state)
+                return False
+        metrics.commands_failed['rate_limited'] += 1
+        session.send(f"NAK:{command_id}:Rate_Limited".encode() if command_id is not None
+                     else b"ERR:Rate_Limited")
+        return False
+
+    def _backpressure(self, state, session, cls, bucket, now):
+        if now - state.backpressure_sent.get(cls, 0.0) < BACKPRESSURE_INTERVAL_S:
+            return
+        state.backpressure_sent[cls] = now
+        metrics.backpressure_sent += 1
+        session.send(f"BP:{cls}:{bucket.rate:g}:{bucket.wait() * 1000:.0f}".encode())
+
+    def _drop(self, entry, session, reason):
+        _, command_id, _ = entry
+        metrics.commands_coalesced += 1
+        if command_id is not None:
+            session.send(f"NAK:{command_id}:{reason}".encode())
+
+    def _flush(self, session, state):
+        """GLib timer: send the waiting control commands in order as tokens free up"""
+        bucket = state.buckets['control']
+        while state.pending and bucket.take(time.monotonic()):
+            command, command_id, received_us = state.pending.popleft()
+            forward_command(command, command_id, session, received_us)
+        if state.pending:
+            GLib.timeout_add(max(1, int(bucket.wait() * 1000 + 0.5)), self._flush, session, state)
+        else:
+            state.flush_scheduled = False
+        return False
+
+    def forget(self, session):
+        """The client is gone: drop its buckets and the control commands it still had waiting"""
+        state = self.sessions.pop(session, None)
+        if state is not None and state.pending:
+            metrics.commands_failed['disconnected'] += len(state.pending)
+            state.pending.clear()
+
+command_admission = CommandAdmission()
+
+# --- Command hot path ---
+# Payloads and commands repeat (a handful of flight commands at high rates), so everything
+# derived from them is built once and reused: no per-command lists, strings or D-Bus values.
+COMMAND_CACHE_SIZE = 256    # entries per cache; a full cache is cleared (PWM tuples vary)
+
+class PreparedCommand:
+    """What the bridge needs to forward one command string"""
+    __slots__ = ('text', 'data', 'parts', 'type', 'admission', 'ack')
+
+    def __init__(self, text):
+        self.text = text
+        self.data = text.encode('latin-1', 'replace')   # I2C payload
+        self.parts = text.split()
+        self.type = command_type(text)
+        self.admission = command_class(self.parts)
+        self.ack = f"CMD_RX:{text[:15]}"
+
+_prepared_commands = {}
+_decoded_payloads = {}      # raw payload -> (command string, was Base64)
+
+def prepare_command(command_str):
+    command = _prepared_commands.get(command_str)
+    if command is None:
+        if len(_prepared_commands) >= COMMAND_CACHE_SIZE:
+            _prepared_commands.clear()
+        command = _prepared_commands[command_str] = PreparedCommand(command_str)
+    return command
+
+def decode_payload(payload: bytes):
+    """
+    Command payload -> (command string, was Base64). Base64 first, plain UTF-8 for
+    older clients. Raises UnicodeDecodeError if neither works.
+    """
+    decoded = _decoded_payloads.get(payload)
+    if decoded is not None:
+        return decoded
+    try:
+        # first get raw byte data as UTF-8 string
+        base64_str = payload.decode('utf-8').strip()
+        logger.debug(f"Received Base64 string: '{base64_str}'")
+        decoded = (base64.b64decode(base64_str).decode('utf-8').strip(), True)
+        logger.debug(f"Decoded command: '{decoded[0]}'")
+    except (binascii.Error, ValueError) as b64_err:
+        logger.debug(f"Base64 decode failed: {b64_err}, trying direct UTF-8 decode")
+        # If Base64 decode fails, try direct UTF-8 decode (for compatibility)
+        decoded = (payload.decode('utf-8').strip(), False)
+        logger.debug(f"Direct decoded command: '{decoded[0]}'")
+    if len(_decoded_payloads) >= COMMAND_CACHE_SIZE:
+        _decoded_payloads.clear()
+    _decoded_payloads[payload] = decoded
+    return decoded
+
+def write_command_to_arduino(command_str, cancel=None, answer=None):
+    """
+    Write one command string to the Arduino and update the bridge's view of its state.
+    I2C errors are raised to the caller. If the `cancel` event is set by the time the
+    bus is ours, nothing is written and False is returned.
+    In split mode the command is only queued: the state update, and the client answer
+    `answer` (forward_command's arguments) if given, follow once the control process
+    reports the write (command_written)
+    """
+    command = prepare_command(command_str)
+    with i2c_lock:
+        if cancel is not None and cancel.is_set():
+            return False
+        started = time.perf_counter()
+        metrics.i2c_transactions += 1
+        try:
+            if isinstance(bus, SplitBus):
+                bus.send_command(ARDUINO_I2C_ADDRESS, command.data, (command, answer))
+                return True
+            bus.send_command(ARDUINO_I2C_ADDRESS, command.data)
+        except Exception:
+            metrics.i2c_write_errors += 1
+            raise
+        finally:
+            metrics.i2c_bus_seconds += time.perf_counter() - started
+    command_applied(command)
+    return True
+
+def command_applied(command):
+    flight_state.apply_command(command.text, command.parts)
+    if param_mirror.apply_command(command.text, command.parts):
+        logger.info(f"Parameter mirror updated to version {param_mirror.version}")
+
+def command_written(context, error=None, metric=None):
+    """Split mode: the control process wrote a command (error None), failed or dropped it"""
+    if context is None:
+        return      # sent before the front restarted its bookkeeping
+    command, answer = context
+    if error is None:
+        command_applied(command)
+    elif metric:
+        metrics.i2c_write_errors += 1
+        metrics.commands_failed[metric] += 1
+    if answer is not None:
+        answer_command(*answer, error)
+    elif error is not None:
+        logger.error(f"I2C write of '{command.text}' failed in the control process: {error}")
+        send_status_notification(f"ERR:{error}")
+
+# --- Onboard mission executor ---
+MISSION_COMMAND = 'MISSION'         # MISSION LOAD <length> <crc32> | START | ABORT | STATUS
+MISSION_DATA_PREFIX = b'MDATA '     # network transports: 'MDATA ' + mission characteristic value
+MISSION_MAX_BYTES = 16384
+MISSION_START_DELAY_S = 0.05        # lead time so the first step is not already late
+MISSION_SPIN_S = 0.001              # busy-wait the last 1 ms before a step
+MISSION_SWITCH_INTERVAL_S = 0.0002  # GIL hand-over interval while a mission runs (default 5 ms)
+MISSION_PROGRESS_S = 0.1            # progress notifications at most this often
+MISSION_LOCAL_COMMANDS = {HEARTBEAT_COMMAND, 'PARAMS', 'TSYNC', MISSION_COMMAND, 'ESTOP', 'EMERGENCY', 'FUSION'}
+
+class MissionExecutor:
+    """
+    Runs an uploaded timed command sequence on its own thread against time.monotonic(),
+    straight onto I2C, so step timing does not depend on the client link.
+    Upload: [uint16 offset][data] chunks (offset 0 starts a new upload) holding lines of
+    '<offset us> <command>', then 'MISSION LOAD <length> <crc32>'. 'MISSION START' runs it;
+    STOP, a kill, 'MISSION ABORT' or the failsafe abort it before their own write.
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+        self.steps = []
+        self.thread = None
+        self.abort_event = threading.Event()
+        self.abort_reason = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def write_chunk(self, payload):
+        """One mission characteristic write. Raises ValueError on a bad chunk."""
+        if len(payload) < 2:
+            raise ValueError("short mission chunk")
+        offset = struct.unpack_from('<H', payload)[0]
+        if offset == 0:
+            self.buffer = bytearray()
+        if offset != len(self.buffer):
+            raise ValueError(f"mission chunk at {offset}, expected {len(self.buffer)}")
+        if offset + len(payload) - 2 > MISSION_MAX_BYTES:
+            raise ValueError("mission too large")
+        self.buffer += payload[2:]
+
+    def command(self, args):
+        """'MISSION ...' text command. Returns the reply for the requesting client."""
+        words = args.split()
+        action = words[0].upper() if words else ''
+        if action == 'LOAD' and len(words) == 3:
+            return self.load(int(words[1]), int(words[2], 16))
+        if action == 'START':
+            return self.start()
+        if action == 'ABORT':
+            self.abort('client')
+            return "MISSION:ABORTING" if self.running else "MISSION:IDLE"
+        if action == 'STATUS':
+            return f"MISSION:{'RUNNING' if self.running else 'IDLE'}:{len(self.steps)}"
+        return "MISSION:ERR:Usage"
+
+    def load(self, length, crc):
+        if self.running:
+            return "MISSION:ERR:Running"
+        if len(self.buffer) != length or zlib.crc32(self.buffer) != crc:
+            return "MISSION:ERR:Checksum"
+        steps = []
+        try:
+            for line in self.buffer.decode('ascii').splitlines():
+                if not line.strip():
+                    continue
+                offset, command_str = line.strip().split(' ', 1)
+                offset_us = int(offset)
+                command_str = command_str.strip()
+                if command_str.split()[0] in MISSION_LOCAL_COMMANDS:
+                    return f"MISSION:ERR:Not_allowed:{command_str[:12]}"
+                if len(command_str) > COMMAND_MAX:
+                    return f"MISSION:ERR:Too_Long:{command_str[:12]}"
+                if steps and offset_us < steps[-1][0]:
+                    return "MISSION:ERR:Order"
+                steps.append((offset_us, command_str))
+        except (UnicodeDecodeError, ValueError, IndexError):
+            return "MISSION:ERR:Format"
+        if not steps:
+            return "MISSION:ERR:Empty"
+        self.steps = steps
+        logger.info(f"Mission loaded: {len(steps)} steps over {steps[-1][0] / 1e6:.3f} s")
+        return f"MISSION:LOADED:{len(steps)}:{steps[-1][0] // 1000}"
+
+    def start(self):
+        if self.running:
+            return "MISSION:ERR:Running"
+        if not self.steps:
+            return "MISSION:ERR:Empty"
+        if not bus:
+            return "MISSION:ERR:I2C_Not_Ready"
+        self.abort_event.clear()
+        self.abort_reason = None
+        self.thread = threading.Thread(target=self._run, args=(list(self.steps),),
+                                       name='mission', daemon=True)
+        self.thread.start()
+        return f"MISSION:STARTED:{len(self.steps)}"
+
+    def abort(self, reason):
+        """Stop the running mission; no step is written after this returns"""
+        if self.running and not self.abort_event.is_set():
+            self.abort_reason = reason
+            self.abort_event.set()
+            logger.warning(f"Mission aborted ({reason})")
+
+    def _run(self, steps):
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(MISSION_SWITCH_INTERVAL_S)
+        errors = []
+        last_progress = 0.0
+        start = time.monotonic() + MISSION_START_DELAY_S
+        try:
+            for index, (offset_us, command_str) in enumerate(steps):
+                target = start + offset_us / 1e6
+                if not self._wait_until(target):
+                    break
+                sent = time.monotonic()
+                try:
+                    if not write_command_to_arduino(command_str, cancel=self.abort_event):
+                        break
+                except Exception as e:
+                    logger.error(f"Mission step {index + 1} I2C write error: {e}")
+                    self.abort_reason = 'i2c'
+                    break
+                errors.append(sent - target)
+                if sent - last_progress >= MISSION_PROGRESS_S:
+                    last_progress = sent
+                    GLib.idle_add(send_status_notification, f"MISSION:STEP:{index + 1}/{len(steps)}")
+        finally:
+            sys.setswitchinterval(switch_interval)
+
+        worst = max(errors, default=0.0) * 1e6
+        mean = sum(errors) / len(errors) * 1e6 if errors else 0.0
+        if len(errors) == len(steps):
+            logger.info(f"Mission done: {len(steps)} steps, send error mean {mean:.0f} us, max {worst:.0f} us")
+            GLib.idle_add(send_status_notification, f"MISSION:DONE:{len(steps)}:{mean:.0f}:{worst:.0f}")
+        else:
+            reason = self.abort_reason or 'abort'
+            logger.warning(f"Mission stopped after {len(errors)}/{len(steps)} steps ({reason})")
+            GLib.idle_add(send_status_notification, f"MISSION:ABORTED:{len(errors)}/{len(steps)}:{reason}")
+
+    def _wait_until(self, target):
+        """Sleep, then spin, until `target`. False if aborted meanwhile."""
+        while True:
+            remaining = target - time.monotonic()
+            if remaining <= 0:
+                return not self.abort_event.is_set()
+            if remaining > MISSION_SPIN_S:
+                if self.abort_event.wait(remaining - MISSION_SPIN_S):
+                    return False
+            elif self.abort_event.is_set():
+                return False
+
+mission_executor = MissionExecutor()
+
+# Global characteristic references for notifications
 status_characteristic_obj = None
+telemetry_characteristic_obj = None
+
+# --- Transports ---
+# The BLE command characteristic and the optional UDP/WebSocket servers
+# (transports.py) all feed process_command()
+UDP_PORT = 9750
+WS_PORT = 9751
+PARAMS_COMMAND = 'PARAMS'   # replies 'PARAMS:<mirror>' to the requesting client only
+TSYNC_PREFIX = b'TSYNC '    # 'TSYNC <t0>', see clock_sync_reply()
+COMMAND_ID_PREFIX = b'#'    # '#<id> <command>': answered 'ACK:<id>:<receive us>' or 'NAK:<id>:<reason>'
+
+class BleSession:
+    """The BLE client(s) of the GATT server; replies go out as status notifications"""
+    id = 'ble'
+    peer = 'gatt'
+
+    def send(self, data: bytes):
+        GLib.idle_add(send_ble_notification, data)
+
+ble_session = BleSession()
+network_transports = []
+
+# --- Telemetry stream ---
+# Binary keyframe/delta packets on the telemetry characteristic (see telemetry_codec.py)
+REG_TELEMETRY = 0x01
+TELEMETRY_SIZE = 2 * len(TELEMETRY_FIELDS) + 4   # int16 fields, then the Arduino's micros()
+TELEMETRY_PERIOD_MS = 20
+SPLIT_RESULT_POLL_MS = 2        # split mode: event drain while commands wait for their result
+TELEMETRY_PAYLOAD = 20          # ATT_MTU 23 - 3, until a client reports a larger MTU
+TELEMETRY_PAYLOAD_MAX = 244     # largest notification BlueZ sends (MTU 247)
+TELEMETRY_NOTIFY_RATE = 60.0    # BLE telemetry notifications per second (--telemetry-rate)
+TELEMETRY_NOTIFY_BURST = 5
+
+class TelemetryStreamer:
+    """
+    Polls the Arduino's telemetry register and sends packed packets to subscribers.
+    Over BLE the stream has its own characteristic and budget and only carries the
+    newest data: a packet that would exceed the budget, or go out while status events
+    are queued, is skipped and the stream restarts with a keyframe.
+    """
+    def __init__(self):
+        self.encoder = TelemetryEncoder(TELEMETRY_PAYLOAD)
+        self.budget = TokenBucket(TELEMETRY_NOTIFY_RATE, TELEMETRY_NOTIFY_BURST)
+        self.latest = None
+        self.read_failing = False
+        # Arduino micros() against the bridge clock, from the bracketed register reads
+        self.arduino_clock = ClockEstimator()
+        self.arduino_last = None
+        self.arduino_wraps = 0
+        self.timer = None
+        self.result_poll = None
+
+    def start(self, period_ms=TELEMETRY_PERIOD_MS):
+        self.timer = PollTimer(self._poll, period_ms)
+        self.timer.start()
+
+    def set_mtu(self, mtu):
+        """ATT MTU reported by BlueZ in WriteValue options"""
+        payload = max(TELEMETRY_PAYLOAD, min(mtu - 3, TELEMETRY_PAYLOAD_MAX))
+        if payload != self.encoder.max_payload:
+            logger.info(f"Telemetry payload {payload} bytes (ATT MTU {mtu})")
+            self.encoder.max_payload = payload
+
+    def subscribed(self):
+        ble = telemetry_characteristic_obj is not None and telemetry_characteristic_obj.notifying
+        return ble or any(transport.sessions for transport in network_transports)
+
+    def _poll(self):
+        if isinstance(bus, SplitBus):
+            self._drain_split()
+            return True
+        if not bus or not self.subscribed():
+            return True
+        try:
+            with i2c_lock:
+                metrics.i2c_transactions += 1
+                before = now_us()
+                try:
+                    data = bus.read_i2c_block_data(ARDUINO_I2C_ADDRESS, REG_TELEMETRY, TELEMETRY_SIZE)
+                finally:
+                    after = now_us()
+                    metrics.i2c_bus_seconds += (after - before) / 1e6
+        except Exception as e:
+            metrics.i2c_read_errors += 1
+            if not self.read_failing:
+                logger.error(f"Error reading telemetry from Arduino via I2C: {e}")
+                self.read_failing = True
+            return True
+        self.read_failing = False
+        self._sample(before, after, data)
+        return True
+
+    def expect_results(self):
+        """Split mode: a command was queued; drain its result ahead of the next poll"""
+        if self.result_poll is None:
+            self.result_poll = GLib.timeout_add(SPLIT_RESULT_POLL_MS, self._poll_results)
+
+    def _poll_results(self):
+        self._drain_split()
+        if bus.waiting:
+            return True
+        self.result_poll = None
+        return False
+
+    def _drain_split(self):
+        """Split mode: the control process polls the register; take its samples and errors"""
+        bus.set_telemetry(self.subscribed())
+        for event in bus.events():
+            if event[0] == 'T':
+                _, before, after, data = event
+                metrics.i2c_transactions += 1
+                metrics.i2c_bus_seconds += (after - before) / 1e6
+                self._sample(before, after, data)
+            elif event[0] == 'D':
+                _, context, dropped = event
+                if dropped:
+                    metrics.commands_failed['killed'] += 1
+                command_written(context, 'Killed' if dropped else None)
+            else:
+                _, context, address, metric, reason, message = event
+                logger.debug(f"I2C write to 0x{address:02X} failed in the control process: {message}")
+                command_written(context, reason, metric)
+
+    def _sample(self, before, after, data):
+        metrics.telemetry_samples += 1
+        *values, arduino_us = struct.unpack(f'<{len(TELEMETRY_FIELDS)}hI', bytes(data))
+        self._arduino_time(before, after, arduino_us)
+        if fusion_reader.engine and fusion_reader.engine.roll is not None:
+            # fused attitude instead of the firmware's accelerometer angles
+            values[4] = round(fusion_reader.engine.roll * 10)
+            values[5] = round(fusion_reader.engine.pitch * 10)
+        self.latest = values
+
+        sampled = (before + after) / 2e6
+        packets = self.encoder.add(values, sampled)
+        if self.encoder.last_keyframe == sampled:
+            # bridge time (ms) of the keyframe sample, ahead of the packet carrying it
+            self._send_key(f"TKEY:{self.encoder.keyframe_seq}:{self.encoder.previous_ms}".encode())
+        for packet in packets:
+            self.send(packet)
+
+    def snapshot(self):
+        """Newest sample as a keyframe packet of its own (telemetry characteristic reads)"""
+        if self.latest is None:
+            return b''
+        encoder = TelemetryEncoder(TELEMETRY_PAYLOAD_MAX)
+        encoder.add(self.latest, 0.0)
+        return encoder.flush()
+
+    def _arduino_time(self, before, after, raw_us):
+        """Unwrap the 32-bit micros() and feed the Arduino clock estimate"""
+        if self.arduino_last is not None and raw_us < self.arduino_last:
+            if self.arduino_last - raw_us > 1 << 31:
+                self.arduino_wraps += 1
+            else:
+                # the counter went back: the Arduino restarted
+                logger.warning("Arduino clock went backwards, restarting clock estimate")
+                self.arduino_clock = ClockEstimator()
+                self.arduino_wraps = 0
+        self.arduino_last = raw_us
+        if raw_us == 0 and self.arduino_wraps == 0:
+            return      # mock bus or no data
+        self.arduino_clock.add(*bracket_sample(before, after, raw_us + (self.arduino_wraps << 32)))
+
+    def send(self, packet):
+        metrics.telemetry_packets += 1
+        metrics.telemetry_bytes += len(packet)
+        for transport in network_transports:
+            transport.broadcast(packet, droppable=True)
+        if not (telemetry_characteristic_obj and telemetry_characteristic_obj.notifying):
+            return
+        if event_queue.pending or (self.budget and not self.budget.take(time.monotonic())):
+            # a late packet is worth nothing: resync with a keyframe of a newer sample instead
+            metrics.telemetry_skipped += 1
+            self.encoder.request_keyframe()
+            return
+        telemetry_characteristic_obj.notify(packet)
+
+    def _send_key(self, message):
+        """TKEY goes with the packets (same characteristic), so it arrives ahead of its keyframe"""
+        for transport in network_transports:
+            transport.broadcast(message)
+        if telemetry_characteristic_obj and telemetry_characteristic_obj.notifying:
+            telemetry_characteristic_obj.notify(message)
+
+telemetry_streamer = TelemetryStreamer()
+
+# --- Sensor fusion ---
+# The Arduino samples its IMU into a ring (REG_IMU); the bridge drains it and runs the
+# estimator (imu_fusion.py). The fused roll/pitch replace the telemetry angles.
+REG_IMU = 0x03
+IMU_POLL_MS = 5
+IMU_DRAIN_READS = 8         # reads per poll while the Arduino returns full blocks
+FUSION_COMMAND = 'FUSION'   # FUSION <algorithm> | OFF | STATUS
+FUSION_REPORT_S = 1.0       # 'FUSION:<algorithm>:<latency us>:<us per sample>:<samples/s>'
+LATENCY_SMOOTHING = 0.1
+
+class FusionReader:
+    """Polls the raw IMU register while telemetry is subscribed and feeds the fusion engine"""
+    def __init__(self):
+        self.engine = None
+        self.timer = None
+        self.latency_us = None      # newest sample taken -> attitude updated, smoothed
+        self.busy_ns = 0            # time in engine.feed(), for the engine's samples
+        self.report_samples = 0
+        self.report_started = time.monotonic()
+
+    def start(self, algorithm=None):
+        if isinstance(bus, SplitBus):
+            logger.warning("Sensor fusion needs register reads from this process; not available with --split")
+            return
+        if algorithm:
+            self._new_engine(algorithm)
+            logger.info(f"Sensor fusion: {algorithm}")
+        self.timer = PollTimer(self._poll, IMU_POLL_MS)
+        self.timer.start()
+
+    def command(self, args):
+        """FUSION command from a client; returns the reply"""
+        name = args[0].lower() if args else 'status'
+        if name == 'off':
+            self.engine = None
+            self.latency_us = None
+        elif name in ESTIMATORS:
+            if self.engine:
+                self.engine.select(name)
+            else:
+                self._new_engine(name)
+            logger.info(f"Sensor fusion: {name}")
+        elif name != 'status':
+            return f"FUSION:ERR:{name[:12]}"
+        return self.describe()
+
+    def _new_engine(self, algorithm):
+        # engine.samples restarts from zero, so must the time spent feeding them
+        self.engine = FusionEngine(algorithm)
+        self.busy_ns = 0
+
+    def describe(self):
+        if not self.engine:
+            return "FUSION:OFF"
+        latency = '' if self.latency_us is None else f"{self.latency_us:.0f}"
+        return f"FUSION:{self.engine.algorithm}:{latency}:{self.busy_ns / max(self.engine.samples, 1) / 1000:.1f}"
+
+    def _poll(self):
+        if not self.engine or not bus or not telemetry_streamer.subscribed():
+            return True
+        engine = self.engine
+        for _ in range(IMU_DRAIN_READS):
+            try:
+                with i2c_lock:
+                    metrics.i2c_transactions += 1
+                    before = now_us()
+                    try:
+                        block = bus.read_i2c_block_data(ARDUINO_I2C_ADDRESS, REG_IMU, IMU_BLOCK_SIZE)
+                    finally:
+                        after = now_us()
+                        metrics.i2c_bus_seconds += (after - before) / 1e6
+            except Exception as e:
+                metrics.i2c_read_errors += 1
+                logger.debug(f"IMU read failed: {e}")
+                break
+            started = time.perf_counter_ns()
+            count = engine.feed(block)
+            self.busy_ns += time.perf_counter_ns() - started
+            metrics.imu_samples += count
+            metrics.imu_dropped += block[1]
+            self.report_samples += count
+            if count:
+                self._latency(after, engine.last_t)
+            if count < IMU_BATCH:
+                break
+        if time.monotonic() - self.report_started >= FUSION_REPORT_S:
+            rate = self.report_samples / (time.monotonic() - self.report_started)
+            send_status_notification(f"{self.describe()}:{rate:.0f}")
+            self.report_samples = 0
+            self.report_started = time.monotonic()
+        return True
+
+    def _latency(self, read_us, newest_low16):
+        """Age of the newest sample when its attitude is ready, on the bridge clock"""
+        clock = telemetry_streamer.arduino_clock
+        if not clock.synced:
+            return
+        arduino_now = int(clock.to_remote(read_us))
+        sampled = clock.to_local(arduino_now - ((arduino_now - newest_low16) & 0xFFFF))
+        latency = now_us() - sampled
+        if self.latency_us is None:
+            self.latency_us = latency
+        else:
+            self.latency_us += LATENCY_SMOOTHING * (latency - self.latency_us)
+
+fusion_reader = FusionReader()
+
+# --- Connection tracking ---
+# BlueZ reports connects and disconnects on Device1 (PropertiesChanged 'Connected') and
+# through the ObjectManager (devices added/removed). Telemetry and IMU polling run at full
+# rate only while someone is subscribed and tick at IDLE_POLL_MS otherwise; a new
+# subscriber or network client brings them back at once. When the last BLE device goes,
+# its subscription and waiting commands are dropped without waiting for StopNotify.
+IDLE_POLL_MS = 500
+
+class PollTimer:
+    """GLib timer calling `poll` every `period_ms` while subscribed, every IDLE_POLL_MS otherwise"""
+    def __init__(self, poll, period_ms):
+        self.poll = poll
+        self.period_ms = period_ms
+        self.interval_ms = None
+        self.source = None
+
+    def start(self):
+        self._arm(self.period_ms)
+
+    def wake(self):
+        """Full rate from now on (a client subscribed)"""
+        if self.source is not None and self.interval_ms != self.period_ms:
+            GLib.source_remove(self.source)
+            self._arm(self.period_ms)
+
+    def _arm(self, interval_ms):
+        self.interval_ms = interval_ms
+        self.source = GLib.timeout_add(interval_ms, self._tick)
+
+    def _tick(self):
+        self.poll()
+        interval_ms = self.period_ms if telemetry_streamer.subscribed() else IDLE_POLL_MS
+        if interval_ms == self.interval_ms:
+            return True
+        self._arm(interval_ms)
+        return False
+
+class ConnectionTracker:
+    """Connected BlueZ devices and the cleanup when clients go away"""
+    def __init__(self):
+        self.connected = set()      # Device1 object paths
+        self.disconnects = 0
+
+    def start(self, dbus_bus):
+        dbus_bus.add_signal_receiver(self.on_device_properties_changed,
+                                     dbus_interface=DBUS_PROP_IFACE,
+                                     signal_name='PropertiesChanged',
+                                     arg0=BLUEZ_DEVICE_IFACE,
+                                     path_keyword='path')
+        dbus_bus.add_signal_receiver(self.on_interfaces_added,
+                                     dbus_interface=DBUS_OM_IFACE,
+                                     signal_name='InterfacesAdded',
+                                     bus_name=BLUEZ_SERVICE_NAME)
+        dbus_bus.add_signal_receiver(self.on_interfaces_removed,
+                                     dbus_interface=DBUS_OM_IFACE,
+                                     signal_name='InterfacesRemoved',
+                                     bus_name=BLUEZ_SERVICE_NAME)
+        try:
+            remote_om = dbus.Interface(dbus_bus.get_object(BLUEZ_SERVICE_NAME, '/'), DBUS_OM_IFACE)
+            for path, interfaces in remote_om.GetManagedObjects().items():
+                if interfaces.get(BLUEZ_DEVICE_IFACE, {}).get('Connected'):
+                    self.connected.add(str(path))
+        except dbus.exceptions.DBusException as e:
+            logger.warning(f"Could not list BlueZ devices: {e}")
+        logger.info(f"BlueZ devices connected: {len(self.connected)}")
+
+    def on_device_properties_changed(self, interface, changed, invalidated, path=None):
+        """org.freedesktop.DBus.Properties.PropertiesChanged for org.bluez.Device1"""
+        if 'Connected' not in changed:
+            return
+        if changed['Connected']:
+            self._arrived(str(path))
+        else:
+            self._gone(str(path))
+
+    def on_interfaces_added(self, path, interfaces):
+        if interfaces.get(BLUEZ_DEVICE_IFACE, {}).get('Connected'):
+            self._arrived(str(path))
+
+    def on_interfaces_removed(self, path, interfaces):
+        if BLUEZ_DEVICE_IFACE in interfaces:
+            self._gone(str(path))
+
+    def _arrived(self, path):
+        if path in self.connected:
+            return
+        self.connected.add(path)
+        logger.info(f"BlueZ device connected: {path}")
+        failsafe_watchdog.on_ble_connected()
+
+    def _gone(self, path):
+        if path not in self.connected:
+            return
+        self.connected.discard(path)
+        self.disconnects += 1
+        logger.warning(f"BlueZ device disconnected: {path}")
+        if self.connected:
+            return      # the BLE session is shared by all connected devices
+        failsafe_watchdog.on_ble_disconnected()
+        # BlueZ does not always call StopNotify for a client that vanished
+        for characteristic in (status_characteristic_obj, telemetry_characteristic_obj):
+            if characteristic and characteristic.notifying:
+                characteristic.notifying = False
+                logger.info(f"Stopped notifying for {type(characteristic).__name__} (last BLE device disconnected).")
+        event_queue.clear()
+        command_admission.forget(ble_session)
+
+    def wake(self):
+        for timer in (telemetry_streamer.timer, fusion_reader.timer):
+            if timer:
+                timer.wake()
+
+    def on_session_opened(self, session):
+        """A network transport client appeared (it receives telemetry from now on)"""
+        self.wake()
+
+    def on_session_closed(self, session):
+        command_admission.forget(session)
+        failsafe_watchdog.on_session_closed(session)
+
+connection_tracker = ConnectionTracker()
+
+def clock_sync_reply(request, received_us):
+    """
+    'TSYNC <t0>' -> 'TSYNC:<t0>:<t1>:<t2>:<arduino offset>:<arduino error>'
+    t1/t2 are the bridge's receive and reply times, the Arduino offset (micros() minus
+    bridge clock at t2) and its bound are empty until the telemetry reads have set them.
+    All values in microseconds.
+    """
+    t0 = int(request[len(TSYNC_PREFIX):])
+    clock = telemetry_streamer.arduino_clock
+    replied_us = now_us()
+    arduino = f"{clock.offset(replied_us):.0f}:{clock.error_us:.0f}" if clock.synced else ":"
+    return f"TSYNC:{t0}:{received_us}:{replied_us}:{arduino}".encode('ascii')
 
 # --- Helper functions etc. (borrowed from BlueZ samples, no change) ---
 def find_adapter(bus_obj): # Changed to 'bus_obj' to avoid name collision with 'bus'
@@ -305,6 +1907,10 @@ class DroneService(Service):
         super().__init__(bus_obj, index, DRONE_SERVICE_UUID, True)
         self.add_characteristic(CommandCharacteristic(bus_obj, 0, self))
         self.add_characteristic(StatusCharacteristic(bus_obj, 1, self))
+        self.add_characteristic(ParamsCharacteristic(bus_obj, 2, self))
+        self.add_characteristic(KillCharacteristic(bus_obj, 3, self))
+        self.add_characteristic(MissionCharacteristic(bus_obj, 4, self))
+        self.add_characteristic(TelemetryCharacteristic(bus_obj, 5, self))
 
 class CommandCharacteristic(Characteristic):
     def __init__(self, bus_obj, index, service):
@@ -316,79 +1922,39 @@ class CommandCharacteristic(Characteristic):
         """
         Called when iPhone app writes data to COMMAND_CHARACTERISTIC.
         """
-        try:
-            # debug: received data detail information
-            logger.info(f"Raw value type: {type(value)}, length: {len(value)}")
-            logger.info(f"Raw value bytes: {[hex(b) for b in value]}")
-            
-            # empty data check
-            if not value or len(value) == 0:
-                logger.warning("Received empty BLE command")
-                GLib.idle_add(send_status_notification, "ERR:Empty_CMD")
-                return
-            
-            # Base64 decode attempt
-            try:
-                # first get raw byte data as UTF-8 string
-                base64_str = bytes(value).decode('utf-8').strip()
-                logger.info(f"Received Base64 string: '{base64_str}'")
-                
-                # Base64 decode
-                decoded_bytes = base64.b64decode(base64_str)
-                command_str = decoded_bytes.decode('utf-8').strip()
-                logger.info(f"Decoded command: '{command_str}'")
-            except (binascii.Error, ValueError) as b64_err:
-                logger.warning(f"Base64 decode failed: {b64_err}, trying direct UTF-8 decode")
-                # If Base64 decode fails, try direct UTF-8 decode (for compatibility)
-                command_str = bytes(value).decode('utf-8').strip()
-                logger.info(f"Direct decoded command: '{command_str}'")
-
-            # empty string check
-            if not command_str:
-                logger.warning("Command string is empty after decoding")
-                GLib.idle_add(send_status_notification, "ERR:Empty_STR")
-                return
+        if 'mtu' in options:
+            telemetry_streamer.set_mtu(int(options['mtu']))
+        process_command(value, ble_session)
 
-            # transmit command to Arduino via I2C
-            if bus: # check if I2C bus is initialized
-                # convert string to byte list
-                data_bytes = [ord(char) for char in command_str]
-                # write to Arduino via I2C (using write_i2c_block_data)
-                try:
-                    bus.write_i2c_block_data(ARDUINO_I2C_ADDRESS, 0, data_bytes) # 0 is register address (arbitrary)
-                    logger.info(f"Sent to Arduino via I2C: '{command_str}'")
-                    GLib.idle_add(send_status_notification, f"CMD_RX:{command_str[:15]}")
-                except Exception as i2c_error:
-                    logger.error(f"I2C write error: {i2c_error}")
-                    GLib.idle_add(send_status_notification, "ERR:I2C_Write")
-            else:
-                logger.warning("I2C bus not initialized. Command not forwarded.")
-                GLib.idle_add(send_status_notification, "ERR:I2C_Not_Ready")
+class KillCharacteristic(Characteristic):
+    def __init__(self, bus_obj, index, service):
+        super().__init__(bus_obj, index, KILL_CHARACTERISTIC_UUID,
+                         ['write-without-response', 'write'], service)
 
-        except UnicodeDecodeError as e:
-            logger.error(f"Failed to decode BLE data (not UTF-8): {e}")
-            logger.error(f"Raw bytes that failed to decode: {[hex(b) for b in value]}")
-            # try processing as raw byte data
-            try:
-                # extract only ASCII range characters
-                ascii_chars = [chr(b) for b in value if 32 <= b <= 126]
-                if ascii_chars:
-                    command_str = ''.join(ascii_chars)
-                    logger.info(f"Extracted ASCII command: '{command_str}'")
-                    GLib.idle_add(send_status_notification, f"ASCII:{command_str[:13]}")
-                else:
-                    GLib.idle_add(send_status_notification, "ERR:No_ASCII")
-            except Exception as extract_error:
-                logger.error(f"Failed to extract ASCII: {extract_error}")
-                GLib.idle_add(send_status_notification, "ERR:Decode")
-        except Exception as e:
-            logger.error(f"Error processing command: {e}")
-            GLib.idle_add(send_status_notification, f"ERR:{str(e)[:20]}")
+    def WriteValue(self, value, options):
+        """
+        Any write is an emergency stop. Deliberately does nothing before the I2C writes.
+        """
+        emergency_stop_all()
+
+class MissionCharacteristic(Characteristic):
+    def __init__(self, bus_obj, index, service):
+        super().__init__(bus_obj, index, MISSION_CHARACTERISTIC_UUID, ['write'], service)
+
+    def WriteValue(self, value, options):
+        """
+        Mission upload chunk: [uint16 offset][data]. Acknowledged writes keep the upload in order.
+        """
+        try:
+            mission_executor.write_chunk(bytes(value))
+        except ValueError as e:
+            raise InvalidArgsException(str(e))
 
 class StatusCharacteristic(Characteristic):
+    """Acks, replies and status events (text); indicate for delivery confirmed by the client"""
     def __init__(self, bus_obj, index, service):
         super().__init__(bus_obj, index, STATUS_CHARACTERISTIC_UUID,
-                         ['read', 'notify'], service)
+                         ['read', 'notify', 'indicate'], service)
         self.notifying = False # manage notification state
 
     def ReadValue(self, options):
@@ -419,6 +1985,7 @@ class StatusCharacteristic(Characteristic):
             return
 
         self.notifying = False
+        event_queue.clear()
         logger.info("Stopped notifying for StatusCharacteristic.")
 
     @dbus.service.signal(DBUS_PROP_IFACE, signature='sa{sv}as')
@@ -429,22 +1996,301 @@ class StatusCharacteristic(Characteristic):
         """
         pass
 
-def send_status_notification(status_message: str):
+class TelemetryCharacteristic(Characteristic):
+    """Binary telemetry packets and their TKEY stamps, sized to the MTU; newest data only"""
+    def __init__(self, bus_obj, index, service):
+        super().__init__(bus_obj, index, TELEMETRY_CHARACTERISTIC_UUID,
+                         ['read', 'notify'], service)
+        self.notifying = False
+
+    def ReadValue(self, options):
+        """Newest sample as a keyframe packet"""
+        return dbus.Array(telemetry_streamer.snapshot(), signature='y')
+
+    def StartNotify(self):
+        if self.notifying:
+            return
+        self.notifying = True
+        telemetry_streamer.encoder.request_keyframe()
+        connection_tracker.wake()
+        logger.info("Started notifying for TelemetryCharacteristic.")
+
+    def StopNotify(self):
+        if not self.notifying:
+            return
+        self.notifying = False
+        logger.info("Stopped notifying for TelemetryCharacteristic.")
+
+    def notify(self, payload):
+        try:
+            self.PropertiesChanged(GATT_CHRC_IFACE, {'Value': dbus.Array(payload, signature='y')}, NO_INVALIDATED)
+        except Exception as e:
+            metrics.telemetry_skipped += 1
+            logger.debug(f"Telemetry notification failed: {e}")
+
+    @dbus.service.signal(DBUS_PROP_IFACE, signature='sa{sv}as')
+    def PropertiesChanged(self, interface, changed_properties, invalidated_properties):
+        pass
+
+class ParamsCharacteristic(Characteristic):
+    def __init__(self, bus_obj, index, service):
+        super().__init__(bus_obj, index, PARAMS_CHARACTERISTIC_UUID,
+                         ['read'], service)
+
+    def ReadValue(self, options):
+        """
+        Return the whole parameter mirror in one read.
+        BlueZ splits long values into several ATT reads using the 'offset' option.
+        """
+        value = param_mirror.encode()
+        offset = int(options.get('offset', 0))
+        if offset == 0:
+            logger.info(f"Parameter mirror read (version {param_mirror.version}, {len(value)} bytes)")
+        return dbus.Array(value[offset:], signature='y')
+
+def process_command(value, session):
     """
-    Update drone status and send notification to subscribing iPhone app.
+    Command pipeline shared by every transport: decode, validate, handle bridge-local
+    commands, forward to the Arduino via I2C and notify clients.
+    `value` is the raw payload, `session` the client it came from.
     """
-    global status_characteristic_obj
-    if status_characteristic_obj and status_characteristic_obj.notifying:
+    received_us = now_us()
+    metrics.commands_received += 1
+    # D-Bus hands over a dbus.Array of dbus.Byte, network transports bytes
+    payload = value if isinstance(value, bytes) else bytes(value)
+    # clock sync ping, answered before anything that would add to the measured delay
+    if payload.startswith(TSYNC_PREFIX):
+        metrics.commands_decoded['TSYNC'] += 1
+        failsafe_watchdog.heartbeat()
         try:
-            value_bytes = dbus.Array(status_message.encode('utf-8'), signature='y')
-            status_characteristic_obj.PropertiesChanged(
-                GATT_CHRC_IFACE,
-                {'Value': value_bytes},
-                []
-            )
-            logger.info(f"Notified status: '{status_message}'")
+            session.send(clock_sync_reply(payload, received_us))
+        except ValueError as e:
+            logger.warning(f"Bad clock sync request {payload!r}: {e}")
+        return
+    # mission upload chunk from a network client (binary, never Base64)
+    if payload.startswith(MISSION_DATA_PREFIX):
+        metrics.commands_decoded['MDATA'] += 1
+        try:
+            mission_executor.write_chunk(payload[len(MISSION_DATA_PREFIX):])
+        except ValueError as e:
+            session.send(f"MISSION:ERR:{e}".encode()[:64])
+        return
+    # tagged command (group sends): acked to its sender only, with the bridge's receive time
+    command_id = None
+    if payload.startswith(COMMAND_ID_PREFIX):
+        command_id, _, payload = payload[1:].partition(b' ')
+        command_id = command_id.decode('ascii', 'replace')
+    try:
+        # debug: received data detail information
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Raw value type: {type(value)}, length: {len(value)}")
+            logger.debug(f"Raw value bytes: {[hex(b) for b in payload]}")
+
+        # empty data check
+        if not payload:
+            logger.warning("Received empty BLE command")
+            metrics.commands_failed['empty'] += 1
+            GLib.idle_add(send_status_notification, "ERR:Empty_CMD")
+            return
+
+        command_str, was_base64 = decode_payload(payload)
+        if not was_base64:
+            metrics.base64_fallbacks += 1
+
+        # empty string check
+        if not command_str:
+            logger.warning("Command string is empty after decoding")
+            metrics.commands_failed['empty'] += 1
+            GLib.idle_add(send_status_notification, "ERR:Empty_STR")
+            return
+
+        command = prepare_command(command_str)
+        metrics.commands_decoded[command.type] += 1
+
+        # kill sent as text on the command characteristic still takes the fast path
+        if command_str in ('ESTOP', 'EMERGENCY'):
+            emergency_stop_all()
+            if command_id is not None:
+                session.send(f"ACK:{command_id}:{received_us}".encode())
+            return
+
+        # heartbeats only feed the failsafe watchdog
+        if command_str == HEARTBEAT_COMMAND:
+            failsafe_watchdog.heartbeat()
+            return
+
+        # parameter mirror for clients without the params characteristic
+        if command_str == PARAMS_COMMAND:
+            session.send(b'PARAMS:' + param_mirror.encode())
+            return
+
+        # sensor fusion on/off and algorithm
+        if command.parts[0] == FUSION_COMMAND:
+            session.send(fusion_reader.command(command.parts[1:]).encode())
+            return
+
+        # onboard mission control
+        if command.parts[0] == MISSION_COMMAND:
+            session.send(mission_executor.command(command_str[len(MISSION_COMMAND):]).encode())
+            return
+
+        # STOP always wins over a running mission
+        if command_str == 'STOP':
+            mission_executor.abort('STOP')
+
+        # per-session rate limits (safety commands pass straight through)
+        if not command_admission.admit(command, command_id, session, received_us):
+            return
+
+        forward_command(command, command_id, session, received_us)
+
+    except UnicodeDecodeError as e:
+        logger.error(f"Failed to decode BLE data (not UTF-8): {e}")
+        metrics.commands_failed['decode'] += 1
+        logger.error(f"Raw bytes that failed to decode: {[hex(b) for b in payload]}")
+        # try processing as raw byte data
+        try:
+            # extract only ASCII range characters
+            ascii_chars = [chr(b) for b in payload if 32 <= b <= 126]
+            if ascii_chars:
+                command_str = ''.join(ascii_chars)
+                logger.info(f"Extracted ASCII command: '{command_str}'")
+                GLib.idle_add(send_status_notification, f"ASCII:{command_str[:13]}")
+            else:
+                GLib.idle_add(send_status_notification, "ERR:No_ASCII")
+        except Exception as extract_error:
+            logger.error(f"Failed to extract ASCII: {extract_error}")
+            GLib.idle_add(send_status_notification, "ERR:Decode")
+    except Exception as e:
+        logger.error(f"Error processing command: {e}")
+        metrics.commands_failed['error'] += 1
+        GLib.idle_add(send_status_notification, f"ERR:{str(e)[:20]}")
+
+def forward_command(command, command_id, session, received_us):
+    """Transmit an admitted command to the Arduino via I2C and answer the client"""
+    command_str = command.text
+    failsafe_watchdog.command_received(session)
+
+    error = None
+    if bus: # check if I2C bus is initialized
+        split = isinstance(bus, SplitBus)
+        try:
+            write_command_to_arduino(command_str,
+                                     answer=(command, command_id, session, received_us) if split else None)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Sent to Arduino via I2C: '{command_str}'")
+            if split:
+                # answered by command_written() once the control process has written it
+                telemetry_streamer.expect_results()
+                return
+        except Exception as i2c_error:
+            metric, error = failure_reason(i2c_error)
+            metrics.commands_failed[metric] += 1
+            if metric == 'too_long':
+                logger.warning(f"Command not sent: {i2c_error}")
+            elif metric == 'i2c_write':
+                logger.error(f"I2C write error: {i2c_error}")
+    else:
+        logger.warning("I2C bus not initialized. Command not forwarded.")
+        metrics.commands_failed['i2c_not_ready'] += 1
+        error = "I2C_Not_Ready"
+    answer_command(command, command_id, session, received_us, error)
+
+def answer_command(command, command_id, session, received_us, error):
+    """ACK/NAK a tagged command, CMD_RX/ERR status for an untagged one"""
+    if command_id is not None:
+        session.send(f"NAK:{command_id}:{error}".encode() if error
+                     else f"ACK:{command_id}:{received_us}".encode())
+    elif error:
+        GLib.idle_add(send_status_notification, f"ERR:{error}")
+    else:
+        GLib.idle_add(send_status_notification, command.ack)
+
+# --- Status events ---
+# Acks, replies and status strings go out on the status characteristic at once and in
+# order. Only while D-Bus refuses them are they queued and retried; telemetry holds
+# back as long as anything is queued, so an ack never waits behind bulk data.
+EVENT_QUEUE_MAX = 256
+EVENT_RETRY_MS = 20
+
+class EventQueue:
+    def __init__(self):
+        self.pending = deque()      # PropertiesChanged 'Value' dicts, oldest first
+        self.retrying = False
+
+    def put(self, properties):
+        """Send or queue one status notification. False if no BLE client is subscribed"""
+        if not (status_characteristic_obj and status_characteristic_obj.notifying):
+            metrics.notifications_dropped += 1
+            return False
+        if self.pending:
+            if len(self.pending) >= EVENT_QUEUE_MAX:
+                self.pending.popleft()
+                metrics.notifications_dropped += 1
+            self.pending.append(properties)
+        elif not self._send(properties):
+            self.pending.append(properties)
+            self.retrying = True
+            GLib.timeout_add(EVENT_RETRY_MS, self._retry)
+        return True
+
+    def clear(self):
+        metrics.notifications_dropped += len(self.pending)
+        self.pending.clear()
+
+    def _send(self, properties):
+        try:
+            status_characteristic_obj.PropertiesChanged(GATT_CHRC_IFACE, properties, NO_INVALIDATED)
         except Exception as e:
-            logger.error(f"Error sending BLE notification: {e}")
+            if not self.retrying:
+                logger.error(f"Error sending BLE notification (queued for retry): {e}")
+            return False
+        metrics.notifications_sent += 1
+        return True
+
+    def _retry(self):
+        """GLib timer: send the queue in order; keep running while D-Bus still refuses"""
+        while self.pending:
+            if not (status_characteristic_obj and status_characteristic_obj.notifying):
+                self.clear()
+                break
+            if not self._send(self.pending[0]):
+                return True
+            self.pending.popleft()
+        self.retrying = False
+        return False
+
+event_queue = EventQueue()
+
+def send_ble_notification(data: bytes):
+    """Notify BLE subscribers only (replies addressed to the BLE session)"""
+    event_queue.put({'Value': dbus.Array(data, signature='y')})
+    return GLib.SOURCE_REMOVE
+
+# encoded payload and PropertiesChanged arguments per status message (acks repeat)
+_status_values = {}
+NO_INVALIDATED = dbus.Array([], signature='s')
+
+def _status_value(status_message):
+    value = _status_values.get(status_message)
+    if value is None:
+        if len(_status_values) >= COMMAND_CACHE_SIZE:
+            _status_values.clear()
+        payload = status_message.encode('utf-8')
+        value = _status_values[status_message] = (payload, {'Value': dbus.Array(payload, signature='y')})
+    return value
+
+def send_status_notification(status_message: str):
+    """
+    Update drone status and send notification to subscribing iPhone app
+    and to every client of the network transports.
+    """
+    payload, properties = _status_value(status_message)
+    for transport in network_transports:
+        transport.broadcast(payload)
+    if event_queue.put(properties):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Notified status: '{status_message}'")
     else:
         logger.debug(f"Status '{status_message}' not sent (no subscribers or char not ready).")
     return GLib.SOURCE_REMOVE # when called from GLib.idle_add, execute once and end
@@ -514,6 +2360,103 @@ class Advertisement(dbus.service.Object):
             raise InvalidArgsException()
         return self.get_properties()[LE_ADVERTISEMENT_IFACE]
 
+    @dbus.service.signal(DBUS_PROP_IFACE, signature='sa{sv}as')
+    def PropertiesChanged(self, interface, changed_properties, invalidated_properties):
+        """BlueZ watches the registered advertisement and refreshes the advertising data"""
+        pass
+
+# --- Status broadcast ---
+# Connectionless status in the advertisement's manufacturer data, for ground stations that
+# watch many drones by passive scanning. Block (little endian):
+#   version, sequence, state flags, error flags, base throttle (uint16)
+ADV_COMPANY_ID = 0xFFFF         # Bluetooth SIG id reserved for tests / internal use
+ADV_STATUS_VERSION = 1
+ADV_STATUS_MS = 1000            # refresh interval, 0 = no status block
+ADV_STATE_ARMED = 0x01
+ADV_STATE_LANDING = 0x02
+ADV_STATE_PID = 0x04
+ADV_STATE_MISSION = 0x08
+ADV_ERR_I2C_DOWN = 0x01         # bus not open
+ADV_ERR_SLAVE_DOWN = 0x02       # Arduino circuit breaker open
+ADV_ERR_TELEMETRY = 0x04        # telemetry reads failing
+ADV_ERR_FAILSAFE = 0x08         # link-loss failsafe running
+
+class StatusBroadcast:
+    """
+    Refreshes the status block in the advertisement every interval. By default the new
+    value goes out as PropertiesChanged on the registered advertisement; with
+    reregister=True (BlueZ versions that ignore it) the advertisement is unregistered
+    and registered again. Neither affects established connections.
+    """
+    def __init__(self):
+        self.sequence = 0
+        self.advertisement = None
+        self.ad_manager = None
+        self.reregister = False
+        self._pending = False
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def encode(self):
+        state = ((ADV_STATE_ARMED if flight_state.armed else 0) |
+                 (ADV_STATE_LANDING if flight_state.landing else 0) |
+                 (ADV_STATE_PID if param_mirror.pid_enabled else 0) |
+                 (ADV_STATE_MISSION if mission_executor.running else 0))
+        errors = ((ADV_ERR_TELEMETRY if telemetry_streamer.read_failing else 0) |
+                  (ADV_ERR_FAILSAFE if failsafe_watchdog.active else 0))
+        if not bus or (isinstance(bus, I2CSession) and not bus.is_open):
+            errors |= ADV_ERR_I2C_DOWN
+        elif isinstance(bus, I2CSession) and bus.open_breakers():
+            errors |= ADV_ERR_SLAVE_DOWN
+        elif isinstance(bus, SplitBus) and bus.session_counters()['breakers_open']:
+            errors |= ADV_ERR_SLAVE_DOWN
+        base_thr = max(0, min(0xFFFF, int(param_mirror.values['base_thr'])))
+        return struct.pack('<BBBBH', ADV_STATUS_VERSION, self.sequence, state, errors, base_thr)
+
+    def start(self, ad_manager, advertisement, interval_ms, reregister=False):
+        """Put the first block in `advertisement` (before it is registered) and start the timer"""
+        self.ad_manager = ad_manager
+        self.advertisement = advertisement
+        self.reregister = reregister
+        advertisement.add_manufacturer_data(ADV_COMPANY_ID, self.encode())
+        GLib.timeout_add(interval_ms, self._refresh)
+        logger.info(f"Status broadcast in advertising data every {interval_ms} ms "
+                    f"({'re-registering' if reregister else 'PropertiesChanged'})")
+
+    def _refresh(self):
+        if self._pending:
+            return True     # the previous re-registration is still in flight
+        self.sequence = (self.sequence + 1) & 0xFF
+        self.advertisement.add_manufacturer_data(ADV_COMPANY_ID, self.encode())
+        self.refreshes += 1
+        if not self.reregister:
+            self.advertisement.PropertiesChanged(
+                LE_ADVERTISEMENT_IFACE,
+                {'ManufacturerData': self.advertisement.manufacturer_data}, NO_INVALIDATED)
+            return True
+        self._pending = True
+        self.ad_manager.UnregisterAdvertisement(self.advertisement.get_path(),
+                                                reply_handler=self._register,
+                                                error_handler=self._register)
+        return True
+
+    def _register(self, *error):
+        # an unregister error (e.g. BlueZ dropped it already) still ends in a register
+        self.ad_manager.RegisterAdvertisement(self.advertisement.get_path(), {},
+                                              reply_handler=self._registered,
+                                              error_handler=self._failed)
+
+    def _registered(self):
+        self._pending = False
+
+    def _failed(self, error):
+        self._pending = False
+        self.refresh_errors += 1
+        if self.refresh_errors == 1 or self.refresh_errors % 60 == 0:
+            logger.error(f"Advertisement refresh failed ({self.refresh_errors} times): {error}")
+
+status_broadcast = StatusBroadcast()
+
 def register_ad_cb():
     logger.info('BLE Advertisement registered successfully.')
 
@@ -529,17 +2472,19 @@ def register_app_error_cb(error):
     GLib.MainLoop().quit()
 
 # --- system requirements check function ---
-def check_system_requirements():
+def check_system_requirements(need_i2c=True, need_bluez=True):
     """check system requirements"""
-    import os
     import subprocess
     
     # check I2C device file existence
     i2c_device = f"/dev/i2c-{I2C_BUS}"
-    if not os.path.exists(i2c_device):
+    if need_i2c and not os.path.exists(i2c_device):
         logger.error(f"I2C device {i2c_device} not found. Please enable I2C interface.")
         logger.error("Run: sudo raspi-config -> Interface Options -> I2C -> Enable")
         return False
+
+    if not need_bluez:
+        return True
     
     # check BlueZ existence
     try:
@@ -580,29 +2525,179 @@ def setup_bluetooth_no_pairing():
     except Exception as e:
         logger.warning(f"Could not configure bluetooth: {e}")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Drone BLE bridge (BLE/UDP/WebSocket to Arduino I2C)")
+    parser.add_argument('--transport', action='append', choices=['ble', 'udp', 'ws'],
+                        help="command transport, may be repeated (default: ble)")
+    parser.add_argument('--bind', default='127.0.0.1',
+                        help="address for the udp/ws servers; they have no authentication, so "
+                             "use 0.0.0.0 (any interface) only on a trusted network")
+    parser.add_argument('--udp-port', type=int, default=UDP_PORT)
+    parser.add_argument('--ws-port', type=int, default=WS_PORT)
+    parser.add_argument('--mock-i2c', action='store_true', help="use MockI2C instead of the I2C bus")
+    parser.add_argument('--skip-bluez-setup', action='store_true',
+                        help="org.bluez is provided by something else (fake_bluez.py): skip the "
+                             "bluetoothctl/systemctl checks and pairing setup")
+    parser.add_argument('--split', action='store_true',
+                        help="run I2C in a separate control process fed through shared memory")
+    parser.add_argument('--control-cpu', type=int, help="--split: pin the control process to this CPU")
+    parser.add_argument('--control-priority', type=int, default=0,
+                        help="--split: SCHED_FIFO priority of the control process (0 = normal)")
+    parser.add_argument('--adv-status-ms', type=int, default=ADV_STATUS_MS,
+                        help="status block refresh in the advertising data (0 = off)")
+    parser.add_argument('--adv-reregister', action='store_true',
+                        help="refresh the status block by re-registering the advertisement "
+                             "(for BlueZ versions that ignore PropertiesChanged on it)")
+    parser.add_argument('--control-rate', type=float, default=ADMISSION_LIMITS['control'][0],
+                        help="flight commands per second per client (0 = unlimited)")
+    parser.add_argument('--config-rate', type=float, default=ADMISSION_LIMITS['config'][0],
+                        help="parameter/PID commands per second per client (0 = unlimited)")
+    parser.add_argument('--telemetry-rate', type=float, default=TELEMETRY_NOTIFY_RATE,
+                        help="BLE telemetry notifications per second (0 = unlimited)")
+    parser.add_argument('--fusion', choices=['off', *ESTIMATORS], default='off',
+                        help="Pi-side sensor fusion from the raw IMU register (FUSION command at runtime)")
+    return parser.parse_args()
+
+def open_i2c_session(opener):
+    """Retrying, self-recovering bus; the Arduino's telemetry register is the liveness probe"""
+    return I2CSession(opener, probe_address=ARDUINO_I2C_ADDRESS,
+                      probe_register=REG_TELEMETRY, probe_length=TELEMETRY_SIZE)
+
+def maintain_i2c():
+    """GLib timer: bus reopen and breaker probes (the control process does its own)"""
+    if isinstance(bus, I2CSession):
+        with i2c_lock:
+            bus.maintain()
+    return True
+
+def start_split_bus(args):
+    """I2C through the shared-memory rings of a control process (shm_bridge.py)"""
+    control_args = ['--bus', str(I2C_BUS), '--address', str(ARDUINO_I2C_ADDRESS),
+                    '--kill-payload', KILL_PAYLOAD.decode('ascii'),
+                    '--telemetry-register', str(REG_TELEMETRY),
+                    '--telemetry-size', str(TELEMETRY_SIZE),
+                    '--telemetry-period-ms', str(TELEMETRY_PERIOD_MS),
+                    '--priority', str(args.control_priority)]
+    for address in KNOWN_SLAVE_ADDRESSES:
+        control_args += ['--kill-address', str(address)]
+    if args.control_cpu is not None:
+        control_args += ['--cpu', str(args.control_cpu)]
+    if args.mock_i2c or not I2C_AVAILABLE:
+        control_args.append('--mock')
+    split_bus = SplitBus()
+    split_bus.start(control_args)
+    return split_bus
+
 def main():
     global bus, status_characteristic_obj # set I2C bus object as global as well
 
+    args = parse_args()
+    transports = set(args.transport or ['ble'])
+    use_ble = 'ble' in transports
+
     # 0. check system requirements
-    if not check_system_requirements():
+    need_bluez = use_ble and not args.skip_bluez_setup
+    if not check_system_requirements(need_i2c=not args.mock_i2c, need_bluez=need_bluez):
         logger.error("System requirements not met. Exiting.")
         sys.exit(1)
     
     # Bluetooth pairing settings
-    setup_bluetooth_no_pairing()
+    if need_bluez:
+        setup_bluetooth_no_pairing()
 
     # 1. I2C bus initialization
     global bus
-    if I2C_AVAILABLE:
+    if args.split:
         try:
-            bus = smbus2.SMBus(I2C_BUS) # open I2C bus
+            bus = start_split_bus(args)
+        except (OSError, RuntimeError) as e:
+            logger.error(f"Failed to start the I2C control process: {e}")
+            sys.exit(1)
+    elif args.mock_i2c:
+        logger.info("Mock I2C requested")
+        bus = open_i2c_session(MockI2C)
+    elif I2C_AVAILABLE:
+        # a bus that does not open now is retried (I2C_MAINTAIN_MS), not replaced by a mock
+        bus = open_i2c_session(lambda: smbus2.SMBus(I2C_BUS))
+        if bus.is_open:
             logger.info(f"Successfully opened I2C bus {I2C_BUS}.")
-        except Exception as e:
-            logger.error(f"Failed to open I2C bus: {e}. Using mock I2C.")
-            bus = MockI2C()
+        else:
+            logger.error(f"I2C bus {I2C_BUS} not open; commands fail with ERR:I2C_Not_Ready until it is.")
     else:
-        logger.info("I2C not available, using mock I2C")
-        bus = MockI2C()
+        logger.error("smbus2 is not installed (pip3 install smbus2); run with --mock-i2c to test without I2C.")
+        sys.exit(1)
+
+    # Initial parameter snapshot from the Arduino (firmware defaults if it does not answer)
+    if not param_mirror.load_from_controller(bus):
+        logger.warning("Parameter mirror starts from firmware defaults.")
+
+    # per-client command rate limits
+    for cls, rate in (('control', args.control_rate), ('config', args.config_rate)):
+        if rate > 0:
+            ADMISSION_LIMITS[cls] = (rate, ADMISSION_LIMITS[cls][1])
+        else:
+            del ADMISSION_LIMITS[cls]
+
+    if args.telemetry_rate > 0:
+        telemetry_streamer.budget = TokenBucket(args.telemetry_rate, TELEMETRY_NOTIFY_BURST)
+    else:
+        telemetry_streamer.budget = None
+
+    # 2. network transports (same pipeline as the BLE command characteristic)
+    try:
+        if 'udp' in transports:
+            network_transports.append(UdpTransport(args.bind, args.udp_port, process_command,
+                                                   connection_tracker.on_session_closed,
+                                                   connection_tracker.on_session_opened))
+        if 'ws' in transports:
+            network_transports.append(WebSocketTransport(args.bind, args.ws_port, process_command,
+                                                         connection_tracker.on_session_closed,
+                                                         connection_tracker.on_session_opened))
+    except OSError as e:
+        logger.error(f"Failed to start network transport: {e}")
+        sys.exit(1)
+
+    GLib.timeout_add(WATCHDOG_PERIOD_MS, failsafe_watchdog.check)
+    GLib.timeout_add(I2C_MAINTAIN_MS, maintain_i2c)
+
+    # local health endpoint
+    start_metrics_server()
+
+    # loop stall monitor; profiler toggled with SIGUSR2
+    loop_monitor.start()
+    profiler.main_ident = threading.get_ident()
+    GLib.unix_signal_add(GLib.PRIORITY_HIGH, signal.SIGUSR2, profiler.toggle)
+    logger.info(f"Sampling profiler: kill -USR2 {os.getpid()}")
+
+    ble = start_ble(args.adv_status_ms, args.adv_reregister) if use_ble else None
+
+    # 5. telemetry stream from the Arduino (polled at full rate only while someone is subscribed)
+    telemetry_streamer.start()
+    fusion_reader.start(None if args.fusion == 'off' else args.fusion)
+
+    # everything long-lived exists by now: move it out of the collector's generations,
+    # so collections triggered on the command path only scan what was allocated since
+    gc.collect()
+    gc.freeze()
+
+    # start main loop
+    mainloop = GLib.MainLoop()
+    try:
+        mainloop.run()
+    except KeyboardInterrupt:
+        logger.info("BLE Peripheral Stopped by user (Ctrl+C).")
+    finally:
+        profiler.stop()
+        if ble:
+            stop_ble(ble)
+        if isinstance(bus, SplitBus):
+            bus.close()
+        logger.info("Application exited.")
+        sys.exit(0)
+
+def start_ble(adv_status_ms=ADV_STATUS_MS, adv_reregister=False):
+    """Register the GATT application and advertisement with BlueZ. Returns handles for stop_ble()."""
+    global status_characteristic_obj, telemetry_characteristic_obj
 
     # 2. D-Bus and adapter initialization
     try:
@@ -621,19 +2716,23 @@ def main():
         logger.error(f"Failed to initialize D-Bus or find Bluetooth adapter: {e}")
         sys.exit(1)
 
+    # connection tracking: polling rate, cleanup of vanished clients, link-loss failsafe
+    connection_tracker.start(dbus_bus)
+
     # 3. register GATT application, service, and characteristics
     app = Application(dbus_bus)
     drone_service = DroneService(dbus_bus, 0)
     app.add_service(drone_service)
     
-    # save StatusCharacteristic instance to global variable
+    # save the notifying characteristics to global variables
     for char in drone_service.get_characteristics():
         if char.uuid == STATUS_CHARACTERISTIC_UUID:
             status_characteristic_obj = char
-            break
+        elif char.uuid == TELEMETRY_CHARACTERISTIC_UUID:
+            telemetry_characteristic_obj = char
     
-    if not status_characteristic_obj:
-        logger.error("StatusCharacteristic not found. Exiting.")
+    if not status_characteristic_obj or not telemetry_characteristic_obj:
+        logger.error("Status or telemetry characteristic not found. Exiting.")
         sys.exit(1)
 
     service_manager = dbus.Interface(
@@ -653,56 +2752,38 @@ def main():
     advertisement = Advertisement(dbus_bus, 0, 'peripheral')
     advertisement.add_service_uuid(DRONE_SERVICE_UUID)
     advertisement.add_local_name("RaspberryPiDrone") # Set device name
-    advertisement.include_tx_power = True  # Include transmission power (tip for no pairing required)
+    if adv_status_ms > 0:
+        # 31-byte legacy advertising data: flags 3 + 128-bit UUID 18 + status block 10;
+        # TX power would not fit (BlueZ moves the name to the scan response)
+        advertisement.include_tx_power = False
+        status_broadcast.start(ad_manager, advertisement, adv_status_ms, adv_reregister)
+    else:
+        advertisement.include_tx_power = True  # Include transmission power (tip for no pairing required)
 
     logger.info("Registering BLE Advertisement...")
     ad_manager.RegisterAdvertisement(advertisement.get_path(), {},
                                      reply_handler=register_ad_cb,
                                      error_handler=register_ad_error_cb)
 
-    # 5. Start GLib main loop
     logger.info("BLE Peripheral started. Advertising and waiting for Connects...")
-    
-    # GLib integrated loop to regularly read I2C data from Arduino and send notifications
-    def arduino_reader_loop():
-        if bus: # check if I2C bus is initialized
-            try:
-                # Read data from Arduino via I2C (example: 10 bytes)
-                # Arduino sketch needs to be prepared so data can be read with read_i2c_block_data
-                # Example: make Arduino return data with Wire.onRequest
-                # data_from_arduino = bus.read_i2c_block_data(ARDUINO_I2C_ADDRESS, 0, 10) 
-                
-                # generate dummy data here
-                dummy_status_from_arduino = f"Arduino_Loop:{int(time.time()) % 100}"
-                if dummy_status_from_arduino:
-                    logger.debug(f"Received (dummy) from Arduino via I2C: '{dummy_status_from_arduino}'")
-                    # if data received via I2C is valid, send BLE notification
-                    send_status_notification(f"I2C_DATA:{dummy_status_from_arduino}")
-            except Exception as e:
-                logger.error(f"Error reading from Arduino via I2C: {e}")
-        return True # return True to continue loop
-
-    GLib.timeout_add(500, arduino_reader_loop) # attempt to read from Arduino every 500ms
-
-    # start main loop
-    mainloop = GLib.MainLoop()
+    return {
+        'dbus_bus': dbus_bus,
+        'app': app,
+        'service_manager': service_manager,
+        'advertisement': advertisement,
+        'ad_manager': ad_manager,
+    }
+
+def stop_ble(ble):
+    logger.info("Unregistering GATT Application and Advertisement...")
     try:
-        mainloop.run()
-    except KeyboardInterrupt:
-        logger.info("BLE Peripheral Stopped by user (Ctrl+C).")
-    finally:
-        logger.info("Unregistering GATT Application and Advertisement...")
-        try:
-            service_manager.UnregisterApplication(app.get_path())
-        except Exception as e:
-            logger.warning(f"Failed to unregister application: {e}")
-        try:
-            ad_manager.UnregisterAdvertisement(advertisement.get_path())
-        except Exception as e:
-            logger.warning(f"Failed to unregister advertisement: {e}")
-
-        logger.info("Application exited.")
-        sys.exit(0)
+        ble['service_manager'].UnregisterApplication(ble['app'].get_path())
+    except Exception as e:
+        logger.warning(f"Failed to unregister application: {e}")
+    try:
+        ble['ad_manager'].UnregisterAdvertisement(ble['advertisement'].get_path())
+    except Exception as e:
+        logger.warning(f"Failed to unregister advertisement: {e}")
 
 if __name__ == '__main__':
     main()
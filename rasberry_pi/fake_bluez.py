@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Fake BlueZ: run the bridge over real D-Bus without Bluetooth hardware
+
+Starts a private dbus-daemon and claims org.bluez on it with one adapter
+(/org/bluez/hci0) implementing GattManager1 and LEAdvertisingManager1, then starts
+drone_ble_server.py with DBUS_SYSTEM_BUS_ADDRESS pointing at that bus. When the
+bridge registers its application, the fake reads it back with GetManagedObjects the
+way BlueZ does, subscribes to the status and telemetry characteristics (StartNotify) and drives
+WriteValue on the command characteristic at the configured rate, like a connected
+central. Every PropertiesChanged signal from the bridge is collected.
+
+Writes are tagged ('#<n> <command>'), so each comes back as 'ACK:<n>:<bridge
+receive us>' on the status characteristic. Both processes use the same monotonic
+clock, which gives per command:
+  dispatch     : WriteValue sent -> process_command() in the bridge
+  notification : WriteValue sent -> ack PropertiesChanged received here
+  call         : WriteValue sent -> method reply
+
+    python3 fake_bluez.py --rate 200 --seconds 10
+    python3 fake_bluez.py --rate 500 --json dbus.json -- --split
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import dbus
+import dbus.mainloop.glib
+import dbus.service
+from gi.repository import GLib
+
+from clock_sync import now_us
+from telemetry_codec import is_telemetry
+
+logger = logging.getLogger(__name__)
+
+BLUEZ_SERVICE_NAME = 'org.bluez'
+ADAPTER_PATH = '/org/bluez/hci0'
+ADAPTER_IFACE = 'org.bluez.Adapter1'
+GATT_MANAGER_IFACE = 'org.bluez.GattManager1'
+LE_ADVERTISING_MANAGER_IFACE = 'org.bluez.LEAdvertisingManager1'
+LE_ADVERTISEMENT_IFACE = 'org.bluez.LEAdvertisement1'
+GATT_CHRC_IFACE = 'org.bluez.GattCharacteristic1'
+DBUS_OM_IFACE = 'org.freedesktop.DBus.ObjectManager'
+DBUS_PROP_IFACE = 'org.freedesktop.DBus.Properties'
+
+COMMAND_CHARACTERISTIC_UUID = '6e400002-b5a3-f393-e0a9-e50e24dcca9e'
+STATUS_CHARACTERISTIC_UUID = '6e400003-b5a3-f393-e0a9-e50e24dcca9e'
+TELEMETRY_CHARACTERISTIC_UUID = '6e400007-b5a3-f393-e0a9-e50e24dcca9e'
+
+BRIDGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'drone_ble_server.py')
+STARTUP_TIMEOUT_S = 20.0
+DRAIN_S = 1.0           # wait for the last acks after the final write
+TICK_MS = 1             # writer timer; writes due since the last tick go out together
+
+
+def start_dbus_daemon():
+    """Private bus (session config: a fresh socket, no policy). Returns (process, address)"""
+    process = subprocess.Popen(['dbus-daemon', '--session', '--nofork', '--print-address=1'],
+                               stdout=subprocess.PIPE, text=True)
+    address = process.stdout.readline().strip()
+    if not address:
+        process.kill()
+        raise RuntimeError("dbus-daemon did not report an address")
+    return process, address
+
+
+class ObjectManager(dbus.service.Object):
+    """'/' of org.bluez: the bridge's find_adapter() looks for the managers here"""
+
+    def __init__(self, conn):
+        dbus.service.Object.__init__(self, conn, '/')
+
+    @dbus.service.method(DBUS_OM_IFACE, out_signature='a{oa{sa{sv}}}')
+    def GetManagedObjects(self):
+        return {dbus.ObjectPath(ADAPTER_PATH): {
+            ADAPTER_IFACE: {'Address': '00:00:00:00:00:00', 'Powered': dbus.Boolean(True)},
+            GATT_MANAGER_IFACE: {},
+            LE_ADVERTISING_MANAGER_IFACE: {'ActiveInstances': dbus.Byte(0),
+                                           'SupportedInstances': dbus.Byte(5)},
+        }}
+
+
+class FakeAdapter(dbus.service.Object):
+    """hci0 with GattManager1 and LEAdvertisingManager1; drives the registered application"""
+
+    def __init__(self, conn, args, done):
+        dbus.service.Object.__init__(self, conn, ADAPTER_PATH)
+        self.conn = conn
+        self.args = args
+        self.done = done
+        self.app = None             # (sender, path)
+        self.command = None         # command characteristic proxy
+        self.status_path = None
+        self.telemetry_path = None
+        self.advertisement = None
+        # workload
+        self.interval_us = 1e6 / args.rate
+        self.total = int(args.rate * args.seconds)
+        self.written = 0
+        self.started_us = None
+        self.next_write_us = None
+        self.sent_at = {}
+        # results
+        self.dispatch_us = []
+        self.notify_us = []
+        self.call_us = []
+        self.write_errors = 0
+        self.naks = 0
+        self.signals = defaultdict(int)
+        self.finished_writing_us = None
+
+    # --- GattManager1 ---
+    @dbus.service.method(GATT_MANAGER_IFACE, in_signature='oa{sv}', sender_keyword='sender')
+    def RegisterApplication(self, path, options, sender=None):
+        # BlueZ reads the whole tree before it replies; the bridge's call is asynchronous
+        om = dbus.Interface(self.conn.get_object(sender, path), DBUS_OM_IFACE)
+        objects = om.GetManagedObjects()
+        for obj_path, interfaces in objects.items():
+            chrc = interfaces.get(GATT_CHRC_IFACE)
+            if not chrc:
+                continue
+            uuid = str(chrc['UUID']).lower()
+            if uuid == COMMAND_CHARACTERISTIC_UUID:
+                self.command = dbus.Interface(self.conn.get_object(sender, obj_path), GATT_CHRC_IFACE)
+            elif uuid == STATUS_CHARACTERISTIC_UUID:
+                self.status_path = str(obj_path)
+            elif uuid == TELEMETRY_CHARACTERISTIC_UUID:
+                self.telemetry_path = str(obj_path)
+        if self.command is None or self.status_path is None:
+            raise dbus.exceptions.DBusException('command/status characteristic missing',
+                                                name='org.bluez.Error.InvalidArguments')
+        self.app = (sender, path)
+        logger.info(f"Application {path} from {sender}: {len(objects)} objects")
+        GLib.idle_add(self._connect, sender)
+
+    @dbus.service.method(GATT_MANAGER_IFACE, in_signature='o')
+    def UnregisterApplication(self, path):
+        self.app = None
+
+    # --- LEAdvertisingManager1 ---
+    @dbus.service.method(LE_ADVERTISING_MANAGER_IFACE, in_signature='oa{sv}', sender_keyword='sender')
+    def RegisterAdvertisement(self, path, options, sender=None):
+        props = dbus.Interface(self.conn.get_object(sender, path), DBUS_PROP_IFACE)
+        self.advertisement = props.GetAll(LE_ADVERTISEMENT_IFACE)
+        self.signals['advertisement_registered'] += 1
+
+    @dbus.service.method(LE_ADVERTISING_MANAGER_IFACE, in_signature='o')
+    def UnregisterAdvertisement(self, path):
+        self.signals['advertisement_unregistered'] += 1
+
+    # --- Central side ---
+    def _connect(self, sender):
+        """Subscribe like a central that just connected, then start writing"""
+        self.conn.add_signal_receiver(self._properties_changed, dbus_interface=DBUS_PROP_IFACE,
+                                      signal_name='PropertiesChanged', bus_name=sender,
+                                      path_keyword='path')
+        if self.telemetry_path:
+            telemetry = dbus.Interface(self.conn.get_object(sender, self.telemetry_path), GATT_CHRC_IFACE)
+            telemetry.StartNotify(reply_handler=lambda: None, error_handler=self._fail)
+        status = dbus.Interface(self.conn.get_object(sender, self.status_path), GATT_CHRC_IFACE)
+        status.StartNotify(reply_handler=self._notifying, error_handler=self._fail)
+        return False
+
+    def _notifying(self):
+        logger.info(f"Notifying; writing {self.total} commands at {self.args.rate:g}/s")
+        self.started_us = self.next_write_us = now_us()
+        GLib.timeout_add(TICK_MS, self._write_due)
+
+    def _write_due(self):
+        now = now_us()
+        while self.written < self.total and now >= self.next_write_us:
+            self._write(self.written)
+            self.written += 1
+            self.next_write_us += self.interval_us
+        if self.written < self.total:
+            return True
+        self.finished_writing_us = now
+        GLib.timeout_add(int(DRAIN_S * 1000), self._finish)
+        return False
+
+    def _write(self, n):
+        value = dbus.Array(f"#{n} {self.args.command}".encode(), signature='y')
+        options = {'type': 'command', 'mtu': dbus.UInt16(self.args.mtu)}
+        sent = self.sent_at[str(n)] = now_us()
+        self.command.WriteValue(value, options,
+                                reply_handler=lambda: self.call_us.append(now_us() - sent),
+                                error_handler=self._write_error)
+
+    def _write_error(self, error):
+        self.write_errors += 1
+        if self.write_errors == 1:
+            logger.error(f"WriteValue failed: {error}")
+
+    def _properties_changed(self, interface, changed, invalidated, path=None):
+        received = now_us()
+        if path == self.telemetry_path and 'Value' in changed:
+            self.signals['telemetry'] += 1
+            return
+        if path != self.status_path or interface != GATT_CHRC_IFACE or 'Value' not in changed:
+            self.signals['other'] += 1
+            return
+        data = bytes(changed['Value'])
+        if is_telemetry(data):
+            self.signals['telemetry'] += 1
+            return
+        text = data.decode('utf-8', 'replace')
+        kind = text.split(':', 1)[0]
+        self.signals[kind] += 1
+        if kind in ('ACK', 'NAK'):
+            _, tag, rest = text.split(':', 2)
+            sent = self.sent_at.pop(tag, None)
+            if sent is None:
+                return
+            if kind == 'NAK':
+                self.naks += 1
+                return
+            self.dispatch_us.append(int(rest) - sent)
+            self.notify_us.append(received - sent)
+
+    def _fail(self, error):
+        logger.error(f"StartNotify failed: {error}")
+        self.done(1)
+
+    def _finish(self):
+        self.done(0)
+        return False
+
+    def report(self):
+        elapsed = max((self.finished_writing_us or now_us()) - (self.started_us or now_us()), 1)
+        return {
+            'rate': self.args.rate,
+            'written': self.written,
+            'achieved_rate': self.written / elapsed * 1e6,
+            'acked': len(self.notify_us),
+            'lost': len(self.sent_at),
+            'naks': self.naks,
+            'write_errors': self.write_errors,
+            'dispatch_us': summarize(self.dispatch_us),
+            'notification_us': summarize(self.notify_us),
+            'call_us': summarize(self.call_us),
+            'signals': dict(self.signals),
+            'advertisement': sorted(str(k) for k in (self.advertisement or {})),
+        }
+
+
+def summarize(values):
+    if not values:
+        return {}
+    values = sorted(values)
+    n = len(values)
+    return {'n': n, 'mean': sum(values) / n, 'p50': values[n // 2],
+            'p99': values[min(n - 1, int(n * 0.99))], 'max': values[-1]}
+
+
+def print_report(report):
+    print(f"{report['written']} writes at {report['achieved_rate']:.0f}/s (asked {report['rate']:g}/s), "
+          f"{report['acked']} acked, {report['lost']} without ack, {report['naks']} NAK, "
+          f"{report['write_errors']} write errors")
+    for name in ('dispatch_us', 'notification_us', 'call_us'):
+        s = report[name]
+        if s:
+            print(f"{name[:-3]:<13} mean {s['mean'] / 1000:7.3f} ms  p50 {s['p50'] / 1000:7.3f} ms  "
+                  f"p99 {s['p99'] / 1000:7.3f} ms  max {s['max'] / 1000:7.3f} ms")
+    print(f"signals: {report['signals']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fake BlueZ on a private D-Bus: drive the bridge without hardware",
+                                     epilog="arguments after -- go to drone_ble_server.py")
+    parser.add_argument('--rate', type=float, default=100.0, help="command writes per second")
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--command', default='FWD', help="command written (tagged with a sequence number)")
+    parser.add_argument('--mtu', type=int, default=247, help="ATT MTU passed in the WriteValue options")
+    parser.add_argument('--json', help="write the report to this file")
+    parser.add_argument('--bridge-log', help="bridge output to this file (default: discarded)")
+    parser.add_argument('bridge_args', nargs='*', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - fake_bluez - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+
+    daemon, address = start_dbus_daemon()
+    logger.info(f"Private bus at {address}")
+    bridge = None
+    status = [1]
+    try:
+        dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+        conn = dbus.bus.BusConnection(address)
+        name = dbus.service.BusName(BLUEZ_SERVICE_NAME, conn)
+        mainloop = GLib.MainLoop()
+
+        def done(code):
+            status[0] = code
+            mainloop.quit()
+
+        ObjectManager(conn)
+        adapter = FakeAdapter(conn, args, done)
+
+        env = dict(os.environ, DBUS_SYSTEM_BUS_ADDRESS=address)
+        log = open(args.bridge_log, 'w') if args.bridge_log else subprocess.DEVNULL
+        bridge = subprocess.Popen([sys.executable, BRIDGE, '--mock-i2c', '--skip-bluez-setup',
+                                   *args.bridge_args], env=env, stdout=log, stderr=subprocess.STDOUT)
+
+        def startup_timeout():
+            if adapter.app is None:
+                logger.error(f"The bridge did not register an application within {STARTUP_TIMEOUT_S:g} s")
+                done(1)
+            return False
+
+        def bridge_exited():
+            if bridge.poll() is None:
+                return True
+            logger.error(f"The bridge exited with status {bridge.returncode}")
+            done(1)
+            return False
+
+        GLib.timeout_add(int(STARTUP_TIMEOUT_S * 1000), startup_timeout)
+        GLib.timeout_add(200, bridge_exited)
+        mainloop.run()
+        del name
+
+        report = adapter.report()
+        print_report(report)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=2)
+    finally:
+        if bridge is not None and bridge.poll() is None:
+            bridge.terminate()
+            try:
+                bridge.wait(5)
+            except subprocess.TimeoutExpired:
+                bridge.kill()
+        daemon.terminate()
+        daemon.wait()
+    sys.exit(status[0])
+
+
+if __name__ == '__main__':
+    main()
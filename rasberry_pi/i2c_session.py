@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Resilient I2C session
+
+Wraps an SMBus-like object (smbus2.SMBus, MockI2C) with the same block read/write
+methods, for the bridge and for the split control process (shm_bridge.py):
+
+- retry: a failed transaction is retried up to `retries` times after a short,
+  doubling backoff. NACKs and timeouts on noisy wiring usually pass on the retry.
+- recovery: `reopen_after` consecutive bus-level failures (not NACKs), or an error
+  that means the adapter or file descriptor is gone, close and reopen the bus and
+  reprobe the slave.
+  A bus that cannot be opened is retried, never replaced by a mock.
+- circuit breaker, per slave address: `trip_after` consecutive failed transactions
+  open it, and transactions then fail at once (CircuitOpenError) instead of
+  spending bus time on a dead slave. Once the cooldown is over, the next
+  transaction (or maintain()) goes through as a probe: success closes the
+  breaker, failure opens it again with twice the cooldown.
+
+Commands go out with send_command(): raw frames, no SMBus register byte, each one
+a combined write + repeated-start read (i2c_rdwr) that returns the slave's ack block
+in the same transaction. Commands longer than one frame are sent as explicit chunks.
+The slave keeps the id of the last command it took across a bridge restart, so every
+time the bus opens the id sequence continues after it (read from the ack register).
+
+Forced transactions (the emergency stop) ignore the breaker and do not back off.
+Callers serialize access (the bridge's i2c_lock); the session has no lock of its own.
+"""
+
+import errno
+import logging
+import random
+import time
+from collections import defaultdict, namedtuple
+
+try:
+    from smbus2 import i2c_msg
+except ImportError:     # mock buses provide write_read() instead
+    i2c_msg = None
+
+logger = logging.getLogger(__name__)
+
+# errno -> error class reported in the counters; only some classes are worth a retry
+ERROR_CLASSES = {
+    errno.EREMOTEIO: 'nack',        # slave did not acknowledge (i2c-bcm2835)
+    errno.ENXIO: 'nack',
+    errno.ETIMEDOUT: 'timeout',     # clock stretching / stuck bus
+    errno.EIO: 'io',
+    errno.EAGAIN: 'busy',
+    errno.EBUSY: 'busy',
+    errno.ENODEV: 'bus_gone',       # adapter removed
+    errno.EBADF: 'bus_gone',        # bus closed under us
+    errno.ENOENT: 'bus_gone',
+    errno.EPROTO: 'protocol',       # ack block for a different frame
+}
+RETRYABLE = {'nack', 'timeout', 'io', 'busy', 'bus_gone', 'protocol'}
+# a NACK means the bus itself works; only these point at the adapter or a stuck bus
+REOPEN_CLASSES = {'timeout', 'io', 'busy', 'bus_gone'}
+
+
+# --- Command frames (drone_controller.ino onReceive) ---
+# [kind][command id][offset][payload]; the AVR Wire buffer takes 32 bytes per write
+FRAME_MORE = 0x02       # a chunk, more follow
+FRAME_FINAL = 0x03      # last (or only) chunk: the command is complete
+FRAME_HEADER = 3
+WIRE_BUFFER = 32
+CHUNK_SIZE = WIRE_BUFFER - FRAME_HEADER
+COMMAND_MAX = 39        # firmware command buffer, 40 with the terminator
+
+# ack block read back in the same transaction: [command id][status][queue depth][flags]
+ACK_SIZE = 4
+# the ack register read on its own adds [last command taken], to resume the id sequence
+REG_ACK = 0x02
+ACK_REGISTER_SIZE = 5
+ACK_QUEUED = 1
+ACK_KILLED = 2
+ACK_CHUNK = 3
+ACK_DUPLICATE = 4       # a retried final frame; the first one was taken
+ACK_QUEUE_FULL = 5
+ACK_TOO_LONG = 6
+ACK_BAD_FRAME = 7
+ACK_TAKEN = {ACK_QUEUED, ACK_KILLED, ACK_DUPLICATE}
+ACK_NAMES = {ACK_QUEUE_FULL: 'Busy', ACK_TOO_LONG: 'Too_Long', ACK_BAD_FRAME: 'Bad_Frame'}
+ACK_FLAG_ESTOP = 0x01
+ACK_FLAG_PID = 0x02
+ACK_FLAG_LANDING = 0x04
+
+CommandAck = namedtuple('CommandAck', 'id status queued flags')
+
+OP_READ, OP_WRITE, OP_FRAME = range(3)
+
+
+def error_class(exc):
+    return ERROR_CLASSES.get(getattr(exc, 'errno', None), 'other')
+
+
+def command_frames(command_id, data):
+    """Split command bytes into frames for send_command()"""
+    frames = []
+    for offset in range(0, max(len(data), 1), CHUNK_SIZE):
+        kind = FRAME_FINAL if offset + CHUNK_SIZE >= len(data) else FRAME_MORE
+        frames.append(bytes((kind, command_id, offset)) + data[offset:offset + CHUNK_SIZE])
+    return frames
+
+
+def mock_ack(frame, queued=0):
+    """The firmware's ack block for a well-formed frame, for mock buses"""
+    if frame[0] == FRAME_MORE:
+        status = ACK_CHUNK
+    elif bytes(frame[FRAME_HEADER:]) in (b'ESTOP', b'EMERGENCY'):
+        status = ACK_KILLED
+    else:
+        status = ACK_QUEUED
+    return [frame[1], status, queued, 0]
+
+
+class CircuitOpenError(OSError):
+    """The slave's breaker is open; nothing was sent"""
+
+
+class BusUnavailableError(OSError):
+    """The bus is not open (opening failed and the retry is not due yet)"""
+
+
+class CommandTooLong(ValueError):
+    """More bytes than the firmware's command buffer; nothing was sent"""
+
+
+class CommandRejected(OSError):
+    """The slave answered but did not take the command (queue full, too long)"""
+
+    def __init__(self, ack):
+        super().__init__(errno.EAGAIN if ack.status == ACK_QUEUE_FULL else errno.EINVAL,
+                         f"command rejected: {ACK_NAMES.get(ack.status, ack.status)}")
+        self.ack = ack
+        self.reason = ACK_NAMES.get(ack.status, 'Rejected')
+
+
+def failure_reason(exc):
+    """(metrics key, NAK reason) for an exception from send_command()"""
+    if isinstance(exc, CircuitOpenError):
+        return 'i2c_slave_down', 'I2C_Slave_Down'
+    if isinstance(exc, BusUnavailableError):
+        return 'i2c_not_ready', 'I2C_Not_Ready'
+    if isinstance(exc, CommandRejected):
+        # the slave answered but did not queue it; Busy = its command queue is full
+        return 'arduino_rejected', f'Arduino_{exc.reason}'
+    if isinstance(exc, CommandTooLong):
+        return 'too_long', 'Too_Long'
+    return 'i2c_write', 'I2C_Write'
+
+
+class Breaker:
+    __slots__ = ('failures', 'open_until', 'cooldown')
+
+    def __init__(self, cooldown):
+        self.failures = 0       # consecutive failed transactions
+        self.open_until = 0.0   # 0 while closed
+        self.cooldown = cooldown
+
+
+class I2CSession:
+    def __init__(self, opener, probe_address=None, probe_register=0, probe_length=1,
+                 retries=2, backoff_s=0.0002, reopen_after=8, trip_after=12,
+                 cooldown_s=0.5, max_cooldown_s=2.0, reopen_interval_s=1.0):
+        self.opener = opener
+        self.probe_address = probe_address
+        self.probe_register = probe_register
+        self.probe_length = probe_length
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.reopen_after = reopen_after
+        self.trip_after = trip_after
+        self.cooldown_s = cooldown_s
+        self.max_cooldown_s = max_cooldown_s
+        self.reopen_interval_s = reopen_interval_s
+        self.bus = None
+        self.rdwr = False
+        self.command_id = 0
+        self.breakers = {}
+        self.consecutive_failures = 0
+        self.next_open_attempt = 0.0
+        # counters
+        self.errors = defaultdict(int)  # by error class
+        self.retried = 0                # retry attempts
+        self.recovered = 0              # transactions that succeeded on a retry
+        self.failed = 0                 # transactions that failed after all retries
+        self.fast_failures = 0          # refused by an open breaker
+        self.reopens = 0
+        self.open_failures = 0
+        self.trips = 0
+        self._open()
+
+    # --- SMBus interface ---
+    def write_i2c_block_data(self, address, register, data, force=False):
+        return self._transaction(address, OP_WRITE, register, data, force)
+
+    def read_i2c_block_data(self, address, register, length, force=False):
+        return self._transaction(address, OP_READ, register, length, force)
+
+    def send_command(self, address, data, force=False):
+        """
+        Send command bytes as frames, each a write + ack read in one transaction.
+        Returns the final frame's CommandAck; raises CommandRejected if the slave
+        did not take it, CommandTooLong before sending. A retried final frame is acked as a duplicate, not run twice.
+        """
+        if len(data) > COMMAND_MAX:
+            raise CommandTooLong(f"command is {len(data)} bytes, the firmware takes {COMMAND_MAX}")
+        self.command_id = self.command_id % 255 + 1     # 1..255, 0 is never sent
+        for frame in command_frames(self.command_id, data):
+            ack = self._transaction(address, OP_FRAME, None, frame, force)
+            if ack.status not in ACK_TAKEN and ack.status != ACK_CHUNK:
+                raise CommandRejected(ack)
+        return ack
+
+    def close(self):
+        if self.bus is not None:
+            try:
+                self.bus.close()
+            except OSError:
+                pass
+            self.bus = None
+
+    # --- State ---
+    @property
+    def is_open(self):
+        return self.bus is not None
+
+    def open_breakers(self):
+        return sorted(address for address, b in self.breakers.items() if b.open_until)
+
+    def counters(self):
+        return {
+            'errors': dict(self.errors), 'retried': self.retried, 'recovered': self.recovered,
+            'failed': self.failed, 'fast_failures': self.fast_failures, 'reopens': self.reopens,
+            'open_failures': self.open_failures, 'trips': self.trips,
+            'breakers_open': len(self.open_breakers()),
+        }
+
+    def maintain(self):
+        """Periodic: reopen a bus that could not be opened, probe slaves whose cooldown is over"""
+        now = time.monotonic()
+        if self.bus is None and now >= self.next_open_attempt:
+            if self._open():
+                self._probe(self.probe_address)
+        for address, breaker in list(self.breakers.items()):
+            if breaker.open_until and now >= breaker.open_until and self.bus is not None:
+                self._probe(address)
+
+    # --- Internals ---
+    def _open(self):
+        try:
+            self.bus = self.opener()
+        except Exception as e:
+            self.bus = None
+            self.rdwr = False
+            self.open_failures += 1
+            self.next_open_attempt = time.monotonic() + self.reopen_interval_s
+            if self.open_failures == 1 or self.open_failures % 60 == 0:
+                logger.error(f"I2C: could not open the bus ({e}), retrying every {self.reopen_interval_s:g} s")
+            return False
+        self.rdwr = i2c_msg is not None and hasattr(self.bus, 'i2c_rdwr')
+        if self.open_failures:
+            logger.info(f"I2C: bus open after {self.open_failures} failed attempt(s)")
+            self.open_failures = 0
+        self._sync_command_id()
+        return True
+
+    def _sync_command_id(self):
+        """
+        Continue after the slave's last taken command: restarting at 1 could repeat its
+        id, and the slave would ack that command as a duplicate without running it.
+        One plain read, no retries, so a forced open for a kill is not held up
+        """
+        if self.probe_address is None:
+            return
+        try:
+            raw = self.bus.read_i2c_block_data(self.probe_address, REG_ACK, ACK_REGISTER_SIZE)
+            self.command_id = raw[4]
+        except (OSError, IndexError) as e:
+            # unknown: a random start makes a repeat unlikely
+            self.command_id = random.randrange(255)
+            logger.warning(f"I2C: could not read the last command id ({e}), starting at {self.command_id + 1}")
+
+    def _reopen(self, why):
+        logger.warning(f"I2C: reopening the bus ({why})")
+        self.reopens += 1
+        self.consecutive_failures = 0
+        self.close()
+        if self._open():
+            self._probe(self.probe_address)
+
+    def _probe(self, address):
+        if address is None:
+            return
+        try:
+            self._transaction(address, OP_READ, self.probe_register, self.probe_length, False, probe=True)
+            logger.info(f"I2C: slave 0x{address:02X} answers")
+        except OSError as e:
+            logger.warning(f"I2C: probe of slave 0x{address:02X} failed: {e}")
+
+    def _transfer(self, address, op, register, arg):
+        if op == OP_READ:
+            return self.bus.read_i2c_block_data(address, register, arg)
+        if op == OP_WRITE:
+            return self.bus.write_i2c_block_data(address, register, arg)
+        if self.rdwr:
+            write = i2c_msg.write(address, arg)
+            read = i2c_msg.read(address, ACK_SIZE)
+            self.bus.i2c_rdwr(write, read)
+            raw = bytes(read)
+        else:
+            raw = self.bus.write_read(address, arg, ACK_SIZE)
+        if raw[0] != arg[1]:
+            raise OSError(errno.EPROTO, f"ack for command {raw[0]}, sent {arg[1]}")
+        return CommandAck(raw[0], raw[1], raw[2], raw[3])
+
+    def _transaction(self, address, op, register, arg, force, probe=False):
+        breaker = self.breakers.get(address)
+        if breaker is None:
+            breaker = self.breakers[address] = Breaker(self.cooldown_s)
+        if breaker.open_until and not force and time.monotonic() < breaker.open_until:
+            self.fast_failures += 1
+            raise CircuitOpenError(errno.EHOSTDOWN, f"I2C slave 0x{address:02X}: circuit open")
+
+        attempt = 0
+        delay = self.backoff_s
+        while True:
+            if self.bus is None and (force or time.monotonic() >= self.next_open_attempt):
+                self._open()
+            if self.bus is None:
+                raise BusUnavailableError(errno.ENODEV, "I2C bus is not open")
+            try:
+                result = self._transfer(address, op, register, arg)
+            except OSError as e:
+                kind = error_class(e)
+                self.errors[kind] += 1
+                self.consecutive_failures += 1
+                if not probe and (kind == 'bus_gone' or (kind in REOPEN_CLASSES and
+                                                         self.consecutive_failures >= self.reopen_after)):
+                    self._reopen(f"{kind}, {self.consecutive_failures} consecutive errors")
+                if attempt >= self.retries or kind not in RETRYABLE:
+                    self._failed(address, breaker)
+                    raise
+                attempt += 1
+                self.retried += 1
+                if not force:
+                    time.sleep(delay)
+                    delay *= 2
+                continue
+            if attempt:
+                self.recovered += 1
+            self.consecutive_failures = 0
+            if breaker.failures:
+                if breaker.open_until:
+                    logger.warning(f"I2C: slave 0x{address:02X} is back, circuit closed")
+                breaker.failures = 0
+                breaker.open_until = 0.0
+                breaker.cooldown = self.cooldown_s
+            return result
+
+    def _failed(self, address, breaker):
+        self.failed += 1
+        breaker.failures += 1
+        if breaker.open_until:
+            # the probe after the cooldown failed
+            breaker.cooldown = min(breaker.cooldown * 2, self.max_cooldown_s)
+            breaker.open_until = time.monotonic() + breaker.cooldown
+        elif breaker.failures >= self.trip_after:
+            self.trips += 1
+            breaker.open_until = time.monotonic() + breaker.cooldown
+            logger.error(f"I2C: slave 0x{address:02X} failed {breaker.failures} transactions in a row, "
+                         f"circuit open for {breaker.cooldown:g} s")
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+IMU sensor fusion for the bridge
+
+Roll and pitch from the Arduino's raw accelerometer/gyro samples (REG_IMU blocks),
+with interchangeable estimators:
+  complementary : gyro integration pulled toward the accelerometer angles
+  madgwick      : 6-axis Madgwick gradient descent on a quaternion
+  kalman        : angle + gyro bias Kalman filter per axis
+Angles follow the firmware: roll = atan2(ay, az), pitch = atan2(-ax, sqrt(ay^2 + az^2)),
+in degrees, with gyro x/y as their rates.
+
+Block layout (firmware onRequest, REG_IMU):
+    [count][dropped] then count x <H6h: micros() low 16 bits, ax ay az (mg), gx gy gz (0.1 deg/s)
+
+The estimators are recursive, so samples are processed one after the other; per block
+only the unpacking is done in one call. bench_fusion.py measures the cost per sample.
+"""
+
+import math
+import random
+import struct
+
+IMU_SAMPLE = struct.Struct('<H6h')
+IMU_BATCH = 2                       # samples per read: 2 + 2 x 14 bytes fit the 32-byte Wire buffer
+IMU_BLOCK_SIZE = 2 + IMU_BATCH * IMU_SAMPLE.size
+ACCEL_LSB_G = 0.001
+GYRO_LSB_DPS = 0.1
+DT_MAX_S = 0.05                     # longer gaps (stalled loop, 16-bit wrap) are integrated as this
+RAD = math.pi / 180.0
+DEG = 180.0 / math.pi
+
+
+def accel_angles(ax, ay, az):
+    """(roll, pitch) in degrees from the accelerometer alone, as the firmware computes them"""
+    return math.atan2(ay, az) * DEG, math.atan2(-ax, math.sqrt(ay * ay + az * az)) * DEG
+
+
+class ComplementaryFilter:
+    def __init__(self, time_constant=0.5):
+        self.time_constant = time_constant
+        self.roll = self.pitch = 0.0
+
+    def reset(self, roll, pitch):
+        self.roll, self.pitch = roll, pitch
+
+    def update(self, ax, ay, az, gx, gy, gz, dt):
+        alpha = self.time_constant / (self.time_constant + dt)
+        roll_acc, pitch_acc = accel_angles(ax, ay, az)
+        self.roll = alpha * (self.roll + gx * dt) + (1.0 - alpha) * roll_acc
+        self.pitch = alpha * (self.pitch + gy * dt) + (1.0 - alpha) * pitch_acc
+        return self.roll, self.pitch
+
+
+class MadgwickFilter:
+    def __init__(self, beta=0.1):
+        self.beta = beta
+        self.q0, self.q1, self.q2, self.q3 = 1.0, 0.0, 0.0, 0.0
+
+    def reset(self, roll, pitch):
+        cr, sr = math.cos(roll * RAD / 2), math.sin(roll * RAD / 2)
+        cp, sp = math.cos(pitch * RAD / 2), math.sin(pitch * RAD / 2)
+        self.q0, self.q1, self.q2, self.q3 = cr * cp, sr * cp, cr * sp, -sr * sp
+
+    def update(self, ax, ay, az, gx, gy, gz, dt):
+        q0, q1, q2, q3 = self.q0, self.q1, self.q2, self.q3
+        gx, gy, gz = gx * RAD, gy * RAD, gz * RAD
+        # rate of change of the quaternion from the gyro
+        qd0 = 0.5 * (-q1 * gx - q2 * gy - q3 * gz)
+        qd1 = 0.5 * (q0 * gx + q2 * gz - q3 * gy)
+        qd2 = 0.5 * (q0 * gy - q1 * gz + q3 * gx)
+        qd3 = 0.5 * (q0 * gz + q1 * gy - q2 * gx)
+
+        norm = math.sqrt(ax * ax + ay * ay + az * az)
+        if norm > 0.0:
+            ax, ay, az = ax / norm, ay / norm, az / norm
+            # gradient descent step toward the measured gravity direction
+            _2q0, _2q1, _2q2, _2q3 = 2 * q0, 2 * q1, 2 * q2, 2 * q3
+            _4q0, _4q1, _4q2 = 4 * q0, 4 * q1, 4 * q2
+            _8q1, _8q2 = 8 * q1, 8 * q2
+            q0q0, q1q1, q2q2, q3q3 = q0 * q0, q1 * q1, q2 * q2, q3 * q3
+            s0 = _4q0 * q2q2 + _2q2 * ax + _4q0 * q1q1 - _2q1 * ay
+            s1 = _4q1 * q3q3 - _2q3 * ax + 4 * q0q0 * q1 - _2q0 * ay - _4q1 + _8q1 * q1q1 + _8q1 * q2q2 + _4q1 * az
+            s2 = 4 * q0q0 * q2 + _2q0 * ax + _4q2 * q3q3 - _2q3 * ay - _4q2 + _8q2 * q1q1 + _8q2 * q2q2 + _4q2 * az
+            s3 = 4 * q1q1 * q3 - _2q1 * ax + 4 * q2q2 * q3 - _2q2 * ay
+            norm = math.sqrt(s0 * s0 + s1 * s1 + s2 * s2 + s3 * s3)
+            if norm > 0.0:
+                beta = self.beta / norm
+                qd0 -= beta * s0
+                qd1 -= beta * s1
+                qd2 -= beta * s2
+                qd3 -= beta * s3
+
+        q0 += qd0 * dt
+        q1 += qd1 * dt
+        q2 += qd2 * dt
+        q3 += qd3 * dt
+        norm = 1.0 / math.sqrt(q0 * q0 + q1 * q1 + q2 * q2 + q3 * q3)
+        self.q0, self.q1, self.q2, self.q3 = q0 * norm, q1 * norm, q2 * norm, q3 * norm
+        return self.angles()
+
+    def angles(self):
+        q0, q1, q2, q3 = self.q0, self.q1, self.q2, self.q3
+        roll = math.atan2(q0 * q1 + q2 * q3, 0.5 - q1 * q1 - q2 * q2) * DEG
+        pitch = math.asin(max(-1.0, min(1.0, -2.0 * (q1 * q3 - q0 * q2)))) * DEG
+        return roll, pitch
+
+
+class AngleKalman:
+    """One axis: state (angle, gyro bias), the accelerometer angle as measurement"""
+
+    def __init__(self, q_angle=0.001, q_bias=0.003, r_measure=0.03):
+        self.q_angle, self.q_bias, self.r_measure = q_angle, q_bias, r_measure
+        self.angle = self.bias = 0.0
+        self.p00 = self.p01 = self.p10 = self.p11 = 0.0
+
+    def update(self, measured, rate, dt):
+        # predict
+        self.angle += dt * (rate - self.bias)
+        p00, p01, p10, p11 = self.p00, self.p01, self.p10, self.p11
+        p00 += dt * (dt * p11 - p01 - p10 + self.q_angle)
+        p01 -= dt * p11
+        p10 -= dt * p11
+        p11 += self.q_bias * dt
+        # correct
+        s = p00 + self.r_measure
+        k0, k1 = p00 / s, p10 / s
+        y = measured - self.angle
+        self.angle += k0 * y
+        self.bias += k1 * y
+        self.p00, self.p01 = p00 - k0 * p00, p01 - k0 * p01
+        self.p10, self.p11 = p10 - k1 * p00, p11 - k1 * p01
+        return self.angle
+
+
+class KalmanFilter:
+    def __init__(self):
+        self.roll_axis = AngleKalman()
+        self.pitch_axis = AngleKalman()
+
+    def reset(self, roll, pitch):
+        self.roll_axis.angle, self.pitch_axis.angle = roll, pitch
+
+    def update(self, ax, ay, az, gx, gy, gz, dt):
+        roll_acc, pitch_acc = accel_angles(ax, ay, az)
+        return self.roll_axis.update(roll_acc, gx, dt), self.pitch_axis.update(pitch_acc, gy, dt)
+
+
+ESTIMATORS = {
+    'complementary': ComplementaryFilter,
+    'madgwick': MadgwickFilter,
+    'kalman': KalmanFilter,
+}
+
+
+class FusionEngine:
+    """Feeds REG_IMU blocks to the selected estimator; the algorithm can change at any time"""
+
+    def __init__(self, algorithm='complementary'):
+        self.roll = self.pitch = None
+        self.last_t = None              # micros() low 16 bits of the newest sample
+        self.samples = 0
+        self.dropped = 0
+        self.select(algorithm)
+
+    def select(self, algorithm):
+        """Switch estimator; it starts from the current attitude. ValueError for unknown names"""
+        if algorithm not in ESTIMATORS:
+            raise ValueError(f"unknown fusion algorithm: {algorithm}")
+        estimator = ESTIMATORS[algorithm]()
+        if self.roll is not None:
+            estimator.reset(self.roll, self.pitch)
+        self.estimator = estimator
+        self.algorithm = algorithm
+
+    def feed(self, block):
+        """One REG_IMU block. Returns the number of samples it held"""
+        count, dropped = block[0], block[1]
+        count = min(count, (len(block) - 2) // IMU_SAMPLE.size)
+        if not count:
+            return 0
+        self.dropped += dropped
+        update = self.estimator.update
+        last = self.last_t
+        roll, pitch = self.roll, self.pitch
+        for t, ax, ay, az, gx, gy, gz in IMU_SAMPLE.iter_unpack(bytes(block[2:2 + count * IMU_SAMPLE.size])):
+            ax, ay, az = ax * ACCEL_LSB_G, ay * ACCEL_LSB_G, az * ACCEL_LSB_G
+            if last is None:
+                roll, pitch = accel_angles(ax, ay, az)
+                self.estimator.reset(roll, pitch)
+            else:
+                dt = min(((t - last) & 0xFFFF) / 1e6, DT_MAX_S) or 1e-6
+                roll, pitch = update(ax, ay, az, gx * GYRO_LSB_DPS, gy * GYRO_LSB_DPS, gz * GYRO_LSB_DPS, dt)
+            last = t
+        self.last_t = last
+        self.roll, self.pitch = roll, pitch
+        self.samples += count
+        return count
+
+
+class MockImu:
+    """
+    Synthetic REG_IMU source: a slow roll/pitch oscillation with sensor noise and a
+    gyro bias, sampled at `rate_hz`. `truth` is the attitude of the newest sample.
+    """
+
+    def __init__(self, rate_hz=250.0, noise_g=0.05, noise_dps=1.0, bias_dps=(1.5, -1.0, 0.5), seed=1):
+        self.period_us = int(1e6 / rate_hz)
+        self.noise_g, self.noise_dps, self.bias_dps = noise_g, noise_dps, bias_dps
+        self.rng = random.Random(seed)
+        self.t_us = 0
+        self.truth = (0.0, 0.0)
+        self.started = None
+        self.produced = 0
+
+    def attitude(self, t):
+        roll = 20.0 * math.sin(2 * math.pi * 0.4 * t)
+        pitch = 12.0 * math.sin(2 * math.pi * 0.25 * t + 1.0)
+        return roll, pitch
+
+    def sample(self):
+        """Next sample as the firmware packs it (bytes)"""
+        self.t_us += self.period_us
+        self.produced += 1
+        t, h = self.t_us / 1e6, 1e-3
+        roll, pitch = self.attitude(t)
+        next_roll, next_pitch = self.attitude(t + h)
+        self.truth = (roll, pitch)
+        r, p = roll * RAD, pitch * RAD
+        rng, n = self.rng, self.noise_g
+        accel = (-math.sin(p) + rng.gauss(0, n),
+                 math.sin(r) * math.cos(p) + rng.gauss(0, n),
+                 math.cos(r) * math.cos(p) + rng.gauss(0, n))
+        # small-angle body rates (the Euler angle rates)
+        gyro = ((next_roll - roll) / h, (next_pitch - pitch) / h, 0.0)
+        gyro = [g + b + rng.gauss(0, self.noise_dps) for g, b in zip(gyro, self.bias_dps)]
+        return IMU_SAMPLE.pack(self.t_us & 0xFFFF,
+                               *(round(a / ACCEL_LSB_G) for a in accel),
+                               *(round(g / GYRO_LSB_DPS) for g in gyro))
+
+    def read(self, now):
+        """Block with the samples due by `now` (seconds), as the firmware's ring would hold them"""
+        if self.started is None:
+            self.started = now
+        due = int((now - self.started) * 1e6) // self.period_us - self.produced
+        return self.block(max(0, min(due, IMU_BATCH)))
+
+    def block(self, count=IMU_BATCH):
+        samples = b''.join(self.sample() for _ in range(count))
+        return bytes((count, 0)) + samples.ljust(IMU_BLOCK_SIZE - 2, b'\x00')
@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+"""
+Split-process I2C control for the drone bridge
+
+With --split, drone_ble_server.py keeps D-Bus, the network transports, Base64
+decoding and logging in its own process and hands every I2C transaction to a
+control process (this file, started by SplitBus) that owns the SMBus. The two
+share one memory segment:
+
+    control block : kill request/acknowledge counters, flags and counters
+    command ring  : front -> control, commands and read requests
+    event ring    : control -> front, telemetry samples, read replies, command results
+
+Each ring has exactly one producer and one consumer process, so it needs no lock:
+the producer only stores `head`, the consumer only stores `tail`, and each is
+stored after the slot it publishes. The kill does not queue behind the command
+ring: the front bumps a counter that the control loop checks before every command,
+and commands stamped with an older kill count are dropped, as the firmware drops
+its queue on a kill.
+
+A command counts as sent once the control process has it acked by the slave: each
+command record carries a token, and its result (written, failed, dropped by a kill)
+comes back as an event with that token, which events() pairs with the context the
+front passed to send_command().
+
+The control process can be pinned to an isolated core (isolcpus=) and run under
+SCHED_FIFO; both need root and are skipped with a warning otherwise.
+
+    python3 drone_ble_server.py --split --control-cpu 3 --control-priority 50
+"""
+
+import argparse
+import errno
+import gc
+import logging
+import os
+import struct
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+from i2c_session import COMMAND_MAX, CommandTooLong, I2CSession, failure_reason, mock_ack
+
+logger = logging.getLogger(__name__)
+
+RING_SLOTS = 256                # per ring, power of two
+SLOT_SIZE = 64                  # uint16 length + record
+CONTROL_START_TIMEOUT_S = 5.0
+CONTROL_STOP_TIMEOUT_S = 1.0
+KILL_ACK_TIMEOUT_S = 0.05       # front waits this long for the control process to write the kill
+READ_TIMEOUT_S = 0.5
+IDLE_SLEEP_S = 0.0002           # control loop sleep when there is nothing to do
+MAINTAIN_S = 0.5                # I2C session upkeep and counter publishing
+
+# --- Shared layout ---
+# control block: uint32 kill_seq (front), kill_done, kill_written (control);
+# uint8 telemetry_on, stop (front), ready, realtime (control); uint32 slots, slot_size;
+# then uint64 counters written by the control process
+_KILL_SEQ, _KILL_DONE, _KILL_WRITTEN = 0, 4, 8
+_TELEMETRY_ON, _STOP, _READY, _REALTIME = 12, 13, 14, 15
+_SLOTS, _SLOT_SIZE = 16, 20
+# I2C session counters (i2c_session.py) are copied in every MAINTAIN_S
+SESSION_COUNTERS = ('retried', 'recovered', 'failed', 'fast_failures', 'reopens', 'trips', 'breakers_open')
+ERROR_CLASSES = ('nack', 'timeout', 'io', 'busy', 'bus_gone', 'protocol', 'other')
+COUNTERS = ('commands', 'commands_dropped', 'command_errors', 'telemetry_samples',
+            'telemetry_dropped', 'telemetry_errors', 'queue_max_us', 'queue_total_us', 'kill_max_us') + \
+    tuple(f'i2c_{name}' for name in SESSION_COUNTERS) + tuple(f'i2c_errors_{kind}' for kind in ERROR_CLASSES)
+_COUNTERS = 24
+CONTROL_SIZE = 256
+
+_RING_HEADER = 128              # head and tail on separate cache lines
+_HEAD, _TAIL = 0, 64
+
+# records: one kind byte, then the fields below
+_COMMAND = struct.Struct('<cIqIB')  # b'C', kill stamp, queued at (us), token, address + command bytes
+_READ = struct.Struct('<cBBBH')     # b'R', address, register, length, request id
+_SAMPLE = struct.Struct('<cqq')     # b'T', before, after (us) + telemetry register bytes
+_REPLY = struct.Struct('<cH?')      # b'r', request id, ok + data
+_DONE = struct.Struct('<cI?')       # b'D', token, dropped by a kill
+_ERROR = struct.Struct('<cBI')      # b'E', address, token + '<metrics key> <reason> <error text>'
+
+
+def now_us():
+    return time.monotonic_ns() // 1000
+
+
+def segment_size(slots=RING_SLOTS, slot_size=SLOT_SIZE):
+    return CONTROL_SIZE + 2 * (_RING_HEADER + slots * slot_size)
+
+
+class SpscRing:
+    """Single-producer single-consumer ring of fixed-size slots in a shared buffer"""
+
+    def __init__(self, buf, base, slots, slot_size):
+        self.buf = buf
+        self.base = base
+        self.slots = slots
+        self.slot_size = slot_size
+        self.data = base + _RING_HEADER
+
+    def _load(self, field):
+        return struct.unpack_from('<Q', self.buf, self.base + field)[0]
+
+    def __len__(self):
+        return self._load(_HEAD) - self._load(_TAIL)
+
+    def push(self, record) -> bool:
+        """False if the ring is full or the record does not fit a slot"""
+        head = self._load(_HEAD)
+        if head - self._load(_TAIL) >= self.slots or len(record) > self.slot_size - 2:
+            return False
+        pos = self.data + (head % self.slots) * self.slot_size
+        struct.pack_into('<H', self.buf, pos, len(record))
+        self.buf[pos + 2:pos + 2 + len(record)] = record
+        # publish only after the slot is written
+        struct.pack_into('<Q', self.buf, self.base + _HEAD, head + 1)
+        return True
+
+    def pop(self):
+        """Oldest record as bytes, None if empty"""
+        tail = self._load(_TAIL)
+        if tail == self._load(_HEAD):
+            return None
+        pos = self.data + (tail % self.slots) * self.slot_size
+        length = struct.unpack_from('<H', self.buf, pos)[0]
+        record = bytes(self.buf[pos + 2:pos + 2 + length])
+        struct.pack_into('<Q', self.buf, self.base + _TAIL, tail + 1)
+        return record
+
+
+class SharedState:
+    """The control block and both rings of one segment"""
+
+    def __init__(self, shm):
+        self.shm = shm
+        self.buf = shm.buf
+        slots, slot_size = self.get('<I', _SLOTS), self.get('<I', _SLOT_SIZE)
+        ring_size = _RING_HEADER + slots * slot_size
+        self.commands = SpscRing(self.buf, CONTROL_SIZE, slots, slot_size)
+        self.events = SpscRing(self.buf, CONTROL_SIZE + ring_size, slots, slot_size)
+
+    def get(self, fmt, offset):
+        return struct.unpack_from(fmt, self.buf, offset)[0]
+
+    def put(self, fmt, offset, value):
+        struct.pack_into(fmt, self.buf, offset, value)
+
+    def counter(self, name):
+        return self.get('<Q', _COUNTERS + 8 * COUNTERS.index(name))
+
+    def set(self, name, value):
+        self.put('<Q', _COUNTERS + 8 * COUNTERS.index(name), value)
+
+    def add(self, name, value=1):
+        offset = _COUNTERS + 8 * COUNTERS.index(name)
+        self.put('<Q', offset, self.get('<Q', offset) + value)
+
+    def raise_to(self, name, value):
+        offset = _COUNTERS + 8 * COUNTERS.index(name)
+        if value > self.get('<Q', offset):
+            self.put('<Q', offset, value)
+
+    def counters(self):
+        return {name: self.counter(name) for name in COUNTERS}
+
+
+# --- Front-end side ---
+class SplitBus:
+    """
+    Stands in for the SMBus in the BLE/D-Bus process. Writes are queued to the
+    control process and return once queued; reads wait for the reply. Events
+    (telemetry samples, command results) are collected with events().
+    """
+    def __init__(self, slots=RING_SLOTS, slot_size=SLOT_SIZE):
+        self.shm = shared_memory.SharedMemory(create=True, size=segment_size(slots, slot_size))
+        self.shm.buf[:CONTROL_SIZE] = bytes(CONTROL_SIZE)
+        struct.pack_into('<II', self.shm.buf, _SLOTS, slots, slot_size)
+        self.state = SharedState(self.shm)
+        self.process = None
+        self.kill_seq = 0
+        self.backlog = []
+        self.waiting = {}           # token -> context of a command the control process has not finished
+        self._next_token = 0
+        self._next_request = 0
+        self._produce_lock = threading.Lock()   # several front threads write commands
+        self._consume_lock = threading.Lock()
+
+    def start(self, control_args):
+        """Start the control process (shm_bridge.py <segment> <control_args>) and wait until it is ready"""
+        self.process = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                                         self.shm.name, *control_args])
+        deadline = time.monotonic() + CONTROL_START_TIMEOUT_S
+        while not self.state.get('<B', _READY):
+            if self.process.poll() is not None:
+                raise RuntimeError(f"control process exited with status {self.process.returncode}")
+            if time.monotonic() > deadline:
+                self.close()
+                raise RuntimeError("control process did not start")
+            time.sleep(0.01)
+        logger.info(f"I2C control process {self.process.pid} ready "
+                    f"({'real-time' if self.state.get('<B', _REALTIME) else 'normal'} scheduling)")
+
+    def _push(self, record):
+        if self.process.poll() is not None:
+            raise OSError(errno.EPIPE, "I2C control process is not running")
+        with self._produce_lock:
+            if not self.state.commands.push(record):
+                raise OSError(errno.ENOBUFS, "I2C command ring full")
+
+    def send_command(self, address, data, context=None):
+        """
+        Queued for the control process's I2CSession.send_command(); the result comes
+        back from events() with `context`
+        """
+        if len(data) > COMMAND_MAX:
+            raise CommandTooLong(f"command is {len(data)} bytes, the firmware takes {COMMAND_MAX}")
+        if self.process.poll() is not None:
+            raise OSError(errno.EPIPE, "I2C control process is not running")
+        with self._produce_lock:
+            self._next_token = self._next_token % 0xFFFFFFFF + 1
+            token = self._next_token
+            self.waiting[token] = context
+            if not self.state.commands.push(_COMMAND.pack(b'C', self.kill_seq, now_us(), token, address) + data):
+                del self.waiting[token]
+                raise OSError(errno.ENOBUFS, "I2C command ring full")
+
+    def read_i2c_block_data(self, address, register, length):
+        with self._consume_lock:
+            self._next_request = (self._next_request + 1) & 0xFFFF
+            request = self._next_request
+            self._push(_READ.pack(b'R', address, register, length, request))
+            deadline = time.monotonic() + READ_TIMEOUT_S
+            while time.monotonic() < deadline:
+                record = self.state.events.pop()
+                if record is None:
+                    time.sleep(IDLE_SLEEP_S)
+                elif record[:1] == b'r' and _REPLY.unpack_from(record)[1] == request:
+                    _, _, ok = _REPLY.unpack_from(record)
+                    if not ok:
+                        raise OSError(errno.EIO, record[_REPLY.size:].decode('utf-8', 'replace'))
+                    return list(record[_REPLY.size:])
+                else:
+                    self.backlog.append(record)
+        raise TimeoutError(f"no reply from the I2C control process for 0x{address:02X}/0x{register:02X}")
+
+    def kill(self):
+        """
+        Ask the control process for the kill ahead of its queued commands, which it
+        then drops. Returns the number of slaves written, 0 if it did not answer in time.
+        """
+        with self._produce_lock:
+            self.kill_seq = (self.kill_seq + 1) & 0xFFFFFFFF
+            self.state.put('<I', _KILL_SEQ, self.kill_seq)
+        deadline = time.monotonic() + KILL_ACK_TIMEOUT_S
+        while self.state.get('<I', _KILL_DONE) != self.kill_seq:
+            if time.monotonic() > deadline:
+                return 0
+            time.sleep(0.00005)
+        return self.state.get('<I', _KILL_WRITTEN)
+
+    def set_telemetry(self, enabled):
+        """The control process polls the telemetry register only while enabled"""
+        self.state.put('<B', _TELEMETRY_ON, 1 if enabled else 0)
+
+    def events(self):
+        """
+        Pending events: ('T', before_us, after_us, data), ('D', context, dropped by a kill),
+        ('E', context, address, metrics key, reason, message).
+        Replies to reads that already timed out are dropped.
+        """
+        with self._consume_lock:
+            records, self.backlog = self.backlog, []
+            while True:
+                record = self.state.events.pop()
+                if record is None:
+                    break
+                records.append(record)
+        events = []
+        for record in records:
+            kind = record[:1]
+            if kind == b'T':
+                _, before, after = _SAMPLE.unpack_from(record)
+                events.append(('T', before, after, record[_SAMPLE.size:]))
+            elif kind == b'D':
+                _, token, dropped = _DONE.unpack_from(record)
+                events.append(('D', self.waiting.pop(token, None), dropped))
+            elif kind == b'E':
+                _, address, token = _ERROR.unpack_from(record)
+                metric, reason, message = record[_ERROR.size:].decode('utf-8', 'replace').split(' ', 2)
+                events.append(('E', self.waiting.pop(token, None), address, metric, reason, message))
+        return events
+
+    def counters(self):
+        return self.state.counters()
+
+    def session_counters(self):
+        """The control process's I2CSession.counters(), as of its last publish"""
+        counters = self.state.counters()
+        session = {name: counters[f'i2c_{name}'] for name in SESSION_COUNTERS}
+        session['errors'] = {kind: counters[f'i2c_errors_{kind}'] for kind in ERROR_CLASSES
+                             if counters[f'i2c_errors_{kind}']}
+        return session
+
+    def close(self):
+        if self.process is not None:
+            self.state.put('<B', _STOP, 1)
+            try:
+                self.process.wait(CONTROL_STOP_TIMEOUT_S)
+            except subprocess.TimeoutExpired:
+                self.process.terminate()
+                self.process.wait()
+            logger.info(f"I2C control process stopped: {self.counters()}")
+            self.process = None
+        self.state = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+# --- Control process ---
+class MockBus:
+    """No Arduino: commands are acked, reads return zeros"""
+    def write_read(self, address, data, length):
+        logger.debug(f"Mock I2C frame to 0x{address:02X}: {bytes(data)!r}")
+        return mock_ack(data)
+
+    def read_i2c_block_data(self, address, register, length):
+        return [0] * length
+
+    def close(self):
+        pass
+
+
+def attach(name):
+    """Open the front's segment without handing it to this process's resource tracker"""
+    shm = shared_memory.SharedMemory(name=name)
+    # the front creates and unlinks the segment; before Python 3.13 attaching registers it too
+    try:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:
+        pass
+    return shm
+
+
+def set_realtime(cpu, priority):
+    """Pin to `cpu` and/or switch to SCHED_FIFO `priority`. Returns True if real-time."""
+    if cpu is not None:
+        try:
+            os.sched_setaffinity(0, {cpu})
+            logger.info(f"Control process pinned to CPU {cpu}")
+        except (AttributeError, OSError) as e:
+            logger.warning(f"Could not pin control process to CPU {cpu}: {e}")
+    if priority:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+            logger.info(f"Control process running SCHED_FIFO priority {priority}")
+            return True
+        except (AttributeError, OSError) as e:
+            logger.warning(f"Could not set SCHED_FIFO priority {priority}: {e}")
+    return False
+
+
+class ControlLoop:
+    """Owns the bus: kill first, then queued commands, then telemetry when due"""
+
+    def __init__(self, state, i2c_bus, args):
+        self.state = state
+        self.bus = i2c_bus
+        self.args = args
+        self.kill_payload = args.kill_payload.encode('ascii')
+        self.kill_handled = 0
+        self.next_telemetry = 0.0
+
+    def run(self):
+        parent = os.getppid()
+        period = self.args.telemetry_period_ms / 1000.0
+        next_maintain = 0.0
+        while not self.state.get('<B', _STOP) and os.getppid() == parent:
+            if time.monotonic() >= next_maintain:
+                next_maintain = time.monotonic() + MAINTAIN_S
+                self._maintain()
+            busy = self._check_kill()
+            record = self.state.commands.pop()
+            if record is not None:
+                self._command(record)
+                busy = True
+            now = time.monotonic()
+            if self.state.get('<B', _TELEMETRY_ON) and now >= self.next_telemetry:
+                self.next_telemetry = max(self.next_telemetry + period, now)
+                self._telemetry()
+                busy = True
+            if not busy:
+                time.sleep(IDLE_SLEEP_S)
+
+    def _check_kill(self):
+        requested = self.state.get('<I', _KILL_SEQ)
+        if requested == self.kill_handled:
+            return False
+        started = now_us()
+        written = 0
+        for address in self.args.kill_address:
+            try:
+                self.bus.send_command(address, self.kill_payload, force=True)
+                written += 1
+            except OSError:
+                pass
+        self.kill_handled = requested
+        self.state.put('<I', _KILL_WRITTEN, written)
+        self.state.put('<I', _KILL_DONE, requested)
+        self.state.raise_to('kill_max_us', now_us() - started)
+        return True
+
+    def _maintain(self):
+        self.bus.maintain()
+        counters = self.bus.counters()
+        for name in SESSION_COUNTERS:
+            self.state.set(f'i2c_{name}', counters[name])
+        for kind in ERROR_CLASSES:
+            self.state.set(f'i2c_errors_{kind}', counters['errors'].get(kind, 0))
+
+    def _command(self, record):
+        kind = record[:1]
+        if kind == b'C':
+            _, stamp, queued, token, address = _COMMAND.unpack_from(record)
+            if stamp != self.kill_handled:
+                # queued before a kill the firmware has already seen
+                self.state.add('commands_dropped')
+                self._event(_DONE.pack(b'D', token, True))
+                return
+            delay = now_us() - queued
+            self.state.add('queue_total_us', delay)
+            self.state.raise_to('queue_max_us', delay)
+            self.state.add('commands')
+            try:
+                self.bus.send_command(address, record[_COMMAND.size:])
+            except (OSError, CommandTooLong) as e:
+                self.state.add('command_errors')
+                metric, reason = failure_reason(e)
+                self._event(_ERROR.pack(b'E', address, token) + f"{metric} {reason} {e}".encode('utf-8')[:48])
+                return
+            self._event(_DONE.pack(b'D', token, False))
+        elif kind == b'R':
+            _, address, register, length, request = _READ.unpack_from(record)
+            try:
+                data = bytes(self.bus.read_i2c_block_data(address, register, length))
+                self._event(_REPLY.pack(b'r', request, True) + data)
+            except OSError as e:
+                self._event(_REPLY.pack(b'r', request, False) + str(e).encode('utf-8')[:40])
+
+    def _telemetry(self):
+        before = now_us()
+        try:
+            data = self.bus.read_i2c_block_data(self.args.address, self.args.telemetry_register,
+                                                self.args.telemetry_size)
+        except OSError:
+            # counted only; an event per failed poll would flood the front
+            self.state.add('telemetry_errors')
+            return
+        after = now_us()
+        self.state.add('telemetry_samples')
+        if not self.state.events.push(_SAMPLE.pack(b'T', before, after) + bytes(data)):
+            self.state.add('telemetry_dropped')
+
+    def _event(self, record):
+        while not self.state.events.push(record):
+            # replies and results must not be lost; the front drains every 20 ms.
+            # A kill must not wait for it
+            if self.state.get('<B', _STOP):
+                return
+            self._check_kill()
+            time.sleep(IDLE_SLEEP_S)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="I2C control process of the split drone bridge")
+    parser.add_argument('segment', help="shared memory segment created by the front-end")
+    parser.add_argument('--bus', type=int, default=1, help="I2C bus number")
+    parser.add_argument('--address', type=lambda s: int(s, 0), default=0x08)
+    parser.add_argument('--kill-address', type=lambda s: int(s, 0), action='append', default=[])
+    parser.add_argument('--kill-payload', default='ESTOP')
+    parser.add_argument('--telemetry-register', type=lambda s: int(s, 0), default=0x01)
+    parser.add_argument('--telemetry-size', type=int, default=22)
+    parser.add_argument('--telemetry-period-ms', type=float, default=20.0)
+    parser.add_argument('--mock', action='store_true', help="no I2C bus")
+    parser.add_argument('--cpu', type=int, help="pin to this CPU")
+    parser.add_argument('--priority', type=int, default=0, help="SCHED_FIFO priority (0 = normal)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - control - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+    if not args.kill_address:
+        args.kill_address = [args.address]
+
+    if args.mock:
+        opener = MockBus
+    else:
+        import smbus2
+        opener = lambda: smbus2.SMBus(args.bus)
+    i2c_bus = I2CSession(opener, probe_address=args.address, probe_register=args.telemetry_register,
+                         probe_length=args.telemetry_size)
+    shm = attach(args.segment)
+    state = SharedState(shm)
+    realtime = set_realtime(args.cpu, args.priority)
+    # everything is allocated by now; keep collector pauses out of the loop
+    gc.collect()
+    gc.freeze()
+    gc.disable()
+    state.put('<B', _REALTIME, 1 if realtime else 0)
+    state.put('<B', _READY, 1)
+    try:
+        ControlLoop(state, i2c_bus, args).run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        i2c_bus.close()
+        del state
+        shm.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Telemetry stream encoding (keyframes + zigzag varint deltas)
+
+The PC side loads this file (pc_controller/telemetry_codec.py), so the bridge's
+encoder and the controller's decoder share one definition of the format.
+
+A sample is TELEMETRY_FIELDS as integers in fixed units (PWM in us, angles in
+0.1 deg, gyro rates in 0.1 deg/s). Over BLE packets have their own characteristic
+(with the TKEY text stamps); the network transports send them next to the text
+statuses. Text is always ASCII, so the first byte tells the two apart:
+
+    header  : 0b10ssssss keyframe packet / 0b11ssssss delta packet (s = seq mod 64)
+    sample  : varint dt_ms, then one zigzag varint per field
+
+The first sample of a keyframe packet is relative to KEYFRAME_REFERENCE, every
+other sample to the one before it. A delta packet after a lost packet cannot be
+decoded and is skipped until the next keyframe. dt is the difference of whole
+milliseconds of the sender's clock, so sample times add up exactly between keyframes;
+the bridge sends that clock's value for each keyframe sample separately (TKEY).
+"""
+
+TELEMETRY_FIELDS = ('pwm_fr', 'pwm_bl', 'pwm_br', 'pwm_fl',
+                    'roll', 'pitch', 'gyro_x', 'gyro_y', 'gyro_z')
+KEYFRAME_REFERENCE = (1000, 1000, 1000, 1000, 0, 0, 0, 0, 0)   # ESC_MIN, level, still
+# Ranges keep every field at two varint bytes, so a keyframe fits a 20-byte notification
+FIELD_LIMITS = ((940, 2060),) * 4 + ((-1800, 1800),) * 2 + ((-8191, 8191),) * 3
+DT_MAX_MS = 127             # one varint byte; longer gaps are reported as 127 ms
+
+KEYFRAME = 0x80
+DELTA = 0xC0
+KIND_MASK = 0xC0
+SEQ_MASK = 0x3F
+
+
+def is_telemetry(data) -> bool:
+    return len(data) > 0 and data[0] & KEYFRAME == KEYFRAME
+
+
+def _put_varint(out, value):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _put_zigzag(out, value):
+    _put_varint(out, (value << 1) ^ (value >> 63))
+
+
+def clamp_sample(values):
+    return tuple(min(max(int(v), low), high) for v, (low, high) in zip(values, FIELD_LIMITS))
+
+
+class TelemetryEncoder:
+    """
+    Packs samples into packets of at most `max_payload` bytes.
+    add() returns the packets that are complete: full, older than `max_latency`,
+    or closed by a keyframe.
+    """
+
+    def __init__(self, max_payload=20, keyframe_interval=1.0, max_latency=0.1):
+        self.max_payload = max_payload
+        self.keyframe_interval = keyframe_interval
+        self.max_latency = max_latency
+        self.seq = 0
+        self.previous = None
+        self.previous_ms = None
+        self.last_keyframe = None
+        self.keyframe_seq = None
+        self.pending = bytearray()
+        self.pending_since = None
+        self.pending_samples = 0
+
+    def request_keyframe(self):
+        """Next sample starts a keyframe (new subscriber, resync)"""
+        self.last_keyframe = None
+
+    def add(self, values, now):
+        """values: TELEMETRY_FIELDS as ints, now: time.monotonic()"""
+        values = clamp_sample(values)
+        packets = []
+        now_ms = int(now * 1000)
+        dt = 0 if self.previous_ms is None else min(now_ms - self.previous_ms, DT_MAX_MS)
+        self.previous_ms = now_ms
+
+        keyframe = self.last_keyframe is None or now - self.last_keyframe >= self.keyframe_interval
+        reference = KEYFRAME_REFERENCE if keyframe else self.previous
+        chunk = bytearray()
+        _put_varint(chunk, dt)
+        for value, ref in zip(values, reference):
+            _put_zigzag(chunk, value - ref)
+        self.previous = values
+
+        if keyframe:
+            self.last_keyframe = now
+            if self.pending:
+                packets.append(self.flush())
+            self._start(KEYFRAME, now)
+            self.keyframe_seq = self.seq
+        elif not self.pending:
+            self._start(DELTA, now)
+        elif len(self.pending) + len(chunk) > self.max_payload:
+            packets.append(self.flush())
+            self._start(DELTA, now)
+        self.pending += chunk
+        self.pending_samples += 1
+
+        if len(self.pending) >= self.max_payload or now - self.pending_since >= self.max_latency:
+            packets.append(self.flush())
+        return packets
+
+    def _start(self, kind, now):
+        self.pending = bytearray((kind | self.seq,))
+        self.pending_since = now
+        self.pending_samples = 0
+
+    def flush(self):
+        """Close the pending packet. Returns its bytes (empty if there was none)"""
+        packet = bytes(self.pending)
+        if packet:
+            self.seq = (self.seq + 1) & SEQ_MASK
+        self.pending = bytearray()
+        self.pending_samples = 0
+        return packet
+
+
+class TelemetryDecoder:
+    """Incremental decoder: feed() one packet, get back [(time_ms, values), ...]"""
+
+    def __init__(self):
+        self.previous = None
+        self.expected_seq = None
+        self.time_ms = 0
+        self.packets = 0
+        self.samples = 0
+        self.lost_packets = 0
+        self.skipped_packets = 0
+        self.keyframe_seq = None        # seq and decoder time of the last keyframe sample
+        self.keyframe_time_ms = None
+
+    def feed(self, packet):
+        header = packet[0]
+        kind, seq = header & KIND_MASK, header & SEQ_MASK
+        if kind != KEYFRAME and kind != DELTA:
+            raise ValueError(f"not a telemetry packet: 0x{header:02x}")
+        self.packets += 1
+        if self.expected_seq is not None and seq != self.expected_seq:
+            self.lost_packets += (seq - self.expected_seq) & SEQ_MASK
+            self.previous = None
+        self.expected_seq = (seq + 1) & SEQ_MASK
+        if kind == KEYFRAME:
+            reference = KEYFRAME_REFERENCE
+        elif self.previous is None:
+            self.skipped_packets += 1
+            return []
+        else:
+            reference = self.previous
+
+        samples = []
+        fields = len(KEYFRAME_REFERENCE)
+        pos, end = 1, len(packet)
+        time_ms = self.time_ms
+        while pos < end:
+            raw = []
+            # dt followed by one zigzag varint per field, inlined for speed
+            for _ in range(fields + 1):
+                value = shift = 0
+                while True:
+                    byte = packet[pos]
+                    pos += 1
+                    value |= (byte & 0x7F) << shift
+                    if byte < 0x80:
+                        break
+                    shift += 7
+                raw.append(value)
+            time_ms += raw[0]
+            reference = tuple(ref + ((v >> 1) ^ -(v & 1)) for ref, v in zip(reference, raw[1:]))
+            samples.append((time_ms, reference))
+        if kind == KEYFRAME:
+            self.keyframe_seq, self.keyframe_time_ms = seq, samples[0][0]
+        self.time_ms = time_ms
+        self.previous = reference
+        self.samples += len(samples)
+        return samples
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Network transports for the drone bridge
+
+UDP and WebSocket servers that feed the same command pipeline as the BLE
+CommandCharacteristic. Both run on the GLib main loop (io watches, no threads).
+Each client gets a Session; the bridge calls on_command(payload, session) for every
+message and broadcasts status messages to all sessions.
+
+Neither transport authenticates its clients: bind them to a trusted network only.
+Sends never block the main loop. A WebSocket session queues what the socket does
+not take and flushes it when the socket is writable; past WS_SEND_BACKLOG, droppable
+messages (telemetry) are dropped, never acks or status.
+"""
+
+import base64
+import hashlib
+import logging
+import socket
+import struct
+import time
+
+from gi.repository import GLib
+
+logger = logging.getLogger(__name__)
+
+UDP_SESSION_TIMEOUT_S = 5.0     # a UDP client is gone after this long without a datagram
+WS_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+WS_MAX_MESSAGE = 4096
+WS_SEND_BACKLOG = 64 * 1024     # queued bytes past which telemetry frames are dropped
+WS_SEND_LIMIT = 1024 * 1024     # a client this far behind is not reading at all: close it
+
+
+class Session:
+    """One client of a transport"""
+    _next_id = 1
+
+    def __init__(self, transport, peer):
+        self.id = f"{transport.name}-{Session._next_id}"
+        Session._next_id += 1
+        self.transport = transport
+        self.peer = peer
+        self.last_seen = time.monotonic()
+
+    def send(self, data: bytes, droppable=False):
+        raise NotImplementedError
+
+    def close(self):
+        self.transport.drop_session(self)
+
+
+class Transport:
+    """Base class: session bookkeeping and broadcast"""
+    name = 'transport'
+
+    def __init__(self, on_command, on_session_closed=None, on_session_opened=None):
+        self.on_command = on_command
+        self.on_session_closed = on_session_closed
+        self.on_session_opened = on_session_opened
+        self.sessions = {}
+
+    def broadcast(self, data: bytes, droppable=False):
+        for session in list(self.sessions.values()):
+            session.send(data, droppable)
+
+    def add_session(self, key, session):
+        self.sessions[key] = session
+        if self.on_session_opened:
+            self.on_session_opened(session)
+
+    def drop_session(self, session):
+        key = next((k for k, v in self.sessions.items() if v is session), None)
+        if key is None:
+            return
+        del self.sessions[key]
+        logger.info(f"{self.name}: session {session.id} ({session.peer}) closed")
+        if self.on_session_closed:
+            self.on_session_closed(session)
+
+
+# --- UDP ---
+class UdpSession(Session):
+    def send(self, data: bytes, droppable=False):
+        try:
+            self.transport.sock.sendto(data, self.peer)
+        except OSError as e:
+            logger.debug(f"udp: send to {self.peer} failed: {e}")
+
+
+class UdpTransport(Transport):
+    """One datagram = one command. Sessions are keyed by source address."""
+    name = 'udp'
+
+    def __init__(self, host, port, on_command, on_session_closed=None, on_session_opened=None):
+        super().__init__(on_command, on_session_closed, on_session_opened)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+        GLib.io_add_watch(self.sock.fileno(), GLib.IO_IN, self._on_readable)
+        GLib.timeout_add(1000, self._expire_sessions)
+        logger.info(f"udp: listening on {host}:{port}")
+
+    def _on_readable(self, fd, condition):
+        while True:
+            try:
+                data, peer = self.sock.recvfrom(2048)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                logger.warning(f"udp: receive error: {e}")
+                break
+            session = self.sessions.get(peer)
+            if session is None:
+                session = UdpSession(self, peer)
+                self.add_session(peer, session)
+                logger.info(f"udp: new session {session.id} from {peer}")
+            session.last_seen = time.monotonic()
+            self.on_command(data, session)
+        return True
+
+    def _expire_sessions(self):
+        now = time.monotonic()
+        for session in list(self.sessions.values()):
+            if now - session.last_seen > UDP_SESSION_TIMEOUT_S:
+                self.drop_session(session)
+        return True
+
+
+# --- WebSocket (RFC 6455, server side) ---
+def ws_frame(opcode, payload: bytes) -> bytes:
+    """Unmasked server frame"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def ws_unmask(mask: bytes, payload: bytes) -> bytes:
+    repeated = (mask * (len(payload) // 4 + 1))[:len(payload)]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(len(payload), 'big')
+
+
+class WebSocketSession(Session):
+    def __init__(self, transport, conn, peer):
+        super().__init__(transport, peer)
+        self.conn = conn
+        self.buffer = b''
+        self.outgoing = bytearray()
+        self.write_watch = None
+        self.dropped = 0
+        self.handshaken = False
+        self.fragments = []
+        self.fragment_bytes = 0
+        self.watch = GLib.io_add_watch(conn.fileno(), GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR,
+                                       self._on_readable)
+
+    def send(self, data: bytes, droppable=False):
+        if self.handshaken:
+            self._send_raw(ws_frame(0x2, data), droppable)
+
+    def _send_raw(self, data, droppable=False):
+        """Send what the socket takes now; queue the rest for _on_writable"""
+        if self.watch is None:
+            return
+        if self.outgoing:
+            if droppable and len(self.outgoing) > WS_SEND_BACKLOG:
+                self.dropped += 1
+                return
+            if len(self.outgoing) > WS_SEND_LIMIT:
+                logger.warning(f"ws: {self.peer} stopped reading ({len(self.outgoing)} bytes queued)")
+                self.close()
+                return
+            self.outgoing += data
+            return
+        try:
+            sent = self.conn.send(data)
+        except BlockingIOError:
+            sent = 0
+        except OSError as e:
+            logger.debug(f"ws: send to {self.peer} failed: {e}")
+            self.close()
+            return
+        if sent < len(data):
+            self.outgoing += data[sent:]
+            self.write_watch = GLib.io_add_watch(self.conn.fileno(), GLib.IO_OUT, self._on_writable)
+
+    def _on_writable(self, fd, condition):
+        try:
+            sent = self.conn.send(self.outgoing)
+        except BlockingIOError:
+            return True
+        except OSError as e:
+            logger.debug(f"ws: send to {self.peer} failed: {e}")
+            self.write_watch = None
+            self.close()
+            return False
+        del self.outgoing[:sent]
+        if self.outgoing:
+            return True
+        self.write_watch = None
+        return False
+
+    def close(self):
+        if self.write_watch is not None:
+            GLib.source_remove(self.write_watch)
+            self.write_watch = None
+        if self.watch is not None:
+            GLib.source_remove(self.watch)
+            self.watch = None
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+        super().close()
+
+    def _on_readable(self, fd, condition):
+        try:
+            chunk = self.conn.recv(4096)
+        except BlockingIOError:
+            return True
+        except OSError:
+            chunk = b''
+        if not chunk:
+            self.watch = None
+            self.close()
+            return False
+        self.buffer += chunk
+        self.last_seen = time.monotonic()
+        if not self.handshaken and not self._handshake():
+            return self.watch is not None
+        while self.watch is not None and self._next_frame():
+            pass
+        return self.watch is not None
+
+    def _handshake(self):
+        end = self.buffer.find(b'\r\n\r\n')
+        if end < 0:
+            if len(self.buffer) > 8192:
+                self.close()
+            return False
+        request, self.buffer = self.buffer[:end].decode('latin-1'), self.buffer[end + 4:]
+        headers = {}
+        for line in request.split('\r\n')[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        key = headers.get('sec-websocket-key')
+        if not key:
+            self._send_raw(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+            self.close()
+            return False
+        accept = base64.b64encode(hashlib.sha1(key.encode('ascii') + WS_GUID).digest()).decode('ascii')
+        self._send_raw(('HTTP/1.1 101 Switching Protocols\r\n'
+                        'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+                        f'Sec-WebSocket-Accept: {accept}\r\n\r\n').encode('ascii'))
+        self.handshaken = True
+        logger.info(f"ws: new session {self.id} from {self.peer}")
+        return True
+
+    def _next_frame(self):
+        """Parse one frame from the buffer. Returns False when more data is needed."""
+        buf = self.buffer
+        if len(buf) < 2:
+            return False
+        fin, opcode = buf[0] & 0x80, buf[0] & 0x0F
+        masked, length = buf[1] & 0x80, buf[1] & 0x7F
+        pos = 2
+        if length == 126:
+            if len(buf) < 4:
+                return False
+            length = struct.unpack_from('!H', buf, 2)[0]
+            pos = 4
+        elif length == 127:
+            if len(buf) < 10:
+                return False
+            length = struct.unpack_from('!Q', buf, 2)[0]
+            pos = 10
+        if length > WS_MAX_MESSAGE or not masked:
+            # clients must mask; oversize messages are not commands
+            return self._fail(1002)
+        if len(buf) < pos + 4 + length:
+            return False
+        mask = buf[pos:pos + 4]
+        payload = ws_unmask(mask, buf[pos + 4:pos + 4 + length])
+        self.buffer = buf[pos + 4 + length:]
+
+        if opcode == 0x8:                       # close
+            self._send_raw(ws_frame(0x8, payload[:2]))
+            self.close()
+            return False
+        if opcode == 0x9:                       # ping
+            self._send_raw(ws_frame(0xA, payload))
+        elif opcode in (0x0, 0x1, 0x2):         # continuation, text, binary
+            if (opcode == 0x0) != bool(self.fragments):
+                # a continuation needs a message in progress, a new message must not interrupt one
+                return self._fail(1002)
+            self.fragment_bytes += len(payload)
+            if self.fragment_bytes > WS_MAX_MESSAGE:
+                return self._fail(1009)
+            self.fragments.append(payload)
+            if fin:
+                message = b''.join(self.fragments)
+                self.fragments = []
+                self.fragment_bytes = 0
+                self.transport.on_command(message, self)
+        return True
+
+    def _fail(self, code):
+        """Close the connection with status `code`; returns False for _next_frame"""
+        self._send_raw(ws_frame(0x8, struct.pack('!H', code)))
+        self.close()
+        return False
+
+
+class WebSocketTransport(Transport):
+    """One WebSocket message = one command"""
+    name = 'ws'
+
+    def __init__(self, host, port, on_command, on_session_closed=None, on_session_opened=None):
+        super().__init__(on_command, on_session_closed, on_session_opened)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(4)
+        self.sock.setblocking(False)
+        GLib.io_add_watch(self.sock.fileno(), GLib.IO_IN, self._on_accept)
+        logger.info(f"ws: listening on {host}:{port}")
+
+    def broadcast(self, data: bytes, droppable=False):
+        frame = ws_frame(0x2, data)
+        for session in list(self.sessions.values()):
+            if session.handshaken:
+                session._send_raw(frame, droppable)
+
+    def _on_accept(self, fd, condition):
+        try:
+            conn, peer = self.sock.accept()
+        except OSError:
+            return True
+        conn.setblocking(False)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.add_session(peer, WebSocketSession(self, conn, peer))
+        return True